@@ -0,0 +1,3 @@
+'''
+Benchmarks for mini_git, run each module with `python -m benchmarks.<name>`
+'''
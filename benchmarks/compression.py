@@ -0,0 +1,100 @@
+'''
+Compares compression settings for stored objects
+
+Reports bytes on disk and average load latency for every codec/level.
+
+Usage:
+    python -m benchmarks.compression [--files N] [--size BYTES] [--repeat N]
+'''
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from mini_git import Repository, Tree, Blob
+from mini_git.compression import zstandard
+
+
+WORDS = ("def", "class", "return", "self", "import", "value", "path", "tree", "blob",
+         "commit", "for", "in", "if", "else", "None", "True", "data", "index", "sha")
+
+
+def settings_to_test() -> list[tuple[str, int]]:
+    #zstd is optional, only benchmark it when it's installed
+    settings = [("none", 0), ("zlib", 1), ("zlib", 6), ("zlib", 9)]
+    if zstandard is not None:
+        settings += [("zstd", 1), ("zstd", 3), ("zstd", 19)]
+    return settings
+
+
+def make_corpus(dir_path: str, files: int, size: int, seed: int = 0) -> None:
+    '''
+    Writes source-like text files, plus a few incompressible ones
+    '''
+    rng = random.Random(seed)
+    for i in range(files):
+        path = os.path.join(dir_path, f"file_{i}.txt")
+        if i % 10 == 9:
+            data = rng.randbytes(size)
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(size // 4))
+            data = text.encode("ascii")[:size]
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def bytes_on_disk(dir_path: str) -> int:
+    total = 0
+    for root, _, names in os.walk(os.path.join(dir_path, ".minigit", "objects")):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+
+def run_setting(codec: str, level: int, files: int, size: int, repeat: int) -> dict:
+    work = tempfile.mkdtemp(prefix="minigit_bench_")
+    try:
+        repo = Repository(work, compression=codec, compression_level=level)
+        make_corpus(work, files, size)
+
+        start = time.perf_counter()
+        tree_sha = Tree(work).store(store=repo.store)
+        store_seconds = time.perf_counter() - start
+
+        blob_ids = [sha for kind, _, sha in Tree.load(tree_sha, repo.store).children if kind == "blob"]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for sha in blob_ids:
+                Blob.load(sha, repo.store)
+        load_seconds = time.perf_counter() - start
+
+        return {
+            "codec": codec,
+            "level": level,
+            "bytes_on_disk": bytes_on_disk(repo.dir_path),
+            "store_seconds": round(store_seconds, 6),
+            "load_latency_us": round(load_seconds / (repeat * len(blob_ids)) * 1e6, 2),
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main(argv=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=16_384)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = [run_setting(codec, level, args.files, args.size, args.repeat)
+               for codec, level in settings_to_test()]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return results
+
+
+if __name__ == "__main__":
+    main()
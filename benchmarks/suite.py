@@ -0,0 +1,207 @@
+'''
+Times and measures the memory of the main repo operations on a synthetic repo
+
+Each phase is timed on one freshly generated repo and its peak allocations are traced
+on a second, identical one, so tracemalloc's overhead never shows up in the timings.
+The load phases read every blob at HEAD, first with an empty object cache (cold) and
+then again with it filled (warm).
+
+Results are printed (or written) as JSON, pass an earlier result with --compare to
+get the time each phase took relative to it.
+
+Usage:
+    python -m benchmarks.suite [--files N] [--depth N] [--fanout N] [--sizes SPEC]
+                               [--commits N] [--changes N] [--seed N] [--repeat N]
+                               [--output FILE] [--compare FILE]
+'''
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import subprocess
+
+import mini_git
+from mini_git import Repository, Tree
+
+from benchmarks.synthetic import make_tree, edit_tree
+
+
+PHASES = ("add", "commit", "history", "add_unchanged", "status", "log", "diff", "load_cold", "load_warm")
+
+
+def _measure(results: dict, name: str, trace: bool, fn, **extra):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = fn()
+    entry = {"seconds": round(time.perf_counter() - start, 6), **extra}
+    if trace:
+        entry["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    results[name] = entry
+    return value
+
+
+def _blob_ids(repo: Repository, tree_sha: str) -> list[str]:
+    ids = []
+    stack = [tree_sha]
+    while stack:
+        for entry_type, _, sha in Tree.load(stack.pop(), repo.store).children:
+            (stack if entry_type == "tree" else ids).append(sha)
+    return ids
+
+
+def run_once(work: str, params: dict, trace: bool = False) -> dict:
+    '''
+    Runs every phase once on a new repo in work
+
+    Returns:
+        phase -> {"seconds", plus "peak_bytes" when tracing, plus phase details}
+    '''
+    results = {}
+    repo = Repository(work)
+    paths = make_tree(work, params["files"], params["depth"], params["fanout"], params["sizes"], params["seed"])
+
+    _measure(results, "add", trace, lambda: repo.add("."), files=len(paths))
+    first = _measure(results, "commit", trace, lambda: repo.commit("bench", "commit 0"))
+
+    #Edits aren't timed, only the add and commit that record them
+    rng = random.Random(params["seed"] + 1)
+    last = first
+    history = {"seconds": 0.0, "commits": params["commits"] - 1}
+    for i in range(1, params["commits"]):
+        edit_tree(work, paths, params["changes"], rng, params["sizes"], params["depth"], params["fanout"])
+        step = {}
+        last = _measure(step, "step", trace, lambda: (repo.add("."), repo.commit("bench", f"commit {i}"))[1])
+        history["seconds"] += step["step"]["seconds"]
+        if trace:
+            history["peak_bytes"] = max(history.get("peak_bytes", 0), step["step"]["peak_bytes"])
+    history["seconds"] = round(history["seconds"], 6)
+    results["history"] = history
+
+    _measure(results, "add_unchanged", trace, lambda: repo.add("."))
+    _measure(results, "status", trace, lambda: repo.status())
+    commits = _measure(results, "log", trace, lambda: len(repo.log()))
+    results["log"]["commits"] = commits
+
+    def diff():
+        changes = repo.diff(first, last)
+        return len(changes), sum(len(list(change.hunks())) for change in changes)
+    changed, hunks = _measure(results, "diff", trace, diff)
+    results["diff"].update(files=changed, hunks=hunks)
+
+    blob_ids = _blob_ids(repo, repo.read_commit(last).tree_sha)
+    repo.cache.clear()
+    for name in ("load_cold", "load_warm"):
+        _measure(results, name, trace, lambda: [repo.read_object(sha) for sha in blob_ids], objects=len(blob_ids))
+
+    repo._close_commit_graph()
+    return results
+
+
+def run(params: dict, repeat: int = 1) -> dict:
+    '''
+    Runs the suite, keeping each phase's fastest time and its traced peak memory
+
+    Returns:
+        The JSON-ready report
+    '''
+    timings = []
+    for _ in range(repeat):
+        timings.append(_in_temp_dir(lambda work: run_once(work, params)))
+    traced = _in_temp_dir(lambda work: run_once(work, params, trace=True))
+
+    results = {}
+    for phase in PHASES:
+        fastest = min((timing[phase] for timing in timings), key=lambda entry: entry["seconds"])
+        results[phase] = {**fastest, "peak_bytes": traced[phase].get("peak_bytes")}
+
+    return {
+        "suite": "mini_git",
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "params": {**params, "repeat": repeat},
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> dict:
+    '''
+    Returns phase -> new time / old time, for phases in both reports
+    '''
+    ratios = {}
+    for phase, entry in new["results"].items():
+        before = old.get("results", {}).get(phase)
+        if before and before["seconds"]:
+            ratios[phase] = round(entry["seconds"] / before["seconds"], 3)
+    return ratios
+
+
+def _in_temp_dir(fn):
+    work = tempfile.mkdtemp(prefix="minigit_bench_")
+    try:
+        return fn(work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _revision():
+    #The commit of the mini_git being measured, when it's a git checkout
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(mini_git.__file__),
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--sizes", default="lognormal:4096")
+    parser.add_argument("--commits", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=None, help="files edited per commit, 1%% by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    params = {
+        "files": args.files,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "sizes": args.sizes,
+        "commits": max(1, args.commits),
+        "changes": args.changes if args.changes is not None else max(1, args.files // 100),
+        "seed": args.seed,
+    }
+    report = run(params, max(1, args.repeat))
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old = json.load(f)
+            report["compared_to"] = {"revision": old.get("revision"), "ratios": compare(old, report)}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return report
+
+
+if __name__ == "__main__":
+    main()
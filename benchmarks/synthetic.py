@@ -0,0 +1,142 @@
+'''
+Reproducible synthetic repos for the benchmarks
+
+Everything is drawn from one seeded random.Random, so the same settings always give the
+same files, the same edits and the same trees.
+
+Size distributions are given as strings:
+    "fixed:N"           every file is N bytes
+    "uniform:LOW-HIGH"  evenly spread between LOW and HIGH bytes
+    "lognormal:MEDIAN"  mostly small files with a long tail, like real source trees
+
+Contains:
+    - size_sampler(), make_tree(), edit_tree(), generate_repo()
+'''
+import os
+import math
+import random
+
+from mini_git import Repository
+
+
+WORDS = ("def", "class", "return", "self", "import", "value", "path", "tree", "blob",
+         "commit", "for", "in", "if", "else", "None", "True", "data", "index", "sha")
+
+
+def size_sampler(spec: str, rng: random.Random):
+    '''
+    Returns a function drawing file sizes from a distribution spec
+
+    Raises:
+        ValueError: if the spec isn't one of the forms above
+    '''
+    kind, _, value = spec.partition(":")
+    try:
+        if kind == "fixed":
+            size = int(value)
+            return lambda: size
+        if kind == "uniform":
+            low, high = (int(part) for part in value.split("-"))
+            return lambda: rng.randint(low, high)
+        if kind == "lognormal":
+            mu = math.log(int(value))
+            #Capped so one unlucky draw can't dominate a run
+            return lambda: min(int(rng.lognormvariate(mu, 1.0)), 64 * int(value))
+    except ValueError:
+        pass
+    raise ValueError(f"Unknown size distribution: {spec}")
+
+
+def _content(rng: random.Random, size: int) -> bytes:
+    #Source-like text, so compression and deltas behave as they would on real code
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if rng.random() < 0.1:
+            words.append("\n")
+    return " ".join(words).encode("ascii")[:size]
+
+
+def _file_path(rng: random.Random, i: int, depth: int, fanout: int) -> str:
+    parts = [f"dir_{rng.randrange(fanout)}" for _ in range(rng.randint(0, depth))]
+    return os.path.join(*parts, f"file_{i}.txt")
+
+
+def make_tree(dir_path: str, files: int, depth: int = 3, fanout: int = 8,
+              sizes: str = "lognormal:4096", seed: int = 0) -> list[str]:
+    '''
+    Writes a working tree of text files
+
+    Args:
+        dir_path: where the files go
+        files: how many files
+        depth: deepest directory nesting
+        fanout: directories to choose from at each level
+        sizes: file size distribution spec
+        seed: seed for everything random
+
+    Returns:
+        The relative paths written, in order
+    '''
+    rng = random.Random(seed)
+    sample = size_sampler(sizes, rng)
+    paths = []
+    for i in range(files):
+        relative_path = _file_path(rng, i, depth, fanout)
+        _write(dir_path, relative_path, _content(rng, sample()))
+        paths.append(relative_path)
+    return paths
+
+
+def edit_tree(dir_path: str, paths: list[str], changes: int, rng: random.Random,
+              sizes: str = "lognormal:4096", depth: int = 3, fanout: int = 8) -> None:
+    '''
+    Applies one commit's worth of churn: edits some files, appends to others, adds one
+    '''
+    sample = size_sampler(sizes, rng)
+    for relative_path in rng.sample(paths, min(changes, len(paths))):
+        full_path = os.path.join(dir_path, relative_path)
+        if rng.random() < 0.5:
+            with open(full_path, "ab") as f:
+                f.write(b"\n" + _content(rng, 64))
+        else:
+            _write(dir_path, relative_path, _content(rng, sample()))
+    relative_path = _file_path(rng, len(paths), depth, fanout)
+    _write(dir_path, relative_path, _content(rng, sample()))
+    paths.append(relative_path)
+
+
+def _write(dir_path: str, relative_path: str, data: bytes) -> None:
+    full_path = os.path.join(dir_path, relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as f:
+        f.write(data)
+
+
+def generate_repo(dir_path: str, files: int = 1000, depth: int = 3, fanout: int = 8,
+                  sizes: str = "lognormal:4096", commits: int = 10, changes: int = None,
+                  seed: int = 0) -> tuple[Repository, list[str]]:
+    '''
+    Builds a repo with a history of commits
+
+    The first commit holds the whole tree, each later one edits `changes` files
+    (1% of them by default) and adds one.
+
+    Returns:
+        (the Repository, commit shas oldest first)
+    '''
+    repo = Repository(dir_path)
+    paths = make_tree(dir_path, files, depth, fanout, sizes, seed)
+    rng = random.Random(seed + 1)
+    changes = changes if changes is not None else max(1, files // 100)
+
+    shas = []
+    for i in range(commits):
+        if i:
+            edit_tree(dir_path, paths, changes, rng, sizes, depth, fanout)
+        repo.add(".")
+        shas.append(repo.commit("bench", f"commit {i}"))
+    return repo, shas
@@ -1,6 +1,8 @@
 from .repository import Repository
+from .async_repository import AsyncRepository
 from .blob import Blob
-from .tree import Tree
+from .tree import Tree, TreeChildren
 from .commit import Commit
+from .name_index import AmbiguousObjectName
 
 from .utils import decode_sha_to_path, validate_directory, validate_file, create_obj_id, make_header
\ No newline at end of file
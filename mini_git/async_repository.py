@@ -0,0 +1,180 @@
+'''
+Asyncio facade over Repository
+
+Every call runs on a bounded thread pool so the event loop never blocks on file I/O.
+A semaphore caps how many calls are on the pool or waiting for it at once, so a flood of
+requests queues up instead of opening thousands of files. Reads that arrive in the same
+loop iteration are coalesced into one job on the pool.
+
+Contains:
+    - AsyncRepository
+'''
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git.repository import Repository
+
+
+class AsyncRepository:
+    '''
+    Awaitable version of Repository, for use from async code
+
+    Writes to the index (add, commit) run one at a time, reads run concurrently.
+
+    Init
+    ----
+    :dir_path(str): the repo's directory, opened (or created) as Repository does
+    :max_workers(int): threads in the pool the I/O runs on
+    :max_concurrency(int): calls allowed in flight at once, the rest wait their turn
+    :executor: an existing executor to share instead of making a pool
+    :repo_kwargs: passed on to Repository (compression, cache_bytes...)
+    '''
+
+    def __init__(self, dir_path: str, max_workers: int = 4, max_concurrency: int = 64, executor=None, **repo_kwargs):
+        if max_workers < 1 or max_concurrency < 1:
+            raise ValueError("max_workers and max_concurrency must be at least 1")
+        self.repo = Repository(dir_path, **repo_kwargs)
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mini_git")
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._write_lock = asyncio.Lock()
+        #object_id -> future, reads waiting for the next batched job
+        self._pending_reads = {}
+        self._flush_scheduled = False
+        #The loop only keeps weak references to tasks, in-flight batch reads are held here
+        self._tasks = set()
+
+    async def __aenter__(self) -> "AsyncRepository":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        '''
+        Shuts down the pool, if this facade made it
+        '''
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    async def _run(self, fn, *args, **kwargs):
+        #Runs a blocking call on the pool, waiting for a slot first
+        async with self._limit:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def add(self, path: str, workers: int = None, executor: str = "thread") -> str:
+        '''
+        Awaitable Repository.add()
+        '''
+        async with self._write_lock:
+            return await self._run(self.repo.add, path, workers, executor)
+
+    async def commit(self, author: str, msg: str) -> str:
+        '''
+        Awaitable Repository.commit(), the message is required since nothing can prompt for it
+        '''
+        if not msg:
+            raise ValueError("A commit message is required")
+        async with self._write_lock:
+            return await self._run(self.repo.commit, author, msg)
+
+    async def head_sha(self):
+        return await self._run(self.repo.head_sha)
+
+    async def read_commit(self, obj_id: str):
+        '''
+        Awaitable Repository.read_commit()
+        '''
+        return await self._run(self.repo.read_commit, obj_id)
+
+    async def read_object(self, obj_id: str):
+        '''
+        Awaitable Repository.read_object()
+
+        Reads requested in the same loop iteration share one job on the pool, and
+        the same object asked for twice is only read once.
+        '''
+        future = self._pending_reads.get(obj_id)
+        if future is None:
+            future = self._pending_reads[obj_id] = asyncio.get_running_loop().create_future()
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                asyncio.get_running_loop().call_soon(self._flush_reads)
+        #Shielded, one caller being cancelled mustn't cancel the read for the others
+        return await asyncio.shield(future)
+
+    def _flush_reads(self) -> None:
+        pending, self._pending_reads = self._pending_reads, {}
+        self._flush_scheduled = False
+        task = asyncio.get_running_loop().create_task(self._read_batch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read_batch(self, pending: dict) -> None:
+        try:
+            results = await self._run(self._read_many, list(pending))
+        except BaseException as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for obj_id, (obj, error) in results.items():
+            future = pending[obj_id]
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(obj)
+
+    def _read_many(self, obj_ids: list) -> dict:
+        #Runs on the pool, one failed read doesn't fail the rest
+        results = {}
+        for obj_id in obj_ids:
+            try:
+                results[obj_id] = (self.repo.read_object(obj_id), None)
+            except Exception as e:
+                results[obj_id] = (None, e)
+        return results
+
+    async def read_objects(self, obj_ids: list) -> list:
+        '''
+        Reads many objects in one batch, returned in the order asked for
+        '''
+        return list(await asyncio.gather(*(self.read_object(obj_id) for obj_id in obj_ids)))
+
+    async def log(self, n: int = None, page_size: int = 32, **filters):
+        '''
+        Async version of Repository.iter_log(), yields CommitRecords newest first
+
+        Commits are read a page at a time on the pool, only as they're iterated. The
+        pages all come from the commit-graph the first one was read from, so an add or
+        commit awaited between pages doesn't disturb the walk.
+
+        Args:
+            n: stop after this many commits
+            page_size: commits read per job on the pool
+            filters: skip, since, until, start and path, as iter_log() takes them
+        '''
+        records = self.repo.iter_log(limit=n, **filters)
+        while True:
+            page = await self._run(_take, records, page_size)
+            for record in page:
+                yield record
+            if len(page) < page_size:
+                return
+
+
+def _take(iterator, count: int) -> list:
+    #Pulls up to count items from an iterator
+    items = []
+    for item in iterator:
+        items.append(item)
+        if len(items) >= count:
+            break
+    return items
@@ -0,0 +1,206 @@
+'''
+Batched, atomic object writes
+
+Every object is written to a temp file in the objects directory and only renamed into
+place once complete, so a crash never leaves a half-written object under its real name.
+
+Inside an ObjectStore.batch() nothing is installed until the batch ends. A durable batch
+of at least PACK_THRESHOLD objects is written out as one pack, so the whole batch costs
+the same few fsyncs (the pack, its index and their directories) however many objects it
+holds. Smaller batches are renamed into place as loose objects: fan-out dirs are created
+once per batch, every temp file is fsynced before any rename, and each directory the
+renames touched is fsynced once afterwards.
+
+Contains:
+    - WriteBatch, new_temp_object(), install_object()
+'''
+import os
+import tempfile
+import threading
+
+from mini_git import instrument
+from mini_git.utils import fsync_dir, read_object_file, read_object_header
+from mini_git.pack import write_pack
+from mini_git.name_index import append_names
+
+
+#Durable batches of at least this many objects are installed as a single pack
+PACK_THRESHOLD = 32
+
+
+class WriteBatch:
+    '''
+    Collects finished temp objects and installs them all at once
+
+    Init
+    ----
+    :objects_path(str): the objects directory the batch installs into
+    :durable(bool): flush the data to disk before anything is installed
+    :packs(PackSet): the store's open packs, rescanned once a batch is packed
+    '''
+
+    def __init__(self, objects_path: str, durable: bool = True, packs=None):
+        self.objects_path = objects_path
+        self.durable = durable
+        self.packs = packs
+        #object_id -> temp path, readable before the batch ends
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, object_id: str) -> bool:
+        return object_id in self.pending
+
+    def add(self, object_id: str, tmp_path: str) -> None:
+        '''
+        Takes ownership of a finished temp object, dropping duplicates
+        '''
+        with self._lock:
+            if object_id not in self.pending:
+                self.pending[object_id] = tmp_path
+                return
+        os.remove(tmp_path)
+
+    def adopt(self, pending: dict) -> None:
+        '''
+        Takes ownership of temp objects written by another process, object_id -> temp path
+        '''
+        for object_id, tmp_path in pending.items():
+            self.add(object_id, tmp_path)
+
+    @instrument.instrumented("install")
+    def commit(self) -> int:
+        '''
+        Flushes and installs every pending object, as one pack when the batch is big enough
+
+        Returns:
+            how many objects were installed
+        '''
+        #Pending objects stay readable from their temp files until they're installed
+        with self._lock:
+            pending = dict(self.pending)
+        if not pending:
+            return 0
+
+        packed = self.durable and len(pending) >= PACK_THRESHOLD
+        if packed:
+            self._commit_pack(pending)
+        else:
+            self._commit_loose(pending)
+
+        with self._lock:
+            for object_id in pending:
+                self.pending.pop(object_id, None)
+        if packed:
+            #Readers that looked the temp file up just now find it in the pack instead
+            for tmp_path in pending.values():
+                os.remove(tmp_path)
+        return len(pending)
+
+    def _commit_pack(self, pending: dict) -> None:
+        #One pack file and its index, flushed together, then their two directories
+        pack_dir = os.path.join(self.objects_path, "pack")
+        objects = [(object_id, *read_object_header(tmp_path)) for object_id, tmp_path in pending.items()]
+
+        def read_body(object_id):
+            content = read_object_file(pending[object_id])
+            return content[content.index(b"\0") + 1:]
+
+        #No delta search, that's left for repack()
+        write_pack(pack_dir, objects, read_body, window=0, sync=_barrier)
+        _sync_dirs((pack_dir, self.objects_path))
+        if self.packs is not None:
+            self.packs.get(refresh=True)
+
+    def _commit_loose(self, pending: dict) -> None:
+        if self.durable:
+            _barrier(list(pending.values()))
+
+        made_dirs = set()
+        for object_id, tmp_path in pending.items():
+            folder_path = os.path.join(self.objects_path, object_id[:2])
+            if folder_path not in made_dirs:
+                os.makedirs(folder_path, exist_ok=True)
+                instrument.count("syscalls.mkdir")
+                made_dirs.add(folder_path)
+            _install(tmp_path, os.path.join(folder_path, object_id[2:]))
+        if self.durable:
+            #The renames, and any new fan-out dirs, only survive a crash once their parents are synced
+            _sync_dirs(made_dirs | {self.objects_path})
+        #One journal append for the whole batch, so short shas resolve to them
+        append_names(self.objects_path, pending)
+        instrument.count("syscalls.append")
+
+    def abort(self) -> None:
+        '''
+        Throws away every pending object
+        '''
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        for tmp_path in pending.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@instrument.instrumented("sync")
+def _barrier(paths: list) -> None:
+    #Only this batch's files, a global sync would flush every other repo on the host too
+    for path in paths:
+        with open(path, "rb+") as f:
+            os.fsync(f.fileno())
+    instrument.count("syscalls.fsync", len(paths))
+
+
+@instrument.instrumented("sync")
+def _sync_dirs(dir_paths) -> None:
+    for dir_path in dir_paths:
+        fsync_dir(dir_path)
+
+
+def _install(tmp_path: str, final_path: str) -> None:
+    #Objects are content addressed, an existing copy is already correct
+    instrument.count("syscalls.stat")
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return
+    instrument.count("syscalls.rename")
+    try:
+        os.replace(tmp_path, final_path)
+    except FileNotFoundError:
+        #A gc may have removed the fan-out dir once it was empty, make it again
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+
+
+def new_temp_object(objects_path: str):
+    '''
+    Opens a new temp file for an object, returns (file object, temp path)
+    '''
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=objects_path)
+        instrument.count("syscalls.open")
+    except FileNotFoundError:
+        #Only the very first object of a repo needs the dir made
+        os.makedirs(objects_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=objects_path)
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+@instrument.instrumented("install")
+def install_object(objects_path: str, object_id: str, tmp_path: str, durable: bool = False) -> None:
+    '''
+    Renames a finished temp object to its place under the fan-out dir
+
+    :durable: fsync the directories after the rename, the caller has fsynced the file
+    '''
+    folder_path = os.path.join(objects_path, object_id[:2])
+    instrument.count("syscalls.stat")
+    made_dir = not os.path.isdir(folder_path)
+    if made_dir:
+        os.makedirs(folder_path, exist_ok=True)
+        instrument.count("syscalls.mkdir")
+    _install(tmp_path, os.path.join(folder_path, object_id[2:]))
+    if durable:
+        #The objects dir only changed if the fan-out dir is new
+        _sync_dirs((folder_path, objects_path) if made_dir else (folder_path,))
+    append_names(objects_path, [object_id])
+    instrument.count("syscalls.append")
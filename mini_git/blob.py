@@ -1,6 +1,8 @@
 import os
 
-from mini_git.utils import validate_file, make_header, create_obj_id, write_to_disk, decode_sha_to_path
+from mini_git.utils import make_header_from_size
+from mini_git.object_store import ObjectStore, default_store
+from mini_git.chunking import store_chunked, parse_manifest
 
 '''
 Blob hashing system
@@ -15,62 +17,97 @@ class Blob:
         
         self.object_id = None
         self.data = None
+        #Only set on blobs loaded from a manifest, [(chunk sha, size), ...]
+        self.chunks = None
         
     #Used to store new blobs
-    def store(self) -> str:
+    def store(self, store: ObjectStore = None) -> str:
         '''
         Store a file as a blob
 
+        :store: the repo's ObjectStore, found from the file's location when not given
+
         Returns
         --------
         Blob object_id (*str*)
         '''
-        #Validates the file
-        validate_file(self.file_path)
+        store = store or ObjectStore.for_path(self.file_path)
+        size = os.path.getsize(self.file_path)
 
-        #Reads the data and sets it to the blob-object
-        self.data = self._read_data(self.file_path)
+        if store.chunk_threshold and size >= store.chunk_threshold:
+            #Split where the content says, so a new version only stores the chunks it changed
+            self.object_id = store_chunked(store, self.file_path)
+        else:
+            #Hashes and writes the file in chunks, so memory stays flat for large files
+            self.object_id = store.write_stream("blob", self.file_path)
 
-        self.header = make_header("blob", self.data)
-        
-        self.object_id = create_obj_id(self.header, self.data)
+        #Data is never held in memory while storing, use load() to read it back
+        self.header = make_header_from_size("blob", size)
 
         #Creating the folder and filename for use later
         self.folder, self.file_name = self.object_id[:2], self.object_id[2:]
 
-        BASE_DIR = os.getenv("BASE_DIR", os.getcwd())
-
-        write_to_disk(BASE_DIR, self.object_id, self.header + self.data)
-
         #returns the object_id, for access
         return self.object_id
 
-    def _read_data(self, file_path: str) -> bytes:
-        #Reads the file and returns it as bytes
-        with open(file_path, "rb") as f:
-            data = f.read()
-        return data
+    @property
+    def data(self) -> bytes:
+        #A chunked blob is only put together when its bytes are asked for, and never kept
+        if self._data is None and self.chunks is not None:
+            return b"".join(self.iter_data())
+        return self._data
+
+    @data.setter
+    def data(self, value: bytes) -> None:
+        self._data = value
+
+    def iter_data(self):
+        '''
+        Yields the blob's content in pieces, a chunked blob one chunk at a time
+        '''
+        if self.chunks is None:
+            yield self._data
+            return
+        for chunk_id, _ in self.chunks:
+            yield from self._store.iter_body(chunk_id)
+
 
 
+    @classmethod
+    def load(cls, object_id: str, store: ObjectStore = None) -> "Blob":
+        #Goes through the repo's object cache, only reading from disk on a miss
+        return (store or default_store()).load(object_id, cls, cls._parse)
 
     @classmethod
-    def load(cls, object_id: str) -> "Blob":
-        #Decode to path
-        path = decode_sha_to_path(object_id)
+    def open(cls, object_id: str, store: ObjectStore = None):
+        '''
+        Opens a blob's content as a read-only file object, without loading it or caching it
 
-        #Validate path exists
-        validate_file(path)
+        For serving large blobs: with compression = "none" the object is memory-mapped
+        and getbuffer() is a zero-copy memoryview of it, otherwise it's inflated as it's
+        read. Close it (or use it in a with block) when done.
 
-        #Reads the given path
-        with open(path, "rb") as open_blob:
-            content = open_blob.read()
+        Raises:
+            FileNotFoundError: if the object doesn't exist
+            ValueError: if the object isn't a blob
+        '''
+        body = (store or default_store()).open_body(object_id)
+        if body.type not in ("blob", "manifest"):
+            body.close()
+            raise ValueError(f"Expected blob, got {body.type}")
+        return body
+
+    @classmethod
+    def _parse(cls, object_id: str, content: bytes, store: ObjectStore = None) -> "Blob":
+        #Decode to path
+        path = (store or default_store()).path_for(object_id)
 
         #locates the first break point char that was saved in the header
         index = content.find(b'\0')
         #Decoding into a raw-header to preserve byte-form
         raw_header = content[:index+1]
         header, character_length = raw_header[:-1].decode().split()
-        assert header == "blob", f"Expected blob, got {header}"
+        assert header in ("blob", "manifest"), f"Expected blob, got {header}"
 
         #simple match-case to determine where to go, will update later
         body = content[index+1:index+int(character_length)+1]
@@ -78,7 +115,14 @@ class Blob:
         assert int(character_length) == len(body), f"Body is not {character_length} long, failure"
 
         new = cls.__new__(cls)
-        new.data = body
+        new.chunks = None
+        new._store = store or default_store()
+        if header == "manifest":
+            #Only the list of chunks is kept (and cached), the content is read on demand
+            new.chunks = parse_manifest(body)
+            new.data = None
+        else:
+            new.data = body
         new.header = header
         new.object_id = object_id
         new.path = path
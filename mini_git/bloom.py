@@ -0,0 +1,203 @@
+'''
+Changed-path Bloom filters for my mini-git
+
+Every commit gets a small Bloom filter of the paths it changed against its first
+parent, leading directories included, so "src/api/views.py" adds "src", "src/api" and
+"src/api/views.py". A path missing from the filter was certainly not touched, and
+path-limited log skips that commit without loading a tree. Only "maybe" answers are
+checked against the trees.
+
+The filters live in a side file next to the commit-graph, objects/info/changed-paths:
+    b"MCPF" | version (u32) | commit count (u32)
+    fanout: 256 x u32, entry i = number of commits whose first byte is <= i
+    names: count x 32-byte raw sha, sorted
+    ends: count x u32, where each commit's filter ends in the data
+    data: the filters back to back
+    trailer: sha256 of everything above
+
+An empty filter stands for a commit that changed more than MAX_PATHS paths, it always
+answers "maybe".
+
+New filters go to a small tail file with the same layout, objects/info/changed-paths-tail,
+so a commit never rewrites every filter. Once the tail holds TAIL_FILTERS filters, the
+next commit merges it into the main file.
+
+Contains:
+    - changed_paths(), make_filter(), might_contain()
+    - write_bloom_file(), BloomFile
+'''
+import os
+import struct
+import hashlib
+import tempfile
+
+from mini_git.utils import build_fanout, fanout_search
+
+
+MAGIC = b"MCPF"
+VERSION = 1
+HEADER = struct.Struct(">4sII")
+FANOUT = struct.Struct(">256I")
+SHA_LEN = 32
+
+#About 1% false positives
+BITS_PER_PATH = 10
+NUM_HASHES = 7
+#Past this a filter would say "maybe" to nearly everything anyway
+MAX_PATHS = 512
+#Filters the tail holds before it's merged into the main file, bounds what a commit rewrites
+TAIL_FILTERS = 256
+_HASH_PAIR = struct.Struct(">II")
+
+
+def changed_paths(paths) -> set:
+    '''
+    Returns the "/"-separated paths plus every directory leading to them
+    '''
+    found = set()
+    for path in paths:
+        parts = path.split("/")
+        for i in range(1, len(parts) + 1):
+            found.add("/".join(parts[:i]))
+    return found
+
+
+def _positions(path: str, bits: int):
+    #Double hashing, h2 is kept odd so the probes never collapse onto one bit
+    h1, h2 = _HASH_PAIR.unpack(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest())
+    h2 |= 1
+    return [(h1 + i * h2) % bits for i in range(NUM_HASHES)]
+
+
+def make_filter(paths) -> bytes:
+    '''
+    Returns the filter for a commit that changed the given paths
+
+    Args:
+        paths: "/"-separated changed paths, their leading directories are added here
+    '''
+    keys = changed_paths(paths)
+    if len(keys) > MAX_PATHS:
+        return b""
+    size = max(8, (len(keys) * BITS_PER_PATH + 7) // 8)
+    bits = bytearray(size)
+    for key in keys:
+        for pos in _positions(key, size * 8):
+            bits[pos >> 3] |= 1 << (pos & 7)
+    return bytes(bits)
+
+
+def might_contain(bloom: bytes, path: str) -> bool:
+    '''
+    False only if the commit behind the filter certainly didn't change path
+    '''
+    if not bloom:
+        return True
+    return all(bloom[pos >> 3] & (1 << (pos & 7)) for pos in _positions(path, len(bloom) * 8))
+
+
+def write_bloom_file(bloom_path: str, filters: dict) -> None:
+    '''
+    Writes the side file holding the given filters
+
+    Args:
+        bloom_path(str): where the file is written
+        filters: commit id -> filter bytes from make_filter()
+    '''
+    names = sorted(filters)
+
+    ends = []
+    end = 0
+    for object_id in names:
+        end += len(filters[object_id])
+        ends.append(end)
+
+    raw_names = [bytes.fromhex(object_id) for object_id in names]
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(names)))
+    data += FANOUT.pack(*build_fanout(raw_names))
+    data += b"".join(raw_names)
+    data += struct.pack(f">{len(names)}I", *ends)
+    for object_id in names:
+        data += filters[object_id]
+    data += hashlib.sha256(data).digest()
+
+    parent_dir = os.path.dirname(bloom_path)
+    os.makedirs(parent_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_bloom_", dir=parent_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, bloom_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class BloomFile:
+    '''
+    The changed-path filters of a repo, read whole (a few bytes a commit)
+
+    Init
+    ----
+    :bloom_path(str): path to the side file
+    :tail_path(str): path to its tail, which may not exist, read as a BloomFile of its own
+    '''
+
+    def __init__(self, bloom_path: str, tail_path: str = None):
+        self.bloom_path = bloom_path
+        self.tail = None
+        if tail_path is not None:
+            try:
+                self.tail = BloomFile(tail_path)
+            except FileNotFoundError:
+                pass
+        with open(bloom_path, "rb") as f:
+            self._data = f.read()
+
+        magic, version, self.count = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a supported changed-paths file: {bloom_path}")
+        self._fanout = FANOUT.unpack_from(self._data, HEADER.size)
+        self._names_at = HEADER.size + FANOUT.size
+        ends_at = self._names_at + self.count * SHA_LEN
+        self._ends = struct.unpack_from(f">{self.count}I", self._data, ends_at)
+        self._filters_at = ends_at + 4 * self.count
+
+    def __len__(self) -> int:
+        if self.tail is None:
+            return self.count
+        #A merge interrupted before the tail was removed leaves commits in both
+        return self.count + sum(1 for object_id in self.tail.filters() if self._position(object_id) < 0)
+
+    def __contains__(self, object_id: str) -> bool:
+        return self.get(object_id) is not None
+
+    def _raw_name(self, pos: int) -> bytes:
+        start = self._names_at + pos * SHA_LEN
+        return self._data[start:start + SHA_LEN]
+
+    def _position(self, object_id: str) -> int:
+        return fanout_search(self._fanout, self._raw_name, bytes.fromhex(object_id))
+
+    def get(self, object_id: str):
+        '''
+        Returns a commit's filter bytes, or None if it has none
+        '''
+        pos = self._position(object_id)
+        if pos < 0:
+            return self.tail.get(object_id) if self.tail is not None else None
+        start = self._ends[pos - 1] if pos else 0
+        return self._data[self._filters_at + start:self._filters_at + self._ends[pos]]
+
+    def filters(self) -> dict:
+        '''
+        Returns every filter, the tail's included, in the form write_bloom_file() takes
+        '''
+        found = {}
+        start = 0
+        for pos, end in enumerate(self._ends):
+            found[self._raw_name(pos).hex()] = self._data[self._filters_at + start:self._filters_at + end]
+            start = end
+        if self.tail is not None:
+            found.update(self.tail.filters())
+        return found
@@ -0,0 +1,248 @@
+'''
+File-like access to object bodies, without reading them into memory
+
+An uncompressed loose object (compression = "none") is memory-mapped, and its body is
+handed out as a memoryview of the mapping, so nothing is copied or allocated however big
+the object is. A compressed one is inflated as it's read, a bounded piece at a time. A
+chunked file is read chunk by chunk. Only the first bytes of a loose object are read
+to parse its header.
+
+Contains:
+    - ObjectBody, BufferBody, InflatingBody, ChunkedBody, open_body()
+'''
+import io
+import mmap
+
+from mini_git.compression import decompressor, detect_codec
+from mini_git.chunking import parse_manifest
+from mini_git.utils import CHUNK_SIZE
+
+
+#Enough for any header ("manifest 18446744073709551615\0" is 30 bytes)
+HEADER_PEEK = 64
+
+
+class ObjectBody(io.RawIOBase):
+    '''
+    Read-only stream over an object's body
+
+    Init
+    ----
+    :obj_type(str): the object's type ("blob", "manifest", ...)
+    :size(int): length of the body, for a chunked file the length of the whole file
+    '''
+
+    def __init__(self, obj_type: str, size: int):
+        super().__init__()
+        self.type = obj_type
+        self.size = size
+
+    def readable(self) -> bool:
+        return True
+
+    def getbuffer(self) -> memoryview:
+        '''
+        Returns the whole body as a memoryview, only for bodies already in memory or mapped
+
+        Raises:
+            io.UnsupportedOperation: if the body is compressed or chunked, read it instead
+        '''
+        raise io.UnsupportedOperation(f"{type(self).__name__} can only be read as a stream")
+
+
+class BufferBody(ObjectBody):
+    '''
+    A body sitting in a buffer, a memory map or bytes already in memory
+
+    Init
+    ----
+    :obj_type(str): the object's type
+    :buffer: the mmap or bytes holding the body
+    :start(int): where the body starts in buffer
+    :size(int): length of the body
+    '''
+
+    def __init__(self, obj_type: str, buffer, start: int, size: int):
+        super().__init__(obj_type, size)
+        self._buffer = buffer
+        self._view = memoryview(buffer)[start:start + size]
+        self._pos = 0
+
+    def getbuffer(self) -> memoryview:
+        #Views handed out have to be released before the body can be closed
+        return self._view[:]
+
+    def readinto(self, b) -> int:
+        n = min(len(b), self.size - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            try:
+                self._buffer.close()
+            except BufferError:
+                #A view from getbuffer() is still alive, the map goes when it does
+                pass
+        super().close()
+
+
+class InflatingBody(ObjectBody):
+    '''
+    A compressed body, decompressed at most chunk_size bytes at a time as it's read
+
+    Init
+    ----
+    :obj_type(str): the object's type
+    :size(int): length of the body
+    :f: the object file, positioned after the compressed bytes already fed in
+    :unpacker: the decompressor, already past the header
+    :pending(bytes): body bytes decompressed along with the header
+    '''
+
+    def __init__(self, obj_type: str, size: int, f, unpacker, pending: bytes, chunk_size: int):
+        super().__init__(obj_type, size)
+        self._f = f
+        self._unpacker = unpacker
+        self._pending = memoryview(pending)
+        self._chunk_size = chunk_size
+        self._eof = False
+
+    def _fill(self) -> None:
+        #zlib can be capped, so a run of zeros never inflates into one huge piece
+        tail = getattr(self._unpacker, "unconsumed_tail", b"")
+        data = tail or self._f.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return
+        if hasattr(self._unpacker, "unconsumed_tail"):
+            self._pending = memoryview(self._unpacker.decompress(data, self._chunk_size))
+        else:
+            self._pending = memoryview(self._unpacker.decompress(data))
+
+    def readinto(self, b) -> int:
+        while not len(self._pending) and not self._eof:
+            self._fill()
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class ChunkedBody(ObjectBody):
+    '''
+    A chunked file, read through its chunk objects in order
+
+    Init
+    ----
+    :store: the ObjectStore holding the chunks
+    :chunks: [(chunk sha, size), ...] from the manifest
+    '''
+
+    def __init__(self, store, chunks: list, chunk_size: int):
+        super().__init__("manifest", sum(size for _, size in chunks))
+        self._store = store
+        self._chunks = iter(chunks)
+        self._chunk_size = chunk_size
+        self._current = None
+
+    def readinto(self, b) -> int:
+        while True:
+            if self._current is None:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    return 0
+                self._current = open_body(self._store, chunk[0], self._chunk_size)
+            n = self._current.readinto(b)
+            if n:
+                return n
+            self._current.close()
+            self._current = None
+
+    def close(self) -> None:
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super().close()
+
+
+def open_body(store, object_id: str, chunk_size: int = CHUNK_SIZE) -> ObjectBody:
+    '''
+    Opens an object's body for reading, mapping it when it's stored uncompressed
+
+    Args:
+        store: the ObjectStore holding the object
+        object_id(str): a SHA256 in str
+        chunk_size(int): most bytes inflated or read per step
+
+    Raises:
+        FileNotFoundError: if the object doesn't exist
+        ValueError: if the object has no header
+    '''
+    path = None
+    if store.write_batch is not None:
+        path = store.write_batch.pending.get(object_id)
+    try:
+        f = open(path or store.path_for(object_id), "rb")
+    except FileNotFoundError:
+        #Packed, a delta has to be rebuilt in memory anyway
+        content = store.read_raw(object_id)
+        index = content.index(b"\0")
+        obj_type, size = content[:index].decode("ascii").split()
+        body = BufferBody(obj_type, content, index + 1, int(size))
+        return _follow_manifest(store, body, chunk_size)
+
+    try:
+        first = f.read(HEADER_PEEK)
+        codec = detect_codec(first)
+        unpacker = decompressor(codec)
+        content = unpacker.decompress(first, HEADER_PEEK) if codec == "zlib" else unpacker.decompress(first)
+        while b"\0" not in content:
+            more = getattr(unpacker, "unconsumed_tail", b"") or f.read(HEADER_PEEK)
+            if not more:
+                raise ValueError(f"Corrupt object, no header found: {object_id}")
+            content += unpacker.decompress(more, HEADER_PEEK) if codec == "zlib" else unpacker.decompress(more)
+        index = content.index(b"\0")
+        obj_type, size = content[:index].decode("ascii").split()
+        size = int(size)
+
+        if codec == "none":
+            #Stored as is, the body is a slice of the mapped file
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f.close()
+            body = BufferBody(obj_type, mapped, index + 1, size)
+        else:
+            body = InflatingBody(obj_type, size, f, unpacker, content[index + 1:], chunk_size)
+    except BaseException:
+        f.close()
+        raise
+    return _follow_manifest(store, body, chunk_size)
+
+
+def _follow_manifest(store, body: ObjectBody, chunk_size: int) -> ObjectBody:
+    #A manifest is tiny, so it's read whole and swapped for the file it describes
+    if body.type != "manifest":
+        return body
+    with body:
+        chunks = parse_manifest(body.read())
+    return ChunkedBody(store, chunks, chunk_size)
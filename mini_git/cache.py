@@ -0,0 +1,97 @@
+'''
+Bounded LRU cache of loaded objects
+
+Objects are immutable once stored, so cached entries never need invalidating,
+they only leave when the byte budget is exceeded.
+
+Contains:
+    - ObjectCache
+'''
+import threading
+from collections import OrderedDict
+
+
+#Default byte budget for each repo's cache
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ObjectCache:
+    '''
+    Least-recently-used cache of parsed objects, bounded by the size of their raw bytes
+
+    Init
+    ----
+    :max_bytes(int): byte budget, 0 turns the cache off
+    '''
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, object_id: str):
+        '''
+        Returns the cached object, or None on a miss
+        '''
+        with self._lock:
+            found = self._entries.get(object_id)
+            if found is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(object_id)
+            self.hits += 1
+            return found[0]
+
+    def put(self, object_id: str, obj, size: int) -> None:
+        '''
+        Caches an object, evicting the least recently used ones to stay in budget
+        '''
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(object_id, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[object_id] = (obj, size)
+            self.current_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        '''
+        Returns the hit/miss counters and current usage
+        '''
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, object_id: str) -> bool:
+        return object_id in self._entries
+
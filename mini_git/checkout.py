@@ -0,0 +1,136 @@
+'''
+Writing commits out to the working tree
+
+Only the paths that differ between the current tree and the target are touched. Blobs
+are streamed from the object store straight into their files, and the files are written
+across a thread pool.
+
+Contains:
+    - find_conflicts(), materialize(), write_blob()
+'''
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git.status import file_object_id
+from mini_git.object_store import ObjectStore
+
+
+def find_conflicts(index, root: str, changes: list) -> list:
+    '''
+    Returns the changed paths whose working copy or staged content would be lost
+
+    A file is safe to overwrite when it still holds what the current commit or the
+    target has, only the changed paths are stat'ed or read.
+
+    Args:
+        index: the repo's Index
+        root(str): the repo's directory
+        changes: DiffEntry list from the current tree to the target
+    '''
+    threshold = ObjectStore.open(root).chunk_threshold
+    conflicts = []
+    for change in changes:
+        entry = index.get(change.path)
+        if entry is not None and entry.staged and entry.object_id != change.new_sha:
+            conflicts.append(change.path)
+            continue
+
+        full_path = os.path.join(root, *change.path.split("/"))
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            #Nothing on disk, nothing to lose
+            continue
+        if os.path.isdir(full_path):
+            #Fine when the dir's files are being removed, it's pruned before the write
+            if not any(other.new_sha is None and other.path.startswith(change.path + "/") for other in changes):
+                conflicts.append(change.path)
+            continue
+        if entry is not None and entry.object_id == change.old_sha and index.is_fresh(change.path, st) is not None:
+            continue
+        if file_object_id(full_path, st.st_size, threshold) not in (change.old_sha, change.new_sha):
+            conflicts.append(change.path)
+    return conflicts
+
+
+def materialize(store, root: str, changes: list, workers: int = 4) -> dict:
+    '''
+    Applies tree changes to the working tree
+
+    Removed files go first (and any dirs they leave empty), then added and modified
+    files are written, across a pool of threads when there's more than one.
+
+    Args:
+        store: the repo's ObjectStore
+        root(str): the repo's directory
+        changes: DiffEntry list from the current tree to the target
+        workers: threads writing files
+
+    Returns:
+        path -> (stat, sha) for every file written
+    '''
+    for change in changes:
+        if change.new_sha is None:
+            full_path = os.path.join(root, *change.path.split("/"))
+            try:
+                os.remove(full_path)
+            except FileNotFoundError:
+                pass
+            _prune_dirs(root, os.path.dirname(full_path))
+
+    writes = [(change.path, change.new_sha) for change in changes if change.new_sha is not None]
+
+    def write(item):
+        path, sha = item
+        full_path = os.path.join(root, *path.split("/"))
+        write_blob(store, sha, full_path)
+        return path, (os.stat(full_path), sha)
+
+    if workers and workers > 1 and len(writes) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(writes))) as pool:
+            return dict(pool.map(write, writes))
+    return dict(write(item) for item in writes)
+
+
+def write_blob(store, object_id: str, full_path: str) -> None:
+    '''
+    Streams a blob into a file, atomically replacing whatever was there
+
+    The file keeps the mode of the one it replaces. A new one gets what a plain open()
+    would give it, the kernel applies the umask as the temp file is made, so the
+    process umask is never read or changed.
+    '''
+    parent_dir = os.path.dirname(full_path)
+    os.makedirs(parent_dir, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(full_path).st_mode)
+    except FileNotFoundError:
+        mode = None
+    tmp_path = os.path.join(parent_dir, f".tmp_checkout_{os.urandom(8).hex()}")
+    fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in store.iter_body(object_id):
+                out.write(chunk)
+            #Only a replaced file whose mode differs (an executable, say) needs a chmod
+            if mode is not None and mode != stat.S_IMODE(os.fstat(out.fileno()).st_mode):
+                os.chmod(tmp_path, mode)
+        os.replace(tmp_path, full_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _prune_dirs(root: str, path: str) -> None:
+    #Removes empty directories from path up to (not including) the repo root
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path != root and path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            #Not empty (or already gone), nothing above it can be empty either
+            return
+        path = os.path.dirname(path)
@@ -0,0 +1,156 @@
+'''
+Content-defined chunking for large blobs
+
+Files at or over the repo's chunk_threshold are split where the content says, not at
+fixed offsets, so an edit only changes the chunks around it and every other chunk
+keeps its sha. Each chunk is stored as an ordinary blob, and the file itself becomes a
+small manifest object listing them in order.
+
+Cut points come from FastCDC: the bytes after the minimum chunk size are fed to a gear
+rolling hash, with a stricter condition before the average size and a looser one after
+it, which keeps chunk sizes close to the average. The gear here is one bit per byte, mixed
+from the last few bytes, and a cut goes after a run of set bits, so the whole search is
+bytes.translate(), big-int xor and bytes.find() at C speed rather than a python loop
+over every byte.
+
+Manifest layout (the body of a "manifest" object):
+    one "<chunk sha> <chunk size>\\n" line per chunk, in file order
+
+Contains:
+    - iter_chunks(), make_manifest(), parse_manifest()
+    - store_chunked(), hash_chunked()
+'''
+import hashlib
+
+from mini_git.utils import make_header, make_header_from_size
+
+
+MIN_SIZE = 16 * 1024
+AVG_SIZE = 64 * 1024
+MAX_SIZE = 256 * 1024
+
+#A run of n set bits turns up about every 2**(n + 1) bytes, so runs of this length
+#land near the average size, harder to find before it and easier after
+_RUN = AVG_SIZE.bit_length() - 2
+STRICT_RUN = b"\x01" * (_RUN + 2)
+LOOSE_RUN = b"\x01" * (_RUN - 2)
+
+#How many bytes each bit of the gear depends on, one byte alone is too predictable in text
+CONTEXT = 2
+#Fixed for all time, different tables would move every cut point
+GEAR_BITS = tuple(bytes(hashlib.sha256(bytes([j, i])).digest()[0] >> 7 for i in range(256)) for j in range(CONTEXT))
+
+
+def _gear_bits(data: bytes) -> bytes:
+    #One 0/1 byte for each position from CONTEXT - 1 on, the parity of the table bits
+    #of the CONTEXT bytes ending there
+    bits = 0
+    length = len(data) - (CONTEXT - 1)
+    for j, table in enumerate(GEAR_BITS):
+        start = CONTEXT - 1 - j
+        bits ^= int.from_bytes(data[start:start + length].translate(table), "big")
+    return bits.to_bytes(length, "big")
+
+
+def _cut_point(bits: bytes, start: int, available: int) -> int:
+    #Length of the chunk starting at start, with available bytes buffered from there
+    end = min(available, MAX_SIZE)
+    if end <= MIN_SIZE:
+        return end
+    normal = min(end, AVG_SIZE)
+    found = bits.find(STRICT_RUN, start + MIN_SIZE, start + normal)
+    if found >= 0:
+        return found - start + len(STRICT_RUN)
+    found = bits.find(LOOSE_RUN, start + max(MIN_SIZE, normal - len(LOOSE_RUN) + 1), start + end)
+    if found >= 0:
+        return found - start + len(LOOSE_RUN)
+    return end
+
+
+def iter_chunks(f, read_size: int = 4 * MAX_SIZE):
+    '''
+    Yields the content-defined chunks of a binary file object
+
+    At most read_size + MAX_SIZE bytes are held at once.
+    '''
+    #The bytes just before the buffer, a bit depends on them too (zeros at the start)
+    tail = bytes(CONTEXT - 1)
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < MAX_SIZE:
+            more = f.read(read_size)
+            if more:
+                buffer += more
+                continue
+            eof = True
+        if not buffer:
+            return
+
+        #A bit only depends on the bytes around it, so it's worked out once per refill
+        data = tail + buffer
+        bits = _gear_bits(data)
+        pos = 0
+        #Cut while a whole max-sized chunk is buffered, or everything once at the end
+        while len(buffer) - pos >= MAX_SIZE or (eof and pos < len(buffer)):
+            cut = _cut_point(bits, pos, len(buffer) - pos)
+            yield buffer[pos:pos + cut]
+            pos += cut
+        tail = data[pos:pos + CONTEXT - 1]
+        buffer = buffer[pos:]
+
+
+def make_manifest(chunks: list) -> bytes:
+    '''
+    Returns the manifest body for [(chunk sha, chunk size), ...]
+    '''
+    return "".join(f"{sha} {size}\n" for sha, size in chunks).encode("ascii")
+
+
+def parse_manifest(body: bytes) -> list:
+    '''
+    Returns [(chunk sha, chunk size), ...] from a manifest body
+    '''
+    chunks = []
+    for line in body.decode("ascii").splitlines():
+        sha, size = line.split()
+        chunks.append((sha, int(size)))
+    return chunks
+
+
+def _manifest_object(chunks: list) -> tuple[str, bytes]:
+    body = make_manifest(chunks)
+    obj = make_header("manifest", body) + body
+    return hashlib.sha256(obj).hexdigest(), obj
+
+
+def store_chunked(store, file_path: str) -> str:
+    '''
+    Stores a file as chunk blobs plus a manifest, only writing chunks not already stored
+
+    Returns:
+        The manifest's object id
+    '''
+    chunks = []
+    with store.batch() as batched, open(file_path, "rb") as f:
+        for chunk in iter_chunks(f):
+            obj = make_header_from_size("blob", len(chunk)) + chunk
+            sha = hashlib.sha256(obj).hexdigest()
+            if sha not in batched:
+                batched.write(sha, obj)
+            chunks.append((sha, len(chunk)))
+        object_id, manifest = _manifest_object(chunks)
+        batched.write(object_id, manifest)
+    return object_id
+
+
+def hash_chunked(file_path: str) -> str:
+    '''
+    Returns the manifest id store_chunked() would give a file, without storing anything
+    '''
+    chunks = []
+    with open(file_path, "rb") as f:
+        for chunk in iter_chunks(f):
+            sha = hashlib.sha256(make_header_from_size("blob", len(chunk)) + chunk).hexdigest()
+            chunks.append((sha, len(chunk)))
+    return _manifest_object(chunks)[0]
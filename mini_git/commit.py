@@ -1,8 +1,8 @@
-import os
 import datetime
 
 from mini_git.utils import *
 from mini_git.tree import Tree
+from mini_git.object_store import ObjectStore, default_store
 
 
 class Commit:
@@ -29,34 +29,34 @@ class Commit:
     
     
     def get_parent_sha(self, BASE_DIR):
+        #The commit goes on the branch HEAD points to, or on HEAD itself when detached
+        self.parent_location, parent_sha = resolve_head(BASE_DIR)
+        return parent_sha
 
-        head_path = os.path.join(BASE_DIR, ".minigit", "HEAD")
-
-        with open(head_path, "rb") as f:
-            line = f.read().decode().strip()
-        
-        location = line.split(None, 1)[1]
-        self.parent_location = os.path.join(BASE_DIR, ".minigit", location)
-
-        if os.path.exists(self.parent_location):
-            with open(self.parent_location,"rb") as f:
-                parent_sha = f.read().decode().strip()
-        else:
-            parent_sha = None
+    def store(self, tree_sha: str, store: ObjectStore = None) -> str:
+        '''
+        Writes the commit object and points the current branch at it
+        '''
+        store = store or ObjectStore.for_path(self.dir_path)
+        self.write(tree_sha, store)
+        self.update_ref(store.durable)
+        return self.object_id
 
-        return parent_sha
+    def write(self, tree_sha: str, store: ObjectStore = None) -> str:
+        '''
+        Writes the commit object only, call update_ref() once it's safely stored
 
-    def store(self, tree_sha: str) -> str:
+        :store: the repo's ObjectStore, found from dir_path when not given
+        '''
         #Validate again
         validate_directory(self.dir_path)
 
         #set tree sha of the commit
         self.tree_sha = tree_sha
 
-        #Set Base Dir
-        BASE_DIR = os.getenv("BASE_DIR", os.getcwd())
+        store = store or ObjectStore.for_path(self.dir_path)
         #Grab the parent sha if it exists, from minigit/refs/heads/master
-        self.parent_sha = self.get_parent_sha(BASE_DIR)
+        self.parent_sha = self.get_parent_sha(store.base_dir)
 
         #Set the data
         self.data = self.create_data()
@@ -66,27 +66,29 @@ class Commit:
         self.header = make_header("commit", self.body)
         self.object_id = create_obj_id(self.header, self.body)
 
-        write_to_disk(BASE_DIR, self.object_id, self.header + self.body)
+        store.write(self.object_id, self.header + self.body)
 
-        with open(self.parent_location, "w") as f:
-            f.write(self.object_id)
+        return self.object_id
+
+    def update_ref(self, durable: bool = True) -> None:
+        '''
+        Points the branch HEAD refers to at this commit, with an atomic rename
+
+        :durable: fsync the new ref before and its directory after the rename
+        '''
+        write_ref(self.parent_location, self.object_id, durable)
         #Resetting
         self.parent_sha = None
-
-        return self.object_id
     
     @classmethod
-    def load(cls, object_id):
+    def load(cls, object_id, store: ObjectStore = None):
         '''
         Returns a commit object based on an object id(sha)
         '''
-        path = decode_sha_to_path(object_id)
+        return (store or default_store()).load(object_id, cls, cls._parse)
 
-        validate_file(path)
-
-        with open(path, "rb") as f:
-            content = f.read()
-        
+    @classmethod
+    def _parse(cls, object_id, content, store: ObjectStore = None):
         #Extract the header and body
         index = content.find(b'\0')
         raw_header = content[:index + 1]
@@ -95,12 +97,12 @@ class Commit:
         #Make sure it's a tree
         assert header_type == "commit", f"Expected commit, got {header_type}"
         
-        #decode data
-        body = content[index + 1:]
+        #decode data, straight from a view so the body isn't copied before decoding
+        body = memoryview(content)[index + 1:]
 
         assert int(length) == len(body), f"Body is not {length} long, failure"
 
-        lines = body.decode("ascii").splitlines()
+        lines = str(body, "ascii").splitlines()
 
         entries = dict()
         for line in lines:
@@ -119,4 +121,32 @@ class Commit:
         commit.commit_message = entries["message"]
         
 
-        return commit
\ No newline at end of file
+        return commit
+
+
+class CommitRecord:
+    '''
+    Lightweight, read-only view of a commit for listing history
+
+    The root tree is only loaded the first time .tree is accessed.
+    '''
+    __slots__ = ("object_id", "tree_sha", "parent_sha", "date_time", "author", "commit_message", "_tree", "_store")
+
+    def __init__(self, commit: Commit, store: ObjectStore = None):
+        self.object_id = commit.object_id
+        self.tree_sha = commit.tree_sha
+        self.parent_sha = commit.parent_sha
+        self.date_time = commit.date_time
+        self.author = commit.author
+        self.commit_message = commit.commit_message
+        self._tree = None
+        self._store = store
+
+    @property
+    def tree(self) -> Tree:
+        if self._tree is None:
+            self._tree = Tree.load(self.tree_sha, self._store)
+        return self._tree
+
+    def __repr__(self):
+        return f"CommitRecord({self.object_id[:10]}, {self.author!r}, {self.date_time})"
\ No newline at end of file
@@ -0,0 +1,395 @@
+'''
+Commit-graph file for my mini-git
+
+Stores the shape of history in a fixed-width binary file, so walking parents, checking
+ancestry and finding merge-bases never has to open or parse a commit object.
+
+Layout:
+    b"MCGF" | version (u32) | commit count (u32)
+    fanout: 256 x u32, entry i = number of commits whose first byte is <= i
+    names: count x 32-byte raw sha, sorted
+    data: count x (tree sha (32) | parent 1 (u32) | parent 2 (u32) | generation (u32) | date (i64))
+    trailer: sha256 of everything above
+
+Parents are positions in the sorted names, NO_PARENT when missing. Dates are
+microseconds since the epoch.
+
+New commits go to a small tail layer next to it, objects/info/commit-graph-tail, so a
+commit never rewrites the whole graph. The tail has the same layout, except that its
+header is b"MCGT" | version | count | checksum of the main file it extends, and its
+positions carry on from the main file's: parent slots below the main count are commits
+in the main file. A tail whose checksum doesn't match the main file is ignored. Once it
+holds TAIL_LIMIT commits, the next commit merges it into the main file.
+
+Contains:
+    - CommitGraph, write_commit_graph(), encode_commit_graph_tail(), write_commit_graph_tail(),
+      date_to_micros()
+'''
+import os
+import mmap
+import heapq
+import struct
+import hashlib
+import datetime
+import tempfile
+
+from mini_git.utils import build_fanout, fanout_search
+
+
+MAGIC = b"MCGF"
+TAIL_MAGIC = b"MCGT"
+VERSION = 1
+HEADER = struct.Struct(">4sII")
+TAIL_HEADER = struct.Struct(">4sII32s")
+FANOUT = struct.Struct(">256I")
+DATA = struct.Struct(">32sIIIq")
+SHA_LEN = 32
+NO_PARENT = 0xFFFFFFFF
+
+#Commits the tail holds before it's merged into the main file, bounds what a commit rewrites
+TAIL_LIMIT = 256
+
+
+def date_to_micros(date_time) -> int:
+    '''
+    Turns a commit's iso date (or a datetime) into microseconds since the epoch
+    '''
+    if isinstance(date_time, str):
+        date_time = datetime.datetime.fromisoformat(date_time)
+    return int(date_time.timestamp() * 1_000_000)
+
+
+def write_commit_graph(graph_path: str, commits: dict) -> None:
+    '''
+    Writes a commit-graph holding the given commits
+
+    Args:
+        graph_path(str): where the file is written
+        commits: object_id -> (tree_sha, [parent ids], date in microseconds), every
+            parent must be in commits too
+
+    Raises:
+        ValueError: if a parent is missing, or a commit has more than two parents
+    '''
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(commits)))
+    data += _encode(commits, 0, {}, {})
+    _write_file(graph_path, data)
+
+
+def encode_commit_graph_tail(commits: dict, graph) -> bytearray:
+    '''
+    Builds a tail layer holding the given commits on top of graph's main file
+
+    Args:
+        commits: the layer's commits, in the form write_commit_graph() takes, parents may
+            also be in graph's main file
+        graph: the CommitGraph being extended
+
+    Raises:
+        ValueError: if a parent is in neither, or a commit has more than two parents
+
+    Returns:
+        the layer, for write_commit_graph_tail()
+    '''
+    positions, generations = {}, {}
+    for _, parents, _ in commits.values():
+        for parent in parents:
+            if parent not in commits and parent not in positions:
+                pos = graph.main_position(parent)
+                if pos >= 0:
+                    positions[parent] = pos
+                    generations[parent] = graph.entry(pos)[2]
+    data = bytearray(TAIL_HEADER.pack(TAIL_MAGIC, VERSION, len(commits), graph.checksum))
+    data += _encode(commits, graph.main_count, positions, generations)
+    return data
+
+
+def write_commit_graph_tail(tail_path: str, data: bytearray) -> None:
+    '''
+    Writes a tail layer built by encode_commit_graph_tail()
+
+    Nothing is unmapped, a graph still being read keeps its mapping of the old tail. Drop
+    your own references to it first, a mapped file can't be replaced on Windows.
+    '''
+    _write_file(tail_path, data)
+
+
+def _encode(commits: dict, first_position: int, positions: dict, generations: dict) -> bytes:
+    #Fanout, names and data for commits numbered from first_position, positions and
+    #generations already hold the parents found in an underlying layer
+    names = sorted(commits)
+    positions = dict(positions)
+    positions.update((object_id, first_position + i) for i, object_id in enumerate(names))
+
+    #Generation is 1 + the highest parent generation, worked out without recursion
+    generations = dict(generations)
+    for object_id in names:
+        stack = [object_id]
+        while stack:
+            current = stack[-1]
+            if current in generations:
+                stack.pop()
+                continue
+            parents = commits[current][1]
+            missing = [parent for parent in parents if parent not in generations]
+            for parent in missing:
+                if parent not in commits:
+                    raise ValueError(f"Parent {parent} of {current} is not in the commit-graph")
+            if missing:
+                stack.extend(missing)
+                continue
+            generations[current] = 1 + max((generations[parent] for parent in parents), default=0)
+            stack.pop()
+
+    raw_names = [bytes.fromhex(object_id) for object_id in names]
+    data = bytearray(FANOUT.pack(*build_fanout(raw_names)))
+    data += b"".join(raw_names)
+    for object_id in names:
+        tree_sha, parents, date = commits[object_id]
+        if len(parents) > 2:
+            raise ValueError(f"Commit {object_id} has more than two parents")
+        slots = [positions[parent] for parent in parents] + [NO_PARENT] * (2 - len(parents))
+        data += DATA.pack(bytes.fromhex(tree_sha), slots[0], slots[1], generations[object_id], date)
+    return bytes(data)
+
+
+def _write_file(path: str, data: bytearray) -> None:
+    data += hashlib.sha256(data).digest()
+    parent_dir = os.path.dirname(path)
+    os.makedirs(parent_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_graph_", dir=parent_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class _Layer:
+    '''
+    One memory-mapped file of a commit-graph, positions local to the file
+
+    Init
+    ----
+    :path(str): the main file or the tail
+    :magic(bytes): the magic it must start with
+    :header(struct.Struct): its header layout
+    '''
+
+    def __init__(self, path: str, magic: bytes, header: struct.Struct):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fields = header.unpack_from(self._map, 0)
+        except struct.error:
+            fields = (None, None)
+        if fields[0] != magic or fields[1] != VERSION:
+            self.close()
+            raise ValueError(f"Not a supported commit-graph: {path}")
+        self.count = fields[2]
+        #Only a tail has one, the checksum of the main file under it
+        self.base_checksum = fields[3] if len(fields) > 3 else None
+        self.checksum = self._map[-SHA_LEN:]
+        self._fanout = FANOUT.unpack_from(self._map, header.size)
+        self._names_at = header.size + FANOUT.size
+        self._data_at = self._names_at + self.count * SHA_LEN
+
+    def raw_name(self, pos: int) -> bytes:
+        start = self._names_at + pos * SHA_LEN
+        return self._map[start:start + SHA_LEN]
+
+    def position(self, raw_sha: bytes) -> int:
+        return fanout_search(self._fanout, self.raw_name, raw_sha)
+
+    def entry(self, pos: int) -> tuple:
+        return DATA.unpack_from(self._map, self._data_at + pos * DATA.size)
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class CommitGraph:
+    '''
+    A memory-mapped commit-graph, lookups are a binary search inside one fanout bucket
+
+    Positions run through the main file and then its tail, if there is a matching one.
+
+    Init
+    ----
+    :graph_path(str): path to the commit-graph file
+    :tail_path(str): path to its tail layer, which may not exist
+    '''
+
+    def __init__(self, graph_path: str, tail_path: str = None):
+        self.graph_path = graph_path
+        self._main = _Layer(graph_path, MAGIC, HEADER)
+        self._tail = None
+        if tail_path is not None:
+            try:
+                tail = _Layer(tail_path, TAIL_MAGIC, TAIL_HEADER)
+            except (OSError, ValueError):
+                tail = None
+            #A tail left over from before the main file was rewritten is already merged
+            if tail is not None and tail.base_checksum != self._main.checksum:
+                tail.close()
+                tail = None
+            self._tail = tail
+        self.main_count = self._main.count
+        self.count = self.main_count + (self._tail.count if self._tail is not None else 0)
+
+    @property
+    def checksum(self) -> bytes:
+        '''
+        The main file's checksum, a tail records the one it was written on
+        '''
+        return self._main.checksum
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, object_id: str) -> bool:
+        return self.position(object_id) >= 0
+
+    def name(self, pos: int) -> str:
+        if pos < self.main_count:
+            return self._main.raw_name(pos).hex()
+        return self._tail.raw_name(pos - self.main_count).hex()
+
+    def position(self, object_id: str) -> int:
+        '''
+        Returns the position of a commit in the graph, or -1
+        '''
+        raw_sha = bytes.fromhex(object_id)
+        pos = self._main.position(raw_sha)
+        if pos < 0 and self._tail is not None:
+            pos = self._tail.position(raw_sha)
+            return pos + self.main_count if pos >= 0 else -1
+        return pos
+
+    def main_position(self, object_id: str) -> int:
+        '''
+        Returns the position of a commit in the main file only, or -1
+        '''
+        return self._main.position(bytes.fromhex(object_id))
+
+    def entry(self, pos: int) -> tuple:
+        '''
+        Returns (tree_sha, [parent positions], generation, date) for a position
+        '''
+        if pos < self.main_count:
+            raw_tree, first, second, generation, date = self._main.entry(pos)
+        else:
+            raw_tree, first, second, generation, date = self._tail.entry(pos - self.main_count)
+        parents = [parent for parent in (first, second) if parent != NO_PARENT]
+        return raw_tree.hex(), parents, generation, date
+
+    def commits(self, start: int = 0) -> dict:
+        '''
+        Returns every commit from a position on, in the form write_commit_graph() takes
+
+        commits(graph.main_count) gives just the tail's.
+        '''
+        found = {}
+        for pos in range(start, self.count):
+            tree_sha, parents, _, date = self.entry(pos)
+            found[self.name(pos)] = (tree_sha, [self.name(parent) for parent in parents], date)
+        return found
+
+    def parents(self, object_id: str) -> list:
+        pos = self._require(object_id)
+        return [self.name(parent) for parent in self.entry(pos)[1]]
+
+    def generation(self, object_id: str) -> int:
+        return self.entry(self._require(object_id))[2]
+
+    def date(self, object_id: str) -> int:
+        return self.entry(self._require(object_id))[3]
+
+    def tree_sha(self, object_id: str) -> str:
+        return self.entry(self._require(object_id))[0]
+
+    def _require(self, object_id: str) -> int:
+        pos = self.position(object_id)
+        if pos < 0:
+            raise KeyError(f"Commit not in the commit-graph: {object_id}")
+        return pos
+
+    def walk(self, start: str, since: int = None):
+        '''
+        Yields commit ids reachable from start, newest first by commit date
+
+        Args:
+            since: stop once every commit waiting to be visited is older than this
+                (microseconds). With clock skew a commit can be newer than its child, so
+                older commits are still walked through while any parent found is in range.
+                One reached only through two older commits in a row is still missed.
+        '''
+        pos = self._require(start)
+        seen = {pos}
+        heap = [(-self.entry(pos)[3], pos)]
+        while heap:
+            _, pos = heapq.heappop(heap)
+            yield self.name(pos)
+            for parent in self.entry(pos)[1]:
+                if parent not in seen:
+                    seen.add(parent)
+                    heapq.heappush(heap, (-self.entry(parent)[3], parent))
+            if since is not None and heap and -heap[0][0] < since:
+                return
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        '''
+        True if ancestor is reachable from descendant (a commit is its own ancestor)
+
+        Nothing with a lower generation than the ancestor is visited, it can't lead there.
+        '''
+        target = self._require(ancestor)
+        floor = self.entry(target)[2]
+        start = self._require(descendant)
+        stack = [start]
+        seen = {start}
+        while stack:
+            pos = stack.pop()
+            if pos == target:
+                return True
+            for parent in self.entry(pos)[1]:
+                if parent not in seen and self.entry(parent)[2] >= floor:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def merge_base(self, first: str, second: str):
+        '''
+        Returns the best common ancestor of two commits, or None if they share no history
+
+        Walks down from both sides highest generation first, the first commit reached
+        from both is the common ancestor nearest to the tips.
+        '''
+        left, right = self._require(first), self._require(second)
+        if left == right:
+            return first
+
+        #1 = reached from first, 2 = reached from second
+        flags = {left: 1, right: 2}
+        heap = [(-self.entry(left)[2], left), (-self.entry(right)[2], right)]
+        queued = {left, right}
+        while heap:
+            _, pos = heapq.heappop(heap)
+            queued.discard(pos)
+            if flags[pos] == 3:
+                return self.name(pos)
+            for parent in self.entry(pos)[1]:
+                combined = flags.get(parent, 0) | flags[pos]
+                if combined != flags.get(parent):
+                    flags[parent] = combined
+                    if parent not in queued:
+                        queued.add(parent)
+                        heapq.heappush(heap, (-self.entry(parent)[2], parent))
+        return None
+
+    def close(self) -> None:
+        self._main.close()
+        if self._tail is not None:
+            self._tail.close()
@@ -0,0 +1,123 @@
+'''
+Compression codecs for stored objects
+
+Objects are compressed as a whole (header + body). The codec is detected from the
+first bytes when reading, so raw objects from older repos still load.
+
+Contains:
+    - get_codec(), compress(), compressor()
+    - decompress(), decompressor()
+'''
+import zlib
+
+from mini_git.config import read_config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+#zstd frames always start with this magic number
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+CODECS = ("none", "zlib", "zstd")
+
+
+def get_codec(BASE_DIR: str) -> tuple[str, int]:
+    '''
+    Returns the (codec, level) configured for the repo at BASE_DIR
+
+    Raises:
+        ValueError: if the codec is unknown
+        ImportError: if zstd is configured but the zstandard package is missing
+    '''
+    settings = read_config(BASE_DIR)
+    codec = settings["compression"]
+    level = int(settings["compression_level"])
+    check_codec(codec)
+    return codec, level
+
+
+def check_codec(codec: str) -> None:
+    '''
+    Makes sure a codec name is known and usable
+
+    Raises:
+        ValueError: if the codec is unknown
+        ImportError: if zstd is requested but the zstandard package is missing
+    '''
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec: {codec}, expected one of {CODECS}")
+    if codec == "zstd" and zstandard is None:
+        raise ImportError("zstd compression requires the 'zstandard' package")
+
+
+def compress(data: bytes, codec: str, level: int) -> bytes:
+    '''
+    Compresses a whole object in one go
+    '''
+    c = compressor(codec, level)
+    return c.compress(data) + c.flush()
+
+
+class _RawCompressor:
+    #Pass-through used when compression is off, same api as zlib's compressobj
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(codec: str, level: int):
+    '''
+    Returns a streaming compressor with compress() and flush()
+    '''
+    check_codec(codec)
+    if codec == "zlib":
+        return zlib.compressobj(level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return _RawCompressor()
+
+
+def detect_codec(prefix: bytes) -> str:
+    '''
+    Works out how stored bytes were written, from at least the first 4 bytes
+
+    Raw objects start with an ascii type name ("blob ", "tree ", ...) which can never
+    look like a zlib header or the zstd magic.
+    '''
+    if prefix[:4] == ZSTD_MAGIC:
+        return "zstd"
+    #zlib header: deflate method, and the first two bytes are a multiple of 31
+    if len(prefix) >= 2 and prefix[0] & 0x0F == 8 and (prefix[0] << 8 | prefix[1]) % 31 == 0:
+        return "zlib"
+    return "none"
+
+
+def decompress(stored: bytes) -> bytes:
+    '''
+    Decodes stored object bytes, whichever codec (or none) wrote them
+    '''
+    d = decompressor(detect_codec(stored[:4]))
+    return d.decompress(stored)
+
+
+def decompressor(codec: str):
+    '''
+    Returns a streaming decompressor with decompress()
+    '''
+    check_codec(codec)
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return _RawDecompressor()
+
+
+class _RawDecompressor:
+    #Pass-through for objects that were stored uncompressed
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        return data
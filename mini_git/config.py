@@ -0,0 +1,105 @@
+'''
+Repo-level settings for my mini-git, stored in .minigit/config
+
+Contains:
+    - read_config(), get_setting(), get_flag(), write_config()
+'''
+import os
+import configparser
+
+
+#Every setting has a default, so old repos without a config still work
+DEFAULTS = {
+    "compression": "zlib",
+    "compression_level": "6",
+    "commit_graph": "true",
+    #Write a changed-path Bloom filter for every commit, used by log(path=...)
+    "changed_paths": "true",
+    "fsync": "true",
+    #Files at least this many bytes are stored as content-defined chunks, 0 turns it off
+    "chunk_threshold": "0",
+}
+
+SECTION = "core"
+
+#Parsed configs keyed by path, reloaded only when the file changes
+_config_cache = {}
+
+
+def config_path(BASE_DIR: str) -> str:
+    '''
+    Returns the path to the config file of the repo at BASE_DIR
+    '''
+    return os.path.join(BASE_DIR, ".minigit", "config")
+
+
+def read_config(BASE_DIR: str) -> dict:
+    '''
+    Reads the repo config, falling back to the defaults for anything missing
+
+    Returns:
+        dict of setting name -> str value
+    '''
+    path = config_path(BASE_DIR)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return dict(DEFAULTS)
+
+    cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return dict(cached[1])
+
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    settings = dict(DEFAULTS)
+    if parser.has_section(SECTION):
+        settings.update(parser[SECTION])
+
+    _config_cache[path] = (mtime, settings)
+    return dict(settings)
+
+
+def get_setting(BASE_DIR: str, key: str) -> str:
+    '''
+    Returns a single setting for the repo at BASE_DIR
+
+    Raises:
+        KeyError: if the setting is unknown
+    '''
+    settings = read_config(BASE_DIR)
+    if key not in settings:
+        raise KeyError(f"Unknown setting: {key}")
+    return settings[key]
+
+
+def get_flag(BASE_DIR: str, key: str) -> bool:
+    '''
+    Returns a yes/no setting as a bool
+    '''
+    return get_setting(BASE_DIR, key).strip().lower() in ("true", "yes", "on", "1")
+
+
+def write_config(BASE_DIR: str, **values) -> None:
+    '''
+    Updates the given settings in the repo config, keeping everything else
+
+    Raises:
+        KeyError: if a setting is unknown
+    '''
+    for key in values:
+        if key not in DEFAULTS:
+            raise KeyError(f"Unknown setting: {key}")
+
+    path = config_path(BASE_DIR)
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    if not parser.has_section(SECTION):
+        parser.add_section(SECTION)
+    for key, val in values.items():
+        parser[SECTION][key] = str(val)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        parser.write(f)
+    _config_cache.pop(path, None)
@@ -0,0 +1,249 @@
+'''
+Tree and line diffs for my mini-git
+
+Trees are walked side by side and any subtree with the same sha on both sides is
+skipped without being loaded, so comparing two commits costs about the size of the
+change rather than the size of the repo. Line diffs use Myers' O(ND) algorithm and are
+only worked out when a change's hunks are asked for.
+
+Contains:
+    - DiffEntry, Hunk, diff_trees(), myers_diff(), iter_hunks()
+'''
+from mini_git.tree import Tree
+from mini_git.blob import Blob
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+
+class DiffEntry:
+    '''
+    One changed file between two trees, paths use "/"
+
+    old_sha is None for an added file, new_sha is None for a removed one.
+    '''
+    __slots__ = ("status", "path", "old_sha", "new_sha", "_store")
+
+    def __init__(self, status: str, path: str, old_sha: str, new_sha: str, store=None):
+        self.status = status
+        self.path = path
+        self.old_sha = old_sha
+        self.new_sha = new_sha
+        self._store = store
+
+    def hunks(self, context: int = 3):
+        '''
+        Lazily yields the line-level Hunks of the change, nothing for binary files
+
+        Neither blob is read until the first hunk is asked for.
+        '''
+        old = self._lines(self.old_sha)
+        new = self._lines(self.new_sha)
+        if old is None or new is None:
+            return
+        yield from iter_hunks(old, new, context)
+
+    def _lines(self, sha: str):
+        #Lines of a blob keeping their endings, None if it looks binary
+        if sha is None:
+            return []
+        data = Blob.load(sha, self._store).data
+        if b"\0" in data:
+            return None
+        return data.splitlines(keepends=True)
+
+    def __eq__(self, other):
+        if not isinstance(other, DiffEntry):
+            return NotImplemented
+        return (self.status, self.path, self.old_sha, self.new_sha) == (other.status, other.path, other.old_sha, other.new_sha)
+
+    def __repr__(self):
+        return f"DiffEntry({self.status}, {self.path!r})"
+
+
+class Hunk:
+    '''
+    A run of changed lines with some unchanged context, as in a unified diff
+
+    Starts are 1-based, lines are (tag, line) with tag " ", "-" or "+".
+    '''
+    __slots__ = ("old_start", "old_count", "new_start", "new_count", "lines")
+
+    def __init__(self, old_start: int, old_count: int, new_start: int, new_count: int, lines: list):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.lines = lines
+
+    def __str__(self):
+        out = [f"@@ -{self.old_start},{self.old_count} +{self.new_start},{self.new_count} @@\n"]
+        for tag, line in self.lines:
+            text = line.decode("utf-8", errors="replace")
+            out.append(tag + (text if text.endswith("\n") else text + "\n"))
+        return "".join(out)
+
+    def __repr__(self):
+        return f"Hunk(-{self.old_start},{self.old_count} +{self.new_start},{self.new_count})"
+
+
+def diff_trees(old_sha, new_sha, store=None, prefix: str = ""):
+    '''
+    Yields a DiffEntry for every file that differs between two trees, sorted by path
+
+    Args:
+        old_sha: the tree before, None for an empty tree
+        new_sha: the tree after, None for an empty tree
+        store: the repo's ObjectStore
+        prefix: path the trees sit at, used for the reported paths
+    '''
+    if old_sha == new_sha:
+        return
+    old = _children(old_sha, store)
+    new = _children(new_sha, store)
+
+    for name in sorted(old.keys() | new.keys()):
+        path = f"{prefix}/{name}" if prefix else name
+        old_type, old_child = old.get(name, (None, None))
+        new_type, new_child = new.get(name, (None, None))
+        if old_child == new_child and old_type == new_type:
+            #Same sha on both sides, nothing under it can differ
+            continue
+
+        if old_type == "tree" or new_type == "tree":
+            #A file replaced by a directory (or back) is a removal plus additions
+            if old_type == "blob":
+                yield DiffEntry(REMOVED, path, old_child, None, store)
+            yield from diff_trees(old_child if old_type == "tree" else None,
+                                  new_child if new_type == "tree" else None, store, path)
+            if new_type == "blob":
+                yield DiffEntry(ADDED, path, None, new_child, store)
+        elif old_type is None:
+            yield DiffEntry(ADDED, path, None, new_child, store)
+        elif new_type is None:
+            yield DiffEntry(REMOVED, path, old_child, None, store)
+        else:
+            yield DiffEntry(MODIFIED, path, old_child, new_child, store)
+
+
+def _children(tree_sha, store) -> dict:
+    #name -> (type, sha) for a tree, empty for None
+    if tree_sha is None:
+        return {}
+    return {name: (entry_type, sha) for entry_type, name, sha in Tree.load(tree_sha, store).children}
+
+
+def myers_diff(a: list, b: list) -> list:
+    '''
+    Returns a shortest edit script turning a into b
+
+    The common prefix and suffix are matched first, so only the changed middle goes
+    through the O(ND) search.
+
+    Returns:
+        list of (tag, a_pos, b_pos), tag "=" keeps a[a_pos] (== b[b_pos]), "-" deletes
+        a[a_pos] and "+" inserts b[b_pos]
+    '''
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+
+    middle = _myers(a[start:end_a], b[start:end_b])
+    ops = [("=", i, i) for i in range(start)]
+    ops.extend((tag, x + start, y + start) for tag, x, y in middle)
+    ops.extend(("=", end_a + i, end_b + i) for i in range(len(a) - end_a))
+    return ops
+
+
+def _myers(a: list, b: list) -> list:
+    #Greedy forward search keeping each round's furthest x per diagonal, then a backtrack
+    n, m = len(a), len(b)
+    furthest = {1: 0}
+    trace = []
+    for d in range(n + m + 1):
+        trace.append(dict(furthest))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and furthest[k - 1] < furthest[k + 1]):
+                x = furthest[k + 1]
+            else:
+                x = furthest[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            furthest[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return []
+
+
+def _backtrack(trace: list, x: int, y: int) -> list:
+    ops = []
+    for d in range(len(trace) - 1, -1, -1):
+        furthest = trace[d]
+        k = x - y
+        if k == -d or (k != d and furthest[k - 1] < furthest[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = furthest[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            ops.append(("=", x, y))
+        if d > 0:
+            if x == prev_x:
+                ops.append(("+", x, y - 1))
+            else:
+                ops.append(("-", x - 1, y))
+        x, y = prev_x, prev_y
+    ops.reverse()
+    return ops
+
+
+def iter_hunks(a: list, b: list, context: int = 3):
+    '''
+    Lazily yields the Hunks turning lines a into lines b
+
+    Changes closer together than twice the context share a hunk.
+    '''
+    ops = myers_diff(a, b)
+    changes = [i for i, op in enumerate(ops) if op[0] != "="]
+    if not changes:
+        return
+
+    first = last = changes[0]
+    for i in changes[1:] + [None]:
+        if i is not None and i - last - 1 <= 2 * context:
+            last = i
+            continue
+        lo = max(0, first - context)
+        hi = min(len(ops), last + context + 1)
+        yield _make_hunk(ops[lo:hi], a, b)
+        first = last = i
+
+
+def _make_hunk(ops: list, a: list, b: list) -> Hunk:
+    lines = []
+    old_count = new_count = 0
+    for tag, x, y in ops:
+        if tag == "+":
+            lines.append(("+", b[y]))
+            new_count += 1
+        else:
+            lines.append((" " if tag == "=" else "-", a[x]))
+            old_count += 1
+            if tag == "=":
+                new_count += 1
+
+    _, x, y = ops[0]
+    #An empty side starts at the line before, as unified diffs do
+    old_start = x + 1 if old_count else x
+    new_start = y + 1 if new_count else y
+    return Hunk(old_start, old_count, new_start, new_count, lines)
@@ -0,0 +1,218 @@
+'''
+Integrity checking for my mini-git
+
+Every object is streamed through sha256 a chunk at a time and the result compared to
+its name, the header's length is checked against the body, and trees, commits and
+manifests are parsed for the objects they point to. Work is handed out in jobs of many
+small loose objects (or one slice of a pack) so a process pool keeps every core busy,
+and no blob is ever held in memory whole, except a packed one being rebuilt from its
+delta.
+
+Each job returns its findings, and the caller works out which references are missing
+and which objects nothing points to (dangling).
+
+Contains:
+    - loose_jobs(), pack_jobs(), run_job()
+'''
+import os
+import hashlib
+
+from mini_git.utils import CHUNK_SIZE, make_header
+from mini_git.compression import decompressor, detect_codec
+from mini_git.chunking import parse_manifest
+from mini_git.pack import Pack
+
+
+#A loose job holds this many objects, or this many stored bytes, whichever comes first
+JOB_OBJECTS = 512
+JOB_BYTES = 64 << 20
+#Packed objects per job
+PACK_JOB_OBJECTS = 2048
+
+KNOWN_TYPES = ("blob", "tree", "commit", "manifest")
+#Small objects whose body is kept to find what they point to
+REFERRING_TYPES = ("tree", "commit", "manifest")
+
+
+def loose_jobs(loose: list) -> list:
+    '''
+    Splits [(object_id, path, stored size), ...] into ("loose", [(object_id, path), ...]) jobs
+    '''
+    jobs = []
+    current = []
+    size = 0
+    for object_id, path, stored in loose:
+        size += stored
+        current.append((object_id, path))
+        if len(current) >= JOB_OBJECTS or size >= JOB_BYTES:
+            jobs.append(("loose", current))
+            current, size = [], 0
+    if current:
+        jobs.append(("loose", current))
+    return jobs
+
+
+def pack_jobs(pack_path: str, object_ids: list) -> list:
+    '''
+    Splits a pack's objects into ("pack", pack_path, [object_id, ...]) jobs, plus one
+    ("pack_file", pack_path) job checking the pack's own checksum
+    '''
+    jobs = [("pack_file", pack_path)]
+    for start in range(0, len(object_ids), PACK_JOB_OBJECTS):
+        jobs.append(("pack", pack_path, object_ids[start:start + PACK_JOB_OBJECTS]))
+    return jobs
+
+
+def run_job(job: tuple) -> list:
+    '''
+    Checks the objects of one job, module level so process pools can pickle it
+
+    Returns:
+        [(object_id, type or None, problem or None, [(referenced sha, type), ...]), ...]
+        a pack file's own finding has the pack's file name for object_id and no type
+    '''
+    kind = job[0]
+    if kind == "loose":
+        return [_check_loose(object_id, path) for object_id, path in job[1]]
+    if kind == "pack_file":
+        return [(os.path.basename(job[1]), None, _check_pack_file(job[1]), [])]
+    return _check_packed(job[1], job[2])
+
+
+def _check_loose(object_id: str, path: str) -> tuple:
+    try:
+        with open(path, "rb") as f:
+            return _check_stream(object_id, f)
+    except OSError as e:
+        return object_id, None, f"unreadable: {e}", []
+
+
+def _check_stream(object_id: str, f) -> tuple:
+    hasher = hashlib.sha256()
+    first = f.read(CHUNK_SIZE)
+    try:
+        unpacker = decompressor(detect_codec(first))
+    except ValueError as e:
+        return object_id, None, str(e), []
+    #zlib output is capped per call, so a run of zeros never inflates in one go
+    capped = hasattr(unpacker, "unconsumed_tail")
+
+    header = b""
+    obj_type = size = None
+    body_len = 0
+    kept = []
+    data = first
+    try:
+        while data:
+            out = unpacker.decompress(data, CHUNK_SIZE) if capped else unpacker.decompress(data)
+            data = unpacker.unconsumed_tail if capped else b""
+            if not data:
+                data = f.read(CHUNK_SIZE)
+            if not out:
+                continue
+            hasher.update(out)
+            if obj_type is None:
+                header += out
+                index = header.find(b"\0")
+                if index < 0:
+                    if len(header) > 64:
+                        return object_id, None, "no header", []
+                    continue
+                obj_type, size, problem = _parse_header(header[:index])
+                if problem:
+                    return object_id, None, problem, []
+                out = header[index + 1:]
+            body_len += len(out)
+            if obj_type in REFERRING_TYPES:
+                kept.append(out)
+    except Exception as e:
+        return object_id, obj_type, f"can't be decompressed: {e}", []
+
+    if obj_type is None:
+        return object_id, None, "no header", []
+    if not getattr(unpacker, "eof", True):
+        return object_id, obj_type, "truncated, the compressed stream doesn't end", []
+    if body_len != size:
+        return object_id, obj_type, f"header says {size} bytes, body has {body_len}", []
+    if hasher.hexdigest() != object_id:
+        return object_id, obj_type, f"content hashes to {hasher.hexdigest()}", []
+    return _references(object_id, obj_type, b"".join(kept))
+
+
+def _parse_header(raw: bytes) -> tuple:
+    #Returns (type, size, problem)
+    try:
+        obj_type, size = raw.decode("ascii").split(" ")
+        size = int(size)
+    except ValueError:
+        return None, None, f"bad header {raw[:64]!r}"
+    if obj_type not in KNOWN_TYPES or size < 0:
+        return None, None, f"bad header {raw[:64]!r}"
+    return obj_type, size, None
+
+
+def _check_packed(pack_path: str, object_ids: list) -> list:
+    try:
+        pack = Pack(pack_path)
+    except (OSError, ValueError) as e:
+        return [(object_id, None, f"pack unreadable: {e}", []) for object_id in object_ids]
+    results = []
+    try:
+        for object_id in object_ids:
+            try:
+                obj_type, body = pack.read(object_id)
+            except Exception as e:
+                results.append((object_id, None, f"packed entry unreadable: {e}", []))
+                continue
+            digest = hashlib.sha256(make_header(obj_type, body) + body).hexdigest()
+            if digest != object_id:
+                results.append((object_id, obj_type, f"content hashes to {digest}", []))
+                continue
+            results.append(_references(object_id, obj_type, body if obj_type in REFERRING_TYPES else b""))
+    finally:
+        pack.close()
+    return results
+
+
+def _check_pack_file(pack_path: str):
+    #The pack's trailer is the sha256 of everything before it
+    hasher = hashlib.sha256()
+    try:
+        with open(pack_path, "rb") as f:
+            remaining = os.fstat(f.fileno()).st_size - 32
+            if remaining < 0:
+                return f"pack {os.path.basename(pack_path)} is truncated"
+            while remaining:
+                data = f.read(min(CHUNK_SIZE * 16, remaining))
+                if not data:
+                    return f"pack {os.path.basename(pack_path)} is truncated"
+                hasher.update(data)
+                remaining -= len(data)
+            trailer = f.read(32)
+    except OSError as e:
+        return f"pack {os.path.basename(pack_path)} unreadable: {e}"
+    if hasher.digest() != trailer:
+        return f"pack {os.path.basename(pack_path)} doesn't match its checksum"
+    return None
+
+
+def _references(object_id: str, obj_type: str, body: bytes) -> tuple:
+    #Returns the finding for an intact object, with the objects it points to
+    from mini_git.tree import Tree
+    from mini_git.commit import Commit
+    try:
+        if obj_type == "tree":
+            children = Tree._parse_binary(object_id, body) if body[:1] == b"\0" else Tree._parse_text(body)
+            refs = [(sha, entry_type) for entry_type, _, sha in children]
+        elif obj_type == "commit":
+            commit = Commit._parse(object_id, make_header("commit", body) + body)
+            refs = [(commit.tree_sha, "tree")]
+            if commit.parent_sha:
+                refs.append((commit.parent_sha, "commit"))
+        elif obj_type == "manifest":
+            refs = [(sha, "blob") for sha, _ in parse_manifest(body)]
+        else:
+            refs = []
+    except Exception as e:
+        return object_id, obj_type, f"{obj_type} can't be parsed: {e!r}", []
+    return object_id, obj_type, None, refs
@@ -0,0 +1,259 @@
+'''
+Binary staging index for my mini-git
+
+Records the stat data and sha of every tracked file, so files whose stat data hasn't
+changed since they were last hashed are never read again.
+
+Layout:
+    b"MGIX" | version (u32) | entry count (u32)
+    entries, sorted by path:
+        mtime_ns (i64) | ctime_ns (i64) | size (u64) | inode (u64) | mode (u32)
+        | sha (32 raw bytes) | flags (u8) | path length (u16) | utf-8 path
+    trailer: sha256 of everything above
+
+Contains:
+    - IndexEntry, Index
+'''
+import os
+import struct
+import hashlib
+import tempfile
+
+
+MAGIC = b"MGIX"
+VERSION = 1
+HEADER = struct.Struct(">4sII")
+ENTRY = struct.Struct(">qqQQI32sBH")
+
+#Entry flags
+STAGED = 1
+REMOVED = 2
+
+
+class IndexEntry:
+    '''
+    One tracked file, paths are relative to the repo root and always use "/"
+    '''
+    __slots__ = ("path", "mtime_ns", "ctime_ns", "size", "ino", "mode", "object_id", "flags")
+
+    def __init__(self, path: str, mtime_ns: int, ctime_ns: int, size: int, ino: int, mode: int, object_id: str, flags: int = 0):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.ctime_ns = ctime_ns
+        self.size = size
+        self.ino = ino
+        self.mode = mode
+        self.object_id = object_id
+        self.flags = flags
+
+    @classmethod
+    def from_stat(cls, path: str, st: os.stat_result, object_id: str, flags: int = 0) -> "IndexEntry":
+        return cls(path, st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino, st.st_mode, object_id, flags)
+
+    def matches(self, st: os.stat_result) -> bool:
+        '''
+        True if the stat data says the file is the one that was hashed
+        '''
+        return (self.mtime_ns == st.st_mtime_ns and self.ctime_ns == st.st_ctime_ns
+                and self.size == st.st_size and self.ino == st.st_ino)
+
+    @property
+    def staged(self) -> bool:
+        return bool(self.flags & STAGED)
+
+    @property
+    def removed(self) -> bool:
+        return bool(self.flags & REMOVED)
+
+    def __repr__(self):
+        return f"IndexEntry({self.path!r}, {self.object_id[:10]}, flags={self.flags})"
+
+
+class Index:
+    '''
+    The staging index of a repo, loaded from and saved to .minigit/index
+
+    Init
+    ----
+    :root(str): the repo's directory
+    '''
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, ".minigit", "index")
+        self.entries = {}
+        #mtime of the index file when it was loaded, files changed after it may be racy
+        self.timestamp = 0
+        self.load()
+
+    def load(self) -> None:
+        '''
+        Reads the index from disk, an empty or missing index has no entries
+
+        Raises:
+            ValueError: if the index is corrupt
+        '''
+        self.entries = {}
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+                self.timestamp = os.fstat(f.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if not data:
+            return
+
+        if not data.startswith(MAGIC):
+            self._load_text(data)
+            return
+
+        if hashlib.sha256(data[:-32]).digest() != data[-32:]:
+            raise ValueError(f"Corrupt index, checksum mismatch: {self.index_path}")
+        _, version, count = HEADER.unpack_from(data, 0)
+        if version != VERSION:
+            raise ValueError(f"Unsupported index version {version}: {self.index_path}")
+
+        pos = HEADER.size
+        for _ in range(count):
+            mtime_ns, ctime_ns, size, ino, mode, raw_sha, flags, path_len = ENTRY.unpack_from(data, pos)
+            pos += ENTRY.size
+            path = data[pos:pos + path_len].decode("utf-8")
+            pos += path_len
+            self.entries[path] = IndexEntry(path, mtime_ns, ctime_ns, size, ino, mode, raw_sha.hex(), flags)
+
+    def _load_text(self, data: bytes) -> None:
+        #Older repos staged "type path sha" lines, directories expand into their files
+        from mini_git.tree import Tree
+        from mini_git.object_store import ObjectStore
+        store = ObjectStore.open(self.root)
+
+        def expand(tree_sha, prefix):
+            for entry_type, name, sha in Tree.load(tree_sha, store).children:
+                if entry_type == "tree":
+                    expand(sha, f"{prefix}/{name}")
+                else:
+                    self._staged_without_stat(f"{prefix}/{name}", sha)
+
+        for line in data.decode("utf-8").splitlines():
+            entry_type, path, sha = line.split(" ", 2)
+            path = normalize_path(path)
+            if entry_type == "tree":
+                expand(sha, path)
+            else:
+                self._staged_without_stat(path, sha)
+
+    def _staged_without_stat(self, path: str, object_id: str) -> None:
+        #Zeroed stat data never matches, so the file is re-hashed the next time it's seen
+        self.entries[path] = IndexEntry(path, 0, 0, 0, 0, 0, object_id, STAGED)
+
+    def save(self) -> None:
+        '''
+        Writes the index to disk, atomically replacing the old one
+        '''
+        data = bytearray(HEADER.pack(MAGIC, VERSION, len(self.entries)))
+        for path in sorted(self.entries):
+            entry = self.entries[path]
+            raw_path = path.encode("utf-8")
+            data += ENTRY.pack(entry.mtime_ns, entry.ctime_ns, entry.size, entry.ino, entry.mode,
+                               bytes.fromhex(entry.object_id), entry.flags, len(raw_path))
+            data += raw_path
+        data += hashlib.sha256(data).digest()
+
+        parent_dir = os.path.dirname(self.index_path)
+        os.makedirs(parent_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_index_", dir=parent_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, path: str):
+        return self.entries.get(path)
+
+    def is_fresh(self, path: str, st: os.stat_result):
+        '''
+        Returns the entry for path if its stat data still matches, otherwise None
+
+        A file modified in the same instant the index was written can't be trusted,
+        since a later change might not move its mtime, so it counts as changed.
+        '''
+        entry = self.entries.get(path)
+        if entry is None or entry.removed or not entry.matches(st):
+            return None
+        if entry.mtime_ns >= self.timestamp:
+            return None
+        return entry
+
+    def update(self, path: str, st: os.stat_result, object_id: str) -> IndexEntry:
+        '''
+        Records the hashed file, staging it when its content differs from what was tracked
+        '''
+        old = self.entries.get(path)
+        flags = 0
+        if old is None or old.removed or old.object_id != object_id:
+            flags = STAGED
+        elif old.staged:
+            flags = old.flags
+        entry = IndexEntry.from_stat(path, st, object_id, flags)
+        self.entries[path] = entry
+        return entry
+
+    def record(self, path: str, st: os.stat_result, object_id: str) -> IndexEntry:
+        '''
+        Records a file as matching the committed tree, with nothing staged
+        '''
+        entry = IndexEntry.from_stat(path, st, object_id)
+        self.entries[path] = entry
+        return entry
+
+    def forget(self, path: str) -> None:
+        '''
+        Drops a path from the index without staging its removal
+        '''
+        self.entries.pop(path, None)
+
+    def remove(self, path: str) -> None:
+        '''
+        Stages the removal of a tracked file
+        '''
+        entry = self.entries.get(path)
+        if entry is not None:
+            entry.flags = STAGED | REMOVED
+
+    def tracked(self, prefix: str = ""):
+        '''
+        Yields entries that are part of the next commit, optionally only under a dir
+        '''
+        for path, entry in self.entries.items():
+            if not entry.removed and in_dir(path, prefix):
+                yield entry
+
+    def staged(self) -> list[IndexEntry]:
+        return [entry for entry in self.entries.values() if entry.staged]
+
+    def clear_staged(self) -> None:
+        '''
+        Marks everything as committed, dropping entries whose removal was staged
+        '''
+        for path in [path for path, entry in self.entries.items() if entry.removed]:
+            del self.entries[path]
+        for entry in self.entries.values():
+            entry.flags = 0
+
+
+def normalize_path(path: str) -> str:
+    '''
+    Turns a relative path into the "/"-separated form the index uses
+    '''
+    path = os.path.normpath(path).replace(os.sep, "/")
+    return "" if path == "." else path
+
+
+def in_dir(path: str, prefix: str) -> bool:
+    '''
+    True if a normalized path is the prefix itself or sits somewhere under it
+    '''
+    return not prefix or path == prefix or path.startswith(prefix + "/")
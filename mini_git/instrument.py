@@ -0,0 +1,170 @@
+'''
+Counters and timings for object I/O
+
+Off by default. While off, an instrumented function costs one check of a module flag
+and count() returns straight away. The few calls too cheap for even that (hashing a
+small object, a cache hit) check `instrument.enabled` inline before doing anything.
+
+Once enabled it records how many objects were read and written, the bytes hashed,
+read and written, the file system calls made while doing so, and the time spent in
+each phase (hashing, writing, reading, loading, validating, installing, syncing).
+Phase times are inclusive, a load that has to read its object counts in both, and
+loads are only timed when they miss the cache.
+
+Hooks are called with (kind, name, value) for every event, kind being "count" or
+"time", so the numbers can be forwarded to a metrics system as they happen.
+
+Usage:
+    from mini_git import instrument
+
+    with instrument.recording():
+        repo.commit("me", "message")
+    print(instrument.snapshot())
+
+Contains:
+    - enable(), disable(), reset(), snapshot(), recording()
+    - add_hook(), remove_hook(), count(), record_time(), timer(), instrumented()
+'''
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+
+#Read directly by the instrumented code, call enable()/disable() to change it
+enabled = False
+
+_lock = threading.Lock()
+_counters = {}
+#name -> [calls, seconds]
+_timings = {}
+_hooks = []
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+    '''
+    Clears every counter and timing, hooks are kept
+    '''
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def snapshot() -> dict:
+    '''
+    Returns a copy of what's been recorded so far
+
+    Returns:
+        {"counters": {name: value}, "timings": {name: {"calls": int, "seconds": float}}}
+    '''
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "timings": {name: {"calls": calls, "seconds": seconds}
+                        for name, (calls, seconds) in sorted(_timings.items())},
+        }
+
+
+@contextmanager
+def recording(hook=None):
+    '''
+    Records from a clean slate for the length of the block
+
+    Args:
+        hook: optional hook registered for the block only
+    '''
+    was_enabled = enabled
+    reset()
+    if hook is not None:
+        add_hook(hook)
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+        if hook is not None:
+            remove_hook(hook)
+
+
+def add_hook(hook) -> None:
+    '''
+    Registers a callable taking (kind, name, value), called on every event while enabled
+    '''
+    with _lock:
+        if hook not in _hooks:
+            _hooks.append(hook)
+
+
+def remove_hook(hook) -> None:
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def count(name: str, value: int = 1) -> None:
+    '''
+    Adds to a counter, does nothing while disabled
+    '''
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        hooks = list(_hooks)
+    for hook in hooks:
+        hook("count", name, value)
+
+
+def record_time(name: str, seconds: float) -> None:
+    '''
+    Adds one call of the given length to a phase's timing, does nothing while disabled
+    '''
+    if not enabled:
+        return
+    with _lock:
+        timing = _timings.setdefault(name, [0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        hooks = list(_hooks)
+    for hook in hooks:
+        hook("time", name, seconds)
+
+
+@contextmanager
+def timer(name: str):
+    '''
+    Times a block under a phase name, for code that has already checked `enabled`
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+
+def instrumented(name: str):
+    '''
+    Decorator timing every call of a function under a phase name
+    '''
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,273 @@
+'''
+Sorted index of loose object names, for resolving abbreviated shas
+
+Every install appends the new names to a journal, objects/info/names-journal, with one
+O_APPEND write per batch, so the write path never rewrites anything. Once the journal
+passes JOURNAL_LIMIT names, the next lookup merges it into the main file,
+objects/info/names, which is sorted and fanout-indexed like a pack .idx. A lookup is a
+binary search of the mapped main file plus a scan of the short journal, so it stays
+O(log n) however many objects there are. Packed objects are found through their own .idx.
+
+Only one process or thread merges at a time, holding objects/info/names.lock. Anyone
+else finding it held skips the merge and scans the journal, a lock older than
+LOCK_STALE seconds is taken to be left by a crash and is broken.
+
+Main file layout:
+    b"MNIX" | version (u32) | count (u32)
+    fanout: 256 x u32, entry i = number of names whose first byte is <= i
+    names: count x 32-byte raw sha, sorted
+    trailer: sha256 of everything above
+
+The index may name objects a gc has since removed, callers check the candidates exist.
+
+Contains:
+    - AmbiguousObjectName, prefix_bounds(), names_in_range(), append_names(), NameIndex
+'''
+import os
+import mmap
+import struct
+import time
+import hashlib
+import tempfile
+
+from mini_git.utils import build_fanout, fanout_lower_bound
+
+
+MAGIC = b"MNIX"
+VERSION = 1
+HEADER = struct.Struct(">4sII")
+FANOUT = struct.Struct(">256I")
+SHA_LEN = 32
+
+#Journal names merged into the main file on the next lookup past this many
+JOURNAL_LIMIT = 1024
+#Shortest prefix accepted, as in git
+MIN_PREFIX = 4
+#Seconds after which a merge lock is taken to be left behind by a crash
+LOCK_STALE = 60
+
+
+class AmbiguousObjectName(ValueError):
+    '''
+    Raised when a short sha matches more than one object
+
+    Init
+    ----
+    :prefix(str): the short sha
+    :candidates(list[str]): the object ids it matches
+    '''
+
+    def __init__(self, prefix: str, candidates: list):
+        self.prefix = prefix
+        self.candidates = candidates
+        super().__init__(f"Short sha {prefix} is ambiguous, it matches {', '.join(sorted(candidates))}")
+
+
+def prefix_bounds(prefix: str) -> tuple[bytes, bytes]:
+    '''
+    Returns the lowest and highest raw shas starting with a hex prefix
+
+    Raises:
+        ValueError: if the prefix isn't hex, or is shorter than MIN_PREFIX or longer than a sha
+    '''
+    prefix = prefix.lower()
+    if not MIN_PREFIX <= len(prefix) <= 2 * SHA_LEN or any(c not in "0123456789abcdef" for c in prefix):
+        raise ValueError(f"Not a sha or a short sha of at least {MIN_PREFIX} hex digits: {prefix}")
+    pad = 2 * SHA_LEN - len(prefix)
+    return bytes.fromhex(prefix + "0" * pad), bytes.fromhex(prefix + "f" * pad)
+
+
+def names_in_range(fanout, name_at, low: bytes, high: bytes, limit: int) -> list:
+    '''
+    Returns up to limit sorted raw names between low and high (inclusive)
+
+    Args:
+        fanout: the 256 cumulative bucket counts of a sorted name table
+        name_at: callable returning the raw name at a position
+    '''
+    lo = fanout_lower_bound(fanout, name_at, low)
+    found = []
+    end = fanout[high[0]]
+    while lo < end and len(found) < limit:
+        name = name_at(lo)
+        if name > high:
+            break
+        found.append(name)
+        lo += 1
+    return found
+
+
+def _journal_path(objects_path: str) -> str:
+    return os.path.join(objects_path, "info", "names-journal")
+
+
+def append_names(objects_path: str, object_ids) -> None:
+    '''
+    Records newly installed objects in the journal, one append for all of them
+    '''
+    data = b"".join(bytes.fromhex(object_id) for object_id in object_ids)
+    if not data:
+        return
+    path = _journal_path(objects_path)
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    while True:
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, flags, 0o644)
+        try:
+            os.write(fd, data)
+            written = os.fstat(fd)
+        finally:
+            os.close(fd)
+        #A merge may have moved the journal aside, and read it, before the write landed.
+        #Still in place means any later merge reads it, otherwise the names go in again
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if (current.st_dev, current.st_ino) == (written.st_dev, written.st_ino):
+            return
+
+
+def _read_journal(path: str) -> set:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return set()
+    #A torn last append is ignored, the object it named is still found by a rebuild
+    usable = len(data) - len(data) % SHA_LEN
+    return {data[i:i + SHA_LEN] for i in range(0, usable, SHA_LEN)}
+
+
+class NameIndex:
+    '''
+    The name index of one objects directory
+
+    Init
+    ----
+    :objects_path(str): the repo's objects directory
+    '''
+
+    def __init__(self, objects_path: str):
+        self.objects_path = objects_path
+        self.main_path = os.path.join(objects_path, "info", "names")
+        self.journal_path = _journal_path(objects_path)
+        self.lock_path = self.main_path + ".lock"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.main_path)
+
+    def match(self, prefix: str, limit: int = 16) -> list:
+        '''
+        Returns up to limit object ids starting with prefix, sorted
+
+        Raises:
+            ValueError: if the prefix isn't valid hex
+        '''
+        low, high = prefix_bounds(prefix)
+        journal = self._journal_names()
+        if len(journal) > JOURNAL_LIMIT and self._merge():
+            journal = self._journal_names()
+
+        found = set(name for name in journal if low <= name <= high)
+        try:
+            f = open(self.main_path, "rb")
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, version, count = HEADER.unpack_from(mapped, 0)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"Not a supported name index: {self.main_path}")
+                fanout = FANOUT.unpack_from(mapped, HEADER.size)
+                names_at = HEADER.size + FANOUT.size
+                name_at = lambda i: mapped[names_at + i * SHA_LEN:names_at + (i + 1) * SHA_LEN]
+                found.update(names_in_range(fanout, name_at, low, high, limit))
+        return [name.hex() for name in sorted(found)[:limit]]
+
+    def rebuild(self, object_ids) -> None:
+        '''
+        Replaces the main file with the given names plus whatever the journal holds
+
+        Skipped if another merge holds the lock, the index may only ever name too many
+        objects, never too few.
+        '''
+        self._merge(set(bytes.fromhex(object_id) for object_id in object_ids))
+
+    def _journal_names(self) -> set:
+        return _read_journal(self.journal_path) | _read_journal(self.journal_path + ".merging")
+
+    def _merge(self, base: set = None) -> bool:
+        #Returns False, having done nothing, when another merge holds the lock
+        if not self._lock():
+            return False
+        try:
+            #A .merging left by a crashed merge is read before the journal is moved onto it,
+            #names appended meanwhile go to a fresh journal
+            merging = self.journal_path + ".merging"
+            journal = _read_journal(merging)
+            try:
+                os.replace(self.journal_path, merging)
+            except FileNotFoundError:
+                pass
+            journal |= _read_journal(merging)
+            if base is None:
+                #Read under the lock, so the last merge's names are kept
+                base = set(self._main_names())
+            _write_main(self.main_path, base | journal)
+            try:
+                os.remove(merging)
+            except FileNotFoundError:
+                pass
+        finally:
+            os.remove(self.lock_path)
+        return True
+
+    def _lock(self) -> bool:
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        for _ in range(2):
+            try:
+                os.close(os.open(self.lock_path, flags, 0o644))
+                return True
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(self.lock_path).st_mtime < LOCK_STALE:
+                        return False
+                    os.remove(self.lock_path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _main_names(self) -> list:
+        try:
+            with open(self.main_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        count = HEADER.unpack_from(data, 0)[2]
+        start = HEADER.size + FANOUT.size
+        return [data[i:i + SHA_LEN] for i in range(start, start + count * SHA_LEN, SHA_LEN)]
+
+
+def _write_main(main_path: str, names: set) -> None:
+    names = sorted(names)
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(names)))
+    data += FANOUT.pack(*build_fanout(names))
+    data += b"".join(names)
+    data += hashlib.sha256(data).digest()
+
+    parent_dir = os.path.dirname(main_path)
+    os.makedirs(parent_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_names_", dir=parent_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, main_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
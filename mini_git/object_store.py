@@ -0,0 +1,483 @@
+'''
+Per-repository object store for my mini-git
+
+Everything needed to read and write the objects of one repo lives on its ObjectStore:
+where the objects are, the codec they're written with, the open packs, the object cache
+and the write batch. Loaders and writers are handed the store, so one process can work
+on many repos at once, from any number of threads, without a process-wide setting.
+
+Contains:
+    - ObjectStore, default_store()
+'''
+import os
+import copy
+import hashlib
+import weakref
+import threading
+from contextlib import contextmanager
+
+from mini_git import instrument
+from mini_git.utils import CHUNK_SIZE, make_header, make_header_from_size, read_object_file, read_object_header
+from mini_git.config import get_flag, get_setting
+from mini_git.chunking import parse_manifest
+from mini_git.body import open_body
+from mini_git.compression import get_codec, compress, compressor, decompressor, detect_codec
+from mini_git.pack import PackSet
+from mini_git.cache import ObjectCache, DEFAULT_MAX_BYTES
+from mini_git.batch import WriteBatch, new_temp_object, install_object
+
+
+class ObjectStore:
+    '''
+    The objects of one repo, and the state used to read and write them
+
+    ObjectStore.open() hands out one store per repo, so every Repository (and every
+    thread) working on the same repo shares its cache and open packs. Stores are only
+    weakly held there, once nothing uses a repo its cache and packs are freed.
+
+    Init
+    ----
+    :base_dir(str): the repo's directory, the one holding .minigit
+    :cache_bytes(int): byte budget of the object cache, 0 turns it off
+    '''
+
+    #Stores handed out by open() and still in use, keyed by the repo's absolute path
+    _open = weakref.WeakValueDictionary()
+    _open_lock = threading.Lock()
+
+    def __init__(self, base_dir: str, cache_bytes: int = DEFAULT_MAX_BYTES):
+        self.base_dir = base_dir
+        self.objects_path = os.path.join(base_dir, ".minigit", "objects")
+        self.cache = ObjectCache(cache_bytes)
+        self.packs = PackSet(os.path.join(self.objects_path, "pack"))
+        #Only set on the store handed out by batch()
+        self.write_batch = None
+        self._identity = _dir_identity(self.objects_path)
+        self.reload_config()
+
+    @classmethod
+    def open(cls, base_dir: str, cache_bytes: int = None) -> "ObjectStore":
+        '''
+        Returns the shared store of the repo at base_dir, creating it on first use
+
+        :cache_bytes: resizes the store's cache when given
+        '''
+        key = os.path.abspath(base_dir)
+        identity = _dir_identity(os.path.join(base_dir, ".minigit", "objects"))
+        with cls._open_lock:
+            store = cls._open.get(key)
+            #A repo deleted and made again at the same path starts over with a new store
+            if store is None or store._identity != identity:
+                store = cls._open[key] = cls(base_dir, DEFAULT_MAX_BYTES if cache_bytes is None else cache_bytes)
+                return store
+        if cache_bytes is not None and cache_bytes != store.cache.max_bytes:
+            store.cache.resize(cache_bytes)
+        return store
+
+    @classmethod
+    def for_path(cls, path: str) -> "ObjectStore":
+        '''
+        Returns the store of the repo a working file or directory sits in
+
+        Falls back to default_store() when path isn't inside a repo.
+        '''
+        current = os.path.abspath(path)
+        while True:
+            if os.path.isdir(os.path.join(current, ".minigit")):
+                return cls.open(current)
+            parent = os.path.dirname(current)
+            if parent == current:
+                return default_store()
+            current = parent
+
+    def __reduce__(self):
+        #Process pool workers open the repo's store themselves, the batch stays behind,
+        #they write through staged() and hand their temp files back
+        return (ObjectStore.open, (self.base_dir,))
+
+    def __copy__(self):
+        #A view sharing the cache and packs, batch() gives it its own write_batch
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        return view
+
+    def reload_config(self) -> None:
+        '''
+        Re-reads the codec and durability settings from the repo's config
+        '''
+        self.codec, self.level = get_codec(self.base_dir)
+        self.durable = get_flag(self.base_dir, "fsync")
+        self.chunk_threshold = int(get_setting(self.base_dir, "chunk_threshold"))
+
+    def path_for(self, object_id: str) -> str:
+        '''
+        Returns where the loose copy of an object lives
+        '''
+        return os.path.join(self.objects_path, object_id[:2], object_id[2:])
+
+    def __contains__(self, object_id: str) -> bool:
+        if self.write_batch is not None and object_id in self.write_batch:
+            return True
+        if os.path.exists(self.path_for(object_id)):
+            return True
+        return any(object_id in pack for pack in self.packs.get())
+
+    @contextmanager
+    def batch(self):
+        '''
+        Yields a store whose writes all go into one WriteBatch
+
+        Pass the yielded store to the writers, batch() on it joins the same batch.
+        Everything is installed when the block ends, nothing if it raises.
+        '''
+        if self.write_batch is not None:
+            yield self
+            return
+
+        batched = copy.copy(self)
+        batched.write_batch = WriteBatch(self.objects_path, self.durable, self.packs)
+        try:
+            yield batched
+        except BaseException:
+            batched.write_batch.abort()
+            raise
+        batched.write_batch.commit()
+
+    @contextmanager
+    def staged(self):
+        '''
+        Yields a store whose writes are left in temp files, for another batch to install
+
+        For process pool workers, which can't join the parent's batch: a worker hands
+        back write_batch.pending and the parent passes it to its own WriteBatch.adopt().
+        Nothing is left behind if the block raises.
+        '''
+        staging = copy.copy(self)
+        staging.write_batch = WriteBatch(self.objects_path, self.durable)
+        try:
+            yield staging
+        except BaseException:
+            staging.write_batch.abort()
+            raise
+
+    @instrument.instrumented("write")
+    def write(self, object_id: str, obj_bytes: bytes) -> None:
+        '''
+        Writes a whole object (header + body), compressed with the repo's codec
+
+        Args:
+            object_id(str): the sha256 as a string
+            obj_bytes(bytes): combined header + content
+
+        Raises:
+            IOError: if the object cannot be written
+        '''
+        #Loose, packed or pending in the batch, a repack mustn't lead to a loose copy again
+        instrument.count("syscalls.stat")
+        if object_id in self:
+            return
+
+        tmp_path = None
+        try:
+            out, tmp_path = new_temp_object(self.objects_path)
+            with out:
+                stored = compress(obj_bytes, self.codec, self.level)
+                out.write(stored)
+                self._finish(object_id, out, tmp_path)
+            tmp_path = None
+            instrument.count("objects_written")
+            instrument.count("bytes_written", len(stored))
+        except OSError as e:
+            raise IOError(f"Could not write ojbect to disk: {self.path_for(object_id)}\n{e}") from e
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @instrument.instrumented("write")
+    def write_stream(self, tag: str, file_path: str, chunk_size: int = CHUNK_SIZE) -> str:
+        '''
+        Hashes and stores a file as an object in fixed-size chunks, reading it only once
+
+        The object is written to a temp file while it is hashed, then renamed into
+        place once the sha is known (or once the batch ends).
+
+        Args:
+            tag(str): Obj type (blob)
+            file_path(str): the file being stored
+            chunk_size(int): bytes read per chunk
+
+        Raises:
+            FileNotFoundError: if the file does not exist
+            ValueError: if the file is empty, or changed size while being read
+            IOError: if the file cannot be read or the object cannot be written
+
+        Returns:
+            Object ID (str)
+        '''
+        instrument.count("syscalls.stat")
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File does not exist: {file_path}")
+
+        instrument.count("syscalls.open")
+        try:
+            src = open(file_path, "rb")
+        except OSError as e:
+            raise IOError(f"File cannot be read, Path = {file_path} \n Exception = {e}") from e
+
+        tmp_path = None
+        try:
+            with src:
+                #The header needs the length up front, so take it from the open handle
+                size = os.fstat(src.fileno()).st_size
+                if size == 0:
+                    raise ValueError(f"File is empty, Path: {file_path}")
+
+                header = make_header_from_size(tag, size)
+                hasher = hashlib.sha256(header)
+                #The sha is always of the uncompressed bytes, only what's written is compressed
+                packer = compressor(self.codec, self.level)
+
+                out, tmp_path = new_temp_object(self.objects_path)
+                with out:
+                    out.write(packer.compress(header))
+                    written = 0
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        out.write(packer.compress(chunk))
+                        written += len(chunk)
+                    out.write(packer.flush())
+
+                    if written != size:
+                        raise ValueError(f"File changed while being read, Path: {file_path}")
+
+                    obj_id = hasher.hexdigest()
+                    stored = out.tell()
+                    instrument.count("bytes_hashed", len(header) + size)
+                    #Only known once it's hashed, the temp copy is dropped below
+                    if obj_id in self:
+                        return obj_id
+                    self._finish(obj_id, out, tmp_path)
+            tmp_path = None
+            instrument.count("objects_written")
+            instrument.count("bytes_written", stored)
+            return obj_id
+        except OSError as e:
+            raise IOError(f"Could not write object to disk for: {file_path}\n{e}") from e
+        finally:
+            #Never leave a half-written temp object behind
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _finish(self, object_id: str, out, tmp_path: str) -> None:
+        #Hands a written temp object to the batch, or fsyncs and installs it on its own
+        if self.write_batch is not None:
+            out.close()
+            self.write_batch.add(object_id, tmp_path)
+            return
+
+        if self.durable:
+            out.flush()
+            os.fsync(out.fileno())
+            instrument.count("syscalls.fsync")
+        out.close()
+        install_object(self.objects_path, object_id, tmp_path, self.durable)
+
+    @instrument.instrumented("read")
+    def read_raw(self, object_id: str) -> bytes:
+        '''
+        Returns the decoded header + body of an object, from a pack or a loose file
+
+        Args:
+            object_id(str): a SHA256 in str
+
+        Raises:
+            FileNotFoundError: if the object is in neither
+        '''
+        #Objects written by a batch that hasn't ended yet are only in their temp files
+        if self.write_batch is not None:
+            tmp_path = self.write_batch.pending.get(object_id)
+            if tmp_path is not None:
+                try:
+                    raw = read_object_file(tmp_path)
+                    instrument.count("objects_read")
+                    return raw
+                except FileNotFoundError:
+                    #Installed while we looked, read it from its real place below
+                    pass
+
+        #Packs are checked first, they hold most objects once a repo has been repacked
+        path = self.path_for(object_id)
+        for refresh in (False, True):
+            for pack in self.packs.get(refresh):
+                found = pack.read(object_id)
+                if found is not None:
+                    obj_type, body = found
+                    instrument.count("objects_read")
+                    return make_header(obj_type, body) + body
+            try:
+                raw = read_object_file(path)
+            except FileNotFoundError:
+                #A repack may have moved it since the packs were loaded, look once more
+                continue
+            instrument.count("objects_read")
+            return raw
+
+        raise FileNotFoundError(f"File does not exist: {path}")
+
+    def read_header(self, object_id: str) -> tuple[str, int]:
+        '''
+        Returns an object's (type, size) without reading its body
+
+        Raises:
+            FileNotFoundError: if the object doesn't exist
+        '''
+        if self.write_batch is not None:
+            tmp_path = self.write_batch.pending.get(object_id)
+            if tmp_path is not None:
+                try:
+                    return read_object_header(tmp_path)
+                except FileNotFoundError:
+                    pass
+        for refresh in (False, True):
+            for pack in self.packs.get(refresh):
+                found = pack.read_header(object_id)
+                if found is not None:
+                    return found
+            try:
+                return read_object_header(self.path_for(object_id))
+            except FileNotFoundError:
+                continue
+        raise FileNotFoundError(f"File does not exist: {self.path_for(object_id)}")
+
+    def iter_body(self, object_id: str, chunk_size: int = CHUNK_SIZE):
+        '''
+        Yields the body of an object in chunks, a loose object is never held in memory whole
+
+        A chunked blob's manifest is followed, yielding the file's content one chunk
+        object at a time. A packed object comes out in one piece, rebuilding a delta
+        needs all of it.
+
+        Raises:
+            FileNotFoundError: if the object doesn't exist
+        '''
+        parts = self._iter_object(object_id, chunk_size)
+        if next(parts) != "manifest":
+            yield from parts
+            return
+        for chunk_id, _ in parse_manifest(b"".join(parts)):
+            yield from self._iter_object(chunk_id, chunk_size, skip_type=True)
+
+    def open_body(self, object_id: str, chunk_size: int = CHUNK_SIZE):
+        '''
+        Opens an object's body as a read-only file object, see mini_git.body
+
+        An uncompressed loose object is memory-mapped and its getbuffer() is a view of
+        the file, anything else is streamed. A chunked blob reads as the whole file.
+
+        Raises:
+            FileNotFoundError: if the object doesn't exist
+        '''
+        return open_body(self, object_id, chunk_size)
+
+    def _iter_object(self, object_id: str, chunk_size: int, skip_type: bool = False):
+        #Yields the object's type (unless skip_type), then its body in pieces
+        path = None
+        if self.write_batch is not None:
+            path = self.write_batch.pending.get(object_id)
+        try:
+            f = open(path or self.path_for(object_id), "rb")
+        except FileNotFoundError:
+            content = self.read_raw(object_id)
+            index = content.index(b"\0")
+            if not skip_type:
+                yield content[:index].split(b" ", 1)[0].decode("ascii")
+            yield content[index + 1:]
+            return
+
+        with f:
+            first = f.read(chunk_size)
+            unpacker = decompressor(detect_codec(first))
+            content = unpacker.decompress(first)
+            #Everything up to the first null is the header
+            while b"\0" not in content:
+                more = f.read(chunk_size)
+                if not more:
+                    raise ValueError(f"Corrupt object, no header found: {object_id}")
+                content += unpacker.decompress(more)
+            index = content.index(b"\0")
+            if not skip_type:
+                yield content[:index].split(b" ", 1)[0].decode("ascii")
+            body = content[index + 1:]
+            if body:
+                yield body
+            while True:
+                more = f.read(chunk_size)
+                if not more:
+                    break
+                body = unpacker.decompress(more)
+                if body:
+                    yield body
+
+    def load(self, object_id: str, cls, parse):
+        '''
+        Loads an object through the cache, reading and parsing it at most once
+
+        Args:
+            object_id(str): a SHA256 in str
+            cls: the class the object must be an instance of
+            parse: callable taking (object_id, content, store) and returning the object
+        '''
+        obj = self.cache.get(object_id)
+        if obj is None:
+            obj = self._load_missing(object_id, parse)
+        elif instrument.enabled:
+            instrument.count("cache_hits")
+        #Same failure as parsing the wrong type from disk
+        assert isinstance(obj, cls), f"Expected {cls.__name__.lower()}, got {type(obj).__name__.lower()}"
+        return obj
+
+    @instrument.instrumented("load")
+    def _load_missing(self, object_id: str, parse):
+        instrument.count("cache_misses")
+        content = self.read_raw(object_id)
+        obj = parse(object_id, content, self)
+        self.cache.put(object_id, obj, len(content))
+        return obj
+
+    def iter_loose(self):
+        '''
+        Yields (object_id, path) for every loose object
+        '''
+        if not os.path.isdir(self.objects_path):
+            return
+        for folder in sorted(os.listdir(self.objects_path)):
+            #Only the two-hex-char fan-out dirs hold objects, skip pack/ and info/
+            folder_path = os.path.join(self.objects_path, folder)
+            if len(folder) != 2 or not os.path.isdir(folder_path):
+                continue
+            for file_name in sorted(os.listdir(folder_path)):
+                if file_name.startswith("tmp_"):
+                    continue
+                yield folder + file_name, os.path.join(folder_path, file_name)
+
+
+def _dir_identity(path: str):
+    #(device, inode) of a directory, None if it doesn't exist
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def default_store() -> ObjectStore:
+    '''
+    The store used when a loader isn't given one
+
+    Taken from the BASE_DIR environment variable, or the working directory, so
+    standalone scripts keep working. Repository never sets it, it passes its own store.
+    '''
+    return ObjectStore.open(os.getenv("BASE_DIR", os.getcwd()))
@@ -0,0 +1,554 @@
+'''
+Packfiles for my mini-git
+
+Bundles many objects into a single .pack file, with similar objects stored as deltas
+against each other, plus a sorted .idx that is memory-mapped and binary-searched.
+
+Pack layout:
+    b"MPCK" | version (u32) | object count (u32)
+    entries: kind (u8) | size (varint) | stored length (varint) | [base sha (32)] | zlib data
+    trailer: sha256 of everything above
+
+Index layout:
+    b"MPIX" | version (u32)
+    fanout: 256 x u32, entry i = number of objects whose first byte is <= i
+    names: count x 32-byte raw sha, sorted
+    offsets: count x u64, offset of each object in the pack
+    trailer: pack checksum (32) | sha256 of everything above (32)
+
+Contains:
+    - create_delta(), apply_delta()
+    - write_pack(), PackIndex, Pack, load_packs(), PackSet
+'''
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import tempfile
+import threading
+
+from mini_git.utils import build_fanout, fanout_search
+from mini_git.name_index import names_in_range
+
+
+PACK_MAGIC = b"MPCK"
+INDEX_MAGIC = b"MPIX"
+VERSION = 1
+
+TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3, "manifest": 4}
+CODE_TYPES = {code: name for name, code in TYPE_CODES.items()}
+#Set on the kind byte when the entry is a delta against the base sha that follows
+DELTA_FLAG = 0x80
+
+SHA_LEN = 32
+FANOUT_SIZE = 256 * 4
+HEADER_SIZE = len(INDEX_MAGIC) + 4
+
+#Block size used to find matching runs when building deltas
+DELTA_BLOCK = 16
+#Only keep a delta when it's at most this fraction of the full object
+DELTA_MAX_RATIO = 0.5
+#Objects bigger than this are stored whole and never used as a base, delta search is
+#pure python and a window of big blobs would take seconds each
+DELTA_MAX_SIZE = 1 << 20
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _decode_varint(data, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def create_delta(base: bytes, target: bytes) -> bytes:
+    '''
+    Creates a delta that rebuilds target from base
+
+    The delta is base size and target size as varints, then a list of instructions:
+        - copy: 0x80 | flags, followed by the offset and size bytes the flags select
+        - insert: 1-127, followed by that many literal bytes
+    '''
+    out = bytearray(_encode_varint(len(base)) + _encode_varint(len(target)))
+
+    #Index every aligned block of the base, keeping the first place each one appears
+    blocks = {}
+    for i in range(0, len(base) - DELTA_BLOCK + 1, DELTA_BLOCK):
+        blocks.setdefault(base[i:i + DELTA_BLOCK], i)
+
+    literal = bytearray()
+    pos = 0
+    end = len(target)
+    while pos < end:
+        offset = blocks.get(target[pos:pos + DELTA_BLOCK]) if end - pos >= DELTA_BLOCK else None
+        if offset is None:
+            literal.append(target[pos])
+            pos += 1
+            continue
+
+        #Grow the match backwards into pending literals, then forwards
+        while literal and offset > 0 and base[offset - 1] == literal[-1]:
+            literal.pop()
+            offset -= 1
+            pos -= 1
+        length = DELTA_BLOCK
+        while pos + length < end and offset + length < len(base) and base[offset + length] == target[pos + length]:
+            length += 1
+
+        _flush_literal(out, literal)
+        _emit_copies(out, offset, length)
+        pos += length
+
+    _flush_literal(out, literal)
+    return bytes(out)
+
+
+def _flush_literal(out: bytearray, literal: bytearray) -> None:
+    for i in range(0, len(literal), 127):
+        piece = literal[i:i + 127]
+        out.append(len(piece))
+        out += piece
+    literal.clear()
+
+
+def _emit_copies(out: bytearray, offset: int, length: int) -> None:
+    #A single copy holds at most 0xFFFFFF bytes, so split long runs
+    while length:
+        size = min(length, 0xFFFFFF)
+        op = 0x80
+        args = bytearray()
+        for i in range(4):
+            byte = (offset >> (8 * i)) & 0xFF
+            if byte:
+                op |= 1 << i
+                args.append(byte)
+        for i in range(3):
+            byte = (size >> (8 * i)) & 0xFF
+            if byte:
+                op |= 1 << (4 + i)
+                args.append(byte)
+        out.append(op)
+        out += args
+        offset += size
+        length -= size
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    '''
+    Rebuilds the target of a delta made by create_delta()
+
+    Raises:
+        ValueError: if the delta doesn't match the base or is corrupt
+    '''
+    base_size, pos = _decode_varint(delta, 0)
+    target_size, pos = _decode_varint(delta, pos)
+    if base_size != len(base):
+        raise ValueError(f"Delta expects a base of {base_size} bytes, got {len(base)}")
+
+    out = bytearray()
+    end = len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (1 << (4 + i)):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + size]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("Corrupt delta, found a zero instruction")
+
+    if len(out) != target_size:
+        raise ValueError(f"Delta produced {len(out)} bytes, expected {target_size}")
+    return bytes(out)
+
+
+def write_pack(pack_dir: str, objects: list[tuple[str, str, int]], read_body, window: int = 10, depth: int = 10, sync=None) -> tuple[str, str]:
+    '''
+    Writes a pack and its index holding the given objects
+
+    Objects are sorted by type and size so similar ones end up next to each other, and each
+    one is tried as a delta against the previous `window` objects of the same type.
+
+    Args:
+        pack_dir(str): directory the pack is written into
+        objects: list of (object_id, type, size)
+        read_body: callable taking an object_id and returning its body bytes
+        window(int): how many previous objects to try as a delta base
+        depth(int): longest allowed chain of deltas
+        sync: callable given the finished temp pack and index paths, to flush them
+            before either is renamed into place
+
+    Returns:
+        (pack_path, idx_path)
+    '''
+    os.makedirs(pack_dir, exist_ok=True)
+    ordered = sorted(objects, key=lambda obj: (TYPE_CODES[obj[1]], -obj[2], obj[0]))
+
+    fd, tmp_pack = tempfile.mkstemp(prefix="tmp_pack_", dir=pack_dir)
+    tmp_idx = None
+    offsets = {}
+    chain_depth = {}
+    recent = []
+    hasher = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            def write(data: bytes) -> None:
+                hasher.update(data)
+                out.write(data)
+
+            write(PACK_MAGIC + struct.pack(">II", VERSION, len(ordered)))
+            pos = len(PACK_MAGIC) + 8
+
+            for object_id, obj_type, size in ordered:
+                body = read_body(object_id)
+                base_id, delta = _best_delta(body, obj_type, recent, chain_depth, depth)
+
+                if delta is not None:
+                    entry = bytes([TYPE_CODES[obj_type] | DELTA_FLAG])
+                    stored = zlib.compress(delta)
+                    tail = bytes.fromhex(base_id)
+                    chain_depth[object_id] = chain_depth[base_id] + 1
+                else:
+                    entry = bytes([TYPE_CODES[obj_type]])
+                    stored = zlib.compress(body)
+                    tail = b""
+                    chain_depth[object_id] = 0
+
+                entry += _encode_varint(len(body)) + _encode_varint(len(stored)) + tail
+                offsets[object_id] = pos
+                write(entry)
+                write(stored)
+                pos += len(entry) + len(stored)
+
+                if window and len(body) <= DELTA_MAX_SIZE:
+                    recent.append((object_id, obj_type, body))
+                    if len(recent) > window:
+                        recent.pop(0)
+
+            checksum = hasher.digest()
+            out.write(checksum)
+
+        name = "pack-" + checksum.hex()
+        pack_path = os.path.join(pack_dir, name + ".pack")
+        idx_path = os.path.join(pack_dir, name + ".idx")
+        tmp_idx = _write_index(idx_path, offsets, checksum)
+        if sync is not None:
+            sync([tmp_pack, tmp_idx])
+        #The index goes first, a pack is only opened once its index is there
+        os.replace(tmp_idx, idx_path)
+        tmp_idx = None
+        os.replace(tmp_pack, pack_path)
+        tmp_pack = None
+    finally:
+        for tmp_path in (tmp_pack, tmp_idx):
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return pack_path, idx_path
+
+
+def _best_delta(body: bytes, obj_type: str, recent: list, chain_depth: dict, depth: int):
+    #Returns (base_id, delta) for the smallest worthwhile delta, or (None, None)
+    if len(body) > DELTA_MAX_SIZE:
+        return None, None
+    best_id, best = None, None
+    limit = len(body) * DELTA_MAX_RATIO
+    for base_id, base_type, base_body in reversed(recent):
+        if base_type != obj_type or chain_depth[base_id] >= depth:
+            continue
+        delta = create_delta(base_body, body)
+        if len(delta) < limit and (best is None or len(delta) < len(best)):
+            best_id, best = base_id, delta
+    return best_id, best
+
+
+def _write_index(idx_path: str, offsets: dict, pack_checksum: bytes) -> str:
+    #Writes the index next to idx_path and returns the temp path, the caller renames it
+    names = sorted(bytes.fromhex(object_id) for object_id in offsets)
+
+    data = bytearray(INDEX_MAGIC + struct.pack(">I", VERSION))
+    data += struct.pack(">256I", *build_fanout(names))
+    for raw in names:
+        data += raw
+    for raw in names:
+        data += struct.pack(">Q", offsets[raw.hex()])
+    data += pack_checksum
+    data += hashlib.sha256(data).digest()
+
+    tmp_path = idx_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return tmp_path
+
+
+class PackIndex:
+    '''
+    A memory-mapped .idx, object lookups are a binary search inside one fanout bucket
+
+    Init
+    ----
+    :idx_path(str): path to the .idx file
+    '''
+
+    def __init__(self, idx_path: str):
+        self.idx_path = idx_path
+        with open(idx_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"Not a pack index: {idx_path}")
+        version, = struct.unpack_from(">I", self._map, len(INDEX_MAGIC))
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported pack index version {version}: {idx_path}")
+
+        self._fanout = struct.unpack_from(">256I", self._map, HEADER_SIZE)
+        self.count = self._fanout[255]
+        self._names_at = HEADER_SIZE + FANOUT_SIZE
+        self._offsets_at = self._names_at + self.count * SHA_LEN
+        checksum_at = self._offsets_at + self.count * 8
+        self.pack_checksum = self._map[checksum_at:checksum_at + SHA_LEN]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _name(self, i: int) -> bytes:
+        start = self._names_at + i * SHA_LEN
+        return self._map[start:start + SHA_LEN]
+
+    def position(self, raw_sha: bytes) -> int:
+        '''
+        Returns the position of a raw sha in the sorted names, or -1
+        '''
+        return fanout_search(self._fanout, self._name, raw_sha)
+
+    def find(self, object_id: str):
+        '''
+        Returns the pack offset of an object, or None if it isn't in this pack
+        '''
+        i = self.position(bytes.fromhex(object_id))
+        if i < 0:
+            return None
+        offset, = struct.unpack_from(">Q", self._map, self._offsets_at + i * 8)
+        return offset
+
+    def names_between(self, low: bytes, high: bytes, limit: int) -> list:
+        '''
+        Returns up to limit raw names between low and high, for resolving short shas
+        '''
+        return names_in_range(self._fanout, self._name, low, high, limit)
+
+    def object_ids(self):
+        '''
+        Yields every object id in the index, in sorted order
+        '''
+        for i in range(self.count):
+            yield self._name(i).hex()
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class Pack:
+    '''
+    Reads objects from a .pack using its .idx
+
+    Init
+    ----
+    :pack_path(str): path to the .pack file, the .idx must sit next to it
+    '''
+
+    #Bases that are used by a lot of deltas get read over and over, keep the last few
+    BASE_CACHE_SIZE = 16
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+        self.index = PackIndex(pack_path[:-len(".pack")] + ".idx")
+        with open(pack_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"Not a pack: {pack_path}")
+        #Packs are shared by every thread using the repo's store
+        self._bases = {}
+        self._bases_lock = threading.Lock()
+
+    def __contains__(self, object_id: str) -> bool:
+        return self.index.find(object_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def object_ids(self):
+        return self.index.object_ids()
+
+    def _entry(self, offset: int):
+        #Returns (type, size, base_id, data_start, data_end) for the entry at offset
+        kind = self._map[offset]
+        size, pos = _decode_varint(self._map, offset + 1)
+        stored_len, pos = _decode_varint(self._map, pos)
+        base_id = None
+        if kind & DELTA_FLAG:
+            base_id = self._map[pos:pos + SHA_LEN].hex()
+            pos += SHA_LEN
+        return CODE_TYPES[kind & ~DELTA_FLAG], size, base_id, pos, pos + stored_len
+
+    def read_header(self, object_id: str):
+        '''
+        Returns (type, size) without inflating anything, or None if not in this pack
+        '''
+        offset = self.index.find(object_id)
+        if offset is None:
+            return None
+        obj_type, size, _, _, _ = self._entry(offset)
+        return obj_type, size
+
+    def read(self, object_id: str):
+        '''
+        Returns (type, body) for an object, or None if it isn't in this pack
+
+        Raises:
+            ValueError: if the entry is corrupt or its base is missing
+        '''
+        offset = self.index.find(object_id)
+        if offset is None:
+            return None
+
+        obj_type, size, base_id, start, end = self._entry(offset)
+        data = zlib.decompress(self._map[start:end])
+        if base_id is not None:
+            base = self._read_base(base_id)
+            data = apply_delta(base, data)
+
+        if len(data) != size:
+            raise ValueError(f"Corrupt pack entry {object_id}: expected {size} bytes, got {len(data)}")
+        return obj_type, data
+
+    def _read_base(self, base_id: str) -> bytes:
+        with self._bases_lock:
+            base = self._bases.get(base_id)
+        if base is not None:
+            return base
+        #Read outside the lock, the base may be a delta itself
+        found = self.read(base_id)
+        if found is None:
+            raise ValueError(f"Delta base {base_id} is missing from {self.pack_path}")
+        base = found[1]
+        with self._bases_lock:
+            if base_id not in self._bases and len(self._bases) >= self.BASE_CACHE_SIZE:
+                self._bases.pop(next(iter(self._bases)))
+            self._bases[base_id] = base
+        return base
+
+    def close(self) -> None:
+        self._map.close()
+        self.index.close()
+        with self._bases_lock:
+            self._bases.clear()
+
+
+def load_packs(pack_dir: str, already_open: dict = None) -> list[Pack]:
+    '''
+    Opens every pack in a directory, newest first
+
+    :already_open: pack path -> Pack, these are reused rather than mapped again
+    '''
+    if not os.path.isdir(pack_dir):
+        return []
+    already_open = already_open or {}
+    found = []
+    for name in os.listdir(pack_dir):
+        if not name.endswith(".pack"):
+            continue
+        path = os.path.join(pack_dir, name)
+        #Stat'ed once, a concurrent repack may remove it at any point
+        try:
+            found.append((os.stat(path).st_mtime, path))
+        except FileNotFoundError:
+            continue
+    found.sort(reverse=True)
+
+    packs = []
+    for _, path in found:
+        if not os.path.exists(path[:-len(".pack")] + ".idx"):
+            continue
+        pack = already_open.get(path)
+        if pack is None:
+            try:
+                pack = Pack(path)
+            except FileNotFoundError:
+                continue
+        packs.append(pack)
+    return packs
+
+
+class PackSet:
+    '''
+    The open packs of one pack directory, loaded on first use and rescanned on demand
+
+    Init
+    ----
+    :pack_dir(str): the directory holding the .pack and .idx files
+    '''
+
+    def __init__(self, pack_dir: str):
+        self.pack_dir = pack_dir
+        self._packs = None
+        self._lock = threading.Lock()
+
+    def get(self, refresh: bool = False) -> list[Pack]:
+        '''
+        Returns the open packs, a refresh only maps packs that weren't open already
+        '''
+        with self._lock:
+            if self._packs is None or refresh:
+                #Packs that vanished are dropped, not closed, a reader may still hold one
+                already_open = {pack.pack_path: pack for pack in self._packs or []}
+                self._packs = load_packs(self.pack_dir, already_open)
+            return self._packs
+
+    def reset(self) -> None:
+        '''
+        Forgets the open packs without closing them, the next get() loads them again
+
+        Readers on other threads may still be reading the old ones, each is unmapped
+        once nothing holds it.
+        '''
+        with self._lock:
+            self._packs = None
+
+    def close(self) -> None:
+        '''
+        Closes every open pack, only safe when no other thread is reading them
+        '''
+        with self._lock:
+            packs, self._packs = self._packs or [], None
+        for pack in packs:
+            pack.close()
@@ -0,0 +1,155 @@
+'''
+Reachability marking for my mini-git
+
+Every known object gets a position in sorted order and a single bit in a bytearray. The
+sorted names are one contiguous buffer of raw shas with a fanout table in front, so
+marking costs about 32 bytes and a bit per object, rather than the hundred-odd bytes
+each entry of a set of hex strings takes. Blobs are marked straight from the trees that
+name them, only their header is read, to find the manifests of chunked files, whose
+chunks are marked without reading.
+
+Contains:
+    - ObjectBitmap, mark_reachable(), manifest_chunks()
+'''
+from mini_git.utils import fanout_search
+from mini_git.tree import Tree
+from mini_git.commit import Commit
+from mini_git.chunking import parse_manifest
+
+
+SHA_LEN = 32
+
+
+class ObjectBitmap:
+    '''
+    One bit per known object
+
+    Objects that weren't known when the bitmap was made (written since) can still be
+    marked, they're kept in a small side set.
+
+    Init
+    ----
+    :object_ids: every object id the bitmap covers, any iterable, it's read only once
+    '''
+
+    def __init__(self, object_ids):
+        #Names are bucketed by first byte as they stream in, then each bucket is sorted
+        #on its own, so only one bucket at a time is ever split into separate objects
+        buckets = [bytearray() for _ in range(256)]
+        for object_id in object_ids:
+            raw_sha = bytes.fromhex(object_id)
+            buckets[raw_sha[0]] += raw_sha
+
+        self._names = bytearray()
+        self._fanout = []
+        for first, bucket in enumerate(buckets):
+            names = {bytes(bucket[i:i + SHA_LEN]) for i in range(0, len(bucket), SHA_LEN)}
+            buckets[first] = None
+            self._names += b"".join(sorted(names))
+            self._fanout.append(len(self._names) // SHA_LEN)
+        self._count = self._fanout[255]
+        self._bits = bytearray((self._count + 7) // 8)
+        self._extra = set()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _name(self, i: int) -> bytes:
+        return self._names[i * SHA_LEN:(i + 1) * SHA_LEN]
+
+    def position(self, object_id: str) -> int:
+        '''
+        Returns the object's position, or -1 if the bitmap doesn't cover it
+        '''
+        return fanout_search(self._fanout, self._name, bytes.fromhex(object_id))
+
+    def mark(self, object_id: str) -> bool:
+        '''
+        Marks an object, returning False if it was already marked
+        '''
+        pos = self.position(object_id)
+        if pos < 0:
+            if object_id in self._extra:
+                return False
+            self._extra.add(object_id)
+            return True
+        byte, bit = divmod(pos, 8)
+        if self._bits[byte] & (1 << bit):
+            return False
+        self._bits[byte] |= 1 << bit
+        return True
+
+    def is_marked(self, object_id: str) -> bool:
+        pos = self.position(object_id)
+        if pos < 0:
+            return object_id in self._extra
+        byte, bit = divmod(pos, 8)
+        return bool(self._bits[byte] & (1 << bit))
+
+    def count(self) -> int:
+        '''
+        Returns how many covered objects are marked
+        '''
+        return sum(bin(byte).count("1") for byte in self._bits)
+
+
+def mark_reachable(store, roots, bitmap: ObjectBitmap) -> list:
+    '''
+    Marks everything reachable from the roots, walking commits and trees
+
+    Objects already marked are not walked again, so a subtree shared by many commits
+    is only read once.
+
+    Args:
+        store: the repo's ObjectStore
+        roots: (object_id, type) pairs to start from, type is "commit", "tree" or "blob"
+        bitmap: the ObjectBitmap to mark in
+
+    Returns:
+        ids of reachable objects that are missing from the store
+    '''
+    missing = []
+    stack = list(roots)
+    while stack:
+        object_id, object_type = stack.pop()
+        if not bitmap.mark(object_id) or object_type == "chunk":
+            continue
+        if object_type == "blob":
+            try:
+                stack.extend((chunk_id, "chunk") for chunk_id in manifest_chunks(store, object_id))
+            except FileNotFoundError:
+                missing.append(object_id)
+            continue
+
+        #Parsed straight from the raw bytes, a full walk shouldn't churn the object cache
+        obj = store.cache.get(object_id)
+        if obj is None:
+            try:
+                raw = store.read_raw(object_id)
+            except FileNotFoundError:
+                missing.append(object_id)
+                continue
+            obj = (Commit if object_type == "commit" else Tree)._parse(object_id, raw, store)
+
+        if object_type == "commit":
+            stack.append((obj.tree_sha, "tree"))
+            if obj.parent_sha:
+                stack.append((obj.parent_sha, "commit"))
+        else:
+            stack.extend((sha, entry_type) for entry_type, _, sha in obj.children)
+    return missing
+
+
+def manifest_chunks(store, object_id: str) -> list:
+    '''
+    Returns the chunk ids of a chunked file's manifest, or [] for a plain blob
+
+    Only the header of a plain blob is read.
+
+    Raises:
+        FileNotFoundError: if the object doesn't exist
+    '''
+    if store.read_header(object_id)[0] != "manifest":
+        return []
+    content = store.read_raw(object_id)
+    return [chunk_id for chunk_id, _ in parse_manifest(content[content.index(b"\0") + 1:])]
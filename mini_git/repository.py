@@ -1,22 +1,50 @@
 import os
+import copy
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 
 
+from mini_git import instrument
 from mini_git.utils import *
+from mini_git.config import write_config, get_flag
+from mini_git.compression import check_codec
+from mini_git.pack import write_pack
+from mini_git.index import Index, normalize_path
+from mini_git.object_store import ObjectStore
+from mini_git.commit_graph import CommitGraph, write_commit_graph, encode_commit_graph_tail, write_commit_graph_tail, date_to_micros, TAIL_LIMIT
+from mini_git.bloom import BloomFile, make_filter, might_contain, write_bloom_file, TAIL_FILTERS
+from mini_git.name_index import NameIndex, AmbiguousObjectName, prefix_bounds
+from mini_git.fsck import loose_jobs, pack_jobs, run_job
+from mini_git.diff import diff_trees
+from mini_git.status import Status, scan_worktree, lookup_path
+from mini_git.checkout import find_conflicts, materialize
+from mini_git.reachability import ObjectBitmap, mark_reachable
+from mini_git.transport import missing_commits, missing_objects, is_fast_forward, send_objects
 
 
 from mini_git.tree import Tree
 from mini_git.blob import Blob
-from mini_git.commit import Commit
+from mini_git.commit import Commit, CommitRecord
 
 
 class Repository:
     '''
         Takes in a dirpath and creates a new repo
 
+        Optionally sets how objects are compressed on disk, and the size from which
+        files are stored as content-defined chunks (chunk_threshold, 0 for never), which
+        are saved in .minigit/config and kept for later opens of the same repo.
+
+        Objects are read and written through the repo's ObjectStore (self.store), which
+        is passed to every loader and writer. Its LRU cache is shared by everything
+        working on the repo, bounded by cache_bytes.
+
         :raises:
-            ValueError: If path is a file
+            ValueError: If path is a file, or the compression codec is unknown
     '''
-    def __init__(self, dir_path: str):
+    def __init__(self, dir_path: str, compression: str = None, compression_level: int = None, cache_bytes: int = None,
+                 chunk_threshold: int = None):
         
         if os.path.isfile(dir_path):
             raise ValueError(f"Path is a file, not a directory: {dir_path}")
@@ -32,10 +60,29 @@ class Repository:
         self.create_head_and_ref(minigit_path)
 
         #ensures the new objects file_path exists
+        is_new = not os.path.isdir(objects)
         os.makedirs(objects, exist_ok=True)
-        #sets the base_dir for the new repo, to catch later
-        os.environ["BASE_DIR"] = dir_path
+        if is_new:
+            #Starts the name index empty, installs keep it up to date from here on
+            NameIndex(objects).rebuild([])
+
+        #Only touch the config when a setting is given, otherwise keep what's there
+        settings = {}
+        if compression is not None:
+            check_codec(compression)
+            settings["compression"] = compression
+        if compression_level is not None:
+            settings["compression_level"] = int(compression_level)
+        if chunk_threshold is not None:
+            settings["chunk_threshold"] = int(chunk_threshold)
+        if settings:
+            write_config(dir_path, **settings)
+
         self.dir_path = dir_path
+        #One store per repo, every Repository opened on the same path shares it
+        self.store = ObjectStore.open(dir_path, cache_bytes)
+        self.store.reload_config()
+        self.cache = self.store.cache
 
     def create_head_and_ref(self, minigit_path):
         '''
@@ -44,53 +91,116 @@ class Repository:
         #Just creates the path at .minigit/refs/heads/
         os.makedirs(os.path.join(minigit_path, "refs", "heads"), exist_ok=True)
         #Creates a new file with the text pointing to the master (made on first commit)
-        with open(os.path.join(minigit_path, "HEAD"), "w") as f:
-            f.write("ref: refs/heads/master")
+        head_path = os.path.join(minigit_path, "HEAD")
+        #An existing repo keeps its HEAD, it may be on another branch or detached
+        if not os.path.exists(head_path):
+            with open(head_path, "w") as f:
+                f.write("ref: refs/heads/master")
     
 
-    def add(self, path: str) -> str:
+    @instrument.instrumented("add")
+    def add(self, path: str, workers: int = None, executor: str = "thread") -> str:
         '''
         Takes in a path, and adds it to the repo
 
+        Files whose stat data matches the index are not read or hashed again, and
+        tracked files under a directory that no longer exist are staged for removal.
+
+        Args:
+            path: file or directory, relative to the repo
+            workers: hash a directory's files across this many threads/processes
+            executor: "thread" or "process"
+
         Returns:
             obj_id(str): returns the object id as a SHA string
         '''
         #Create full path
         full_path = os.path.join(self.dir_path, path)
-        
-        #Validate and create new tree/blob, storing and setting type
-        if os.path.isdir(full_path):
-            validate_directory(full_path)
-            new_sha = Tree(full_path).store()
-            obj_type = "tree"
-        elif os.path.isfile(full_path):
-            validate_file(full_path)
-            new_sha = Blob(full_path).store()
-            obj_type = "blob"
-        else:
-            #Raise error if path is invalid
-            raise ValueError(f"Path is not a File or Dir: {full_path}")
-        
-        #Create the index and store the info
-        new_ind = os.path.join(self.dir_path, ".minigit", "index")
-        
-        #Gets the parent dir
-        parent_dir = os.path.dirname(new_ind)
+        relative_path = normalize_path(os.path.relpath(full_path, self.dir_path))
 
-        #Create the dir if it doesn't exist
-        os.makedirs(parent_dir, exist_ok=True)
+        index = Index(self.dir_path)
 
-        with open(new_ind, "a") as f:
-            f.write(f"{obj_type} {path} {new_sha}\n")
-        
+        #Every object goes into one write batch, the index is saved once they're stored
+        with self.store.batch() as store:
+            #Validate and create new tree/blob, storing and setting type
+            if os.path.isdir(full_path):
+                validate_directory(full_path)
+                seen = self._add_directory(index, full_path, store, workers, executor)
+                for entry in list(index.tracked(relative_path)):
+                    if entry.path not in seen:
+                        index.remove(entry.path)
+                #Build the directory's tree from the index, nothing is re-read
+                entries = [("blob", entry.path[len(relative_path) + 1:] if relative_path else entry.path, entry.object_id)
+                           for entry in index.tracked(relative_path)]
+                new_sha = Tree.from_index(full_path, entries, store).write(store)
+            elif os.path.isfile(full_path):
+                new_sha = Tree.handle_file(full_path, index, store)
+            else:
+                #Raise error if path is invalid
+                raise ValueError(f"Path is not a File or Dir: {full_path}")
+
+        index.save()
         return new_sha
-        
+
+    def _add_directory(self, index, dir_path: str, store: ObjectStore, workers: int = None, executor: str = "thread") -> set:
+        #Walks a directory, hashing only files the index can't vouch for
+        paths = []
+        for root, dirs, files in os.walk(dir_path):
+            if ".minigit" in dirs:
+                dirs.remove(".minigit")
+            paths.extend(os.path.join(root, name) for name in files)
+        Tree.hash_files(paths, index, workers, executor, store)
+        return {normalize_path(os.path.relpath(file_path, self.dir_path)) for file_path in paths}
+
+
+    def status(self, workers: int = None) -> Status:
+        '''
+        Report staged, modified, deleted and untracked files
+
+        Only tracked files are stat'ed, and only those whose stat data no longer matches
+        the index are read and hashed. Files that were touched but not changed get their
+        new stat data saved to the index, so the next status doesn't hash them again.
+
+        Args:
+            workers: stat and hash tracked files across this many threads, for large trees
+        '''
+        index = Index(self.dir_path)
+        modified, deleted, untracked, refreshed = scan_worktree(index, workers)
+        staged = self._staged_against_head(index)
+
+        if refreshed:
+            for relative_path, st, sha in refreshed:
+                index.update(relative_path, st, sha)
+            index.save()
+
+        return Status(staged, modified, deleted, untracked)
+
+    def _staged_against_head(self, index) -> list:
+        #A staged entry only counts if it really differs from HEAD, re-adding the old content doesn't
+        staged = index.staged()
+        if not staged:
+            return []
+        head = self.head_sha()
+        head_tree = self._tree_sha_of(head) if head else None
+        paths = []
+        for entry in staged:
+            head_sha = lookup_path(head_tree, entry.path, self.store)
+            if entry.removed:
+                if head_sha is not None:
+                    paths.append(entry.path)
+            elif entry.object_id != head_sha:
+                paths.append(entry.path)
+        return sorted(paths)
 
 
+    @instrument.instrumented("commit")
     def commit(self, author: str, msg: str = None) -> str:
         '''
         Create a new commit from entries.
 
+        The tree is built from the parent commit's tree, writing new tree objects only
+        along the paths of staged changes, so no working file is read again.
+
         Args:
             author: Name/Email
             msg: The commit message
@@ -110,59 +220,565 @@ class Repository:
         if not os.path.exists(index_path):
             raise FileNotFoundError(f"Path does not exist: {index_path}, please run add() first")
         
-        with open(index_path, "r") as f:
-            data = f.read().splitlines()
+        index = Index(self.dir_path)
 
         #Make sure something is actually ready to be committed
-        if not data:
+        if not index.staged():
             raise RuntimeError("Nothing staged, run add() first")
 
-        #breakdown each tuple in data (type, relative_path, sha)
-        entries = [tuple(line.split(" ", 2)) for line in data]
+        parent_sha = self.head_sha()
+        commit_obj = Commit(self.dir_path, author, msg)
 
-        #Create new tree and then store
-        index_tree = Tree.from_index(self.dir_path, entries)
-        root_tree_sha = index_tree.store()
+        #Trees and the commit share one write batch, the branch only moves once they're stored
+        with self.store.batch() as store:
+            if parent_sha:
+                #Start from the parent's tree and rewrite only the trees along staged paths
+                changes = {entry.path: None if entry.removed else entry.object_id for entry in index.staged()}
+                root_tree_sha = Tree.update(self._tree_sha_of(parent_sha), changes, store)
+                changed = list(changes)
+            else:
+                #every tracked file as (type, relative_path, sha)
+                entries = [("blob", entry.path, entry.object_id) for entry in index.tracked()]
+                changed = [entry[1] for entry in entries]
 
-        commit_obj = Commit(self.dir_path, author, msg)
-        commit_sha = commit_obj.store(root_tree_sha)
+                #Create new tree and then store
+                index_tree = Tree.from_index(self.dir_path, entries, store)
+                root_tree_sha = index_tree.write(store)
+
+            commit_sha = commit_obj.write(root_tree_sha, store)
+
+        commit_obj.update_ref(self.store.durable)
+
+        if get_flag(self.dir_path, "commit_graph"):
+            self._add_to_commit_graph(commit_sha, root_tree_sha, [parent_sha] if parent_sha else [], commit_obj.date_time)
+        if get_flag(self.dir_path, "changed_paths"):
+            #A staged path may end up unchanged, that only costs a false "maybe"
+            self._add_changed_paths({commit_sha: make_filter(changed)})
 
-        #empty the index for the next commit
-        open(index_path, "w").close()
+        #everything staged is now committed, the stat data is kept for the next add
+        index.clear_staged()
+        index.save()
 
         return commit_sha
     
 
-    def log(self, n=None):
+    def log(self, n=None, path: str = None):
         '''
         Return upto the last n amount of commits. Otherwise return all.
+
+        The history is walked through the commit-graph, so only the commits
+        returned are read, and each one's tree is only loaded when accessed.
+
+        Args:
+            n: most commits to return
+            path: only commits that changed this file or directory ("src/api/")
+        '''
+        return list(self.iter_log(limit=n, path=path))
+
+    def iter_log(self, skip: int = 0, limit: int = None, since=None, until=None, start: str = None, path: str = None):
+        '''
+        Lazily yield CommitRecords from start (HEAD by default), newest first
+
+        Skipped commits and commits outside the date range are never read, only the
+        commit-graph is consulted for them. With a path, a commit whose changed-path
+        filter rules the path out is passed over without loading a tree, the rest are
+        checked by comparing the path's sha with the first parent's.
+
+        The walk keeps the commit-graph it started with, so commits made while it's
+        being iterated don't break it, they just aren't in it.
+
+        Args:
+            skip: how many matching commits to pass over first
+            limit: stop after this many commits
+            since: only commits at or after this datetime/iso string
+            until: only commits at or before this datetime/iso string
+            start: commit to start from
+            path: only commits that changed this file or directory
         '''
+        start = start or self.head_sha()
+        if not start or limit == 0:
+            return
+
+        since = None if since is None else date_to_micros(since)
+        until = None if until is None else date_to_micros(until)
+        path = normalize_path(path).strip("/") if path else ""
+
+        graph = self._graph_for(start)
+        blooms = self.changed_path_filters() if path else None
+        yielded = 0
+        #The walk ends once only older commits are left, a skewed older one is passed over
+        for sha in graph.walk(start, since):
+            date = graph.date(sha)
+            if until is not None and date > until:
+                continue
+            if since is not None and date < since:
+                continue
+            if path and not self._touches(graph, blooms, sha, path):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            yield CommitRecord(Commit.load(sha, self.store), self.store)
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
 
-        #Open the head to find the ref loc
-        head_path = os.path.join(self.dir_path, ".minigit", "HEAD")
-        with open(head_path, "r") as f:
-            data = f.read().strip()
 
-        #Grab the location and find latest commit
-        last_commit_ref = data.split(None, 1)[1]
-        ref_path = os.path.join(self.dir_path, ".minigit", last_commit_ref)
-        #Open the sha
-        with open(ref_path, "r") as f:
-            current_sha = f.read().strip()
+    def _touches(self, graph, blooms, sha: str, path: str) -> bool:
+        #True if the commit changed path against its first parent
+        bloom = blooms.get(sha) if blooms is not None else None
+        if bloom is not None and not might_contain(bloom, path):
+            instrument.count("changed_paths.skipped")
+            return False
+        instrument.count("changed_paths.checked")
+        parents = graph.parents(sha)
+        old = lookup_path(graph.tree_sha(parents[0]), path, self.store) if parents else None
+        return lookup_path(graph.tree_sha(sha), path, self.store) != old
 
-        full_list = []
-        #loop through all the parent_sha's until N or None
-        count = 0
-        while current_sha and (n is None or count < n):
-                commit = self.read_commit(current_sha)
-                full_list.append(commit)
-                current_sha = commit.parent_sha
-                count += 1
+    def changed_path_filters(self):
+        '''
+        Returns the repo's BloomFile of changed-path filters, or None if none were written
+        '''
+        bloom_path = os.path.join(self.dir_path, ".minigit", "objects", "info", "changed-paths")
+        try:
+            st = os.stat(bloom_path)
+        except FileNotFoundError:
+            self._blooms = self._blooms_key = None
+            return None
+        try:
+            tail_st = os.stat(bloom_path + "-tail")
+            tail_key = (tail_st.st_mtime_ns, tail_st.st_size, tail_st.st_ino)
+        except FileNotFoundError:
+            tail_key = None
+
+        #Reread only when either file was rewritten since it was read
+        key = (st.st_mtime_ns, st.st_size, st.st_ino, tail_key)
+        if getattr(self, "_blooms_key", None) != key:
+            self._blooms = BloomFile(bloom_path, bloom_path + "-tail")
+            self._blooms_key = key
+        return self._blooms
 
-        return full_list
+    def write_changed_paths(self) -> int:
+        '''
+        Adds a changed-path filter for every commit in the commit-graph that has none,
+        such as commits made before filters were turned on or fetched by pull
+
+        Returns:
+            The number of filters added
+        '''
+        graph = self.commit_graph()
+        if graph is None:
+            self.write_commit_graph()
+            graph = self.commit_graph()
+        blooms = self.changed_path_filters()
+
+        added = {}
+        for pos in range(len(graph)):
+            sha = graph.name(pos)
+            if blooms is not None and sha in blooms:
+                continue
+            parents = graph.parents(sha)
+            old_tree = graph.tree_sha(parents[0]) if parents else None
+            added[sha] = make_filter(entry.path for entry in diff_trees(old_tree, graph.tree_sha(sha), self.store))
+        if added:
+            self._add_changed_paths(added)
+        return len(added)
+
+    def _add_changed_paths(self, filters: dict) -> None:
+        #Only the small tail is rewritten, the main file once every TAIL_FILTERS filters
+        bloom_path = os.path.join(self.dir_path, ".minigit", "objects", "info", "changed-paths")
+        blooms = self.changed_path_filters()
+        tail = blooms.tail.filters() if blooms is not None and blooms.tail is not None else {}
+        tail.update(filters)
+        if blooms is not None and len(tail) < TAIL_FILTERS:
+            write_bloom_file(bloom_path + "-tail", tail)
+            return
+        merged = blooms.filters() if blooms is not None else {}
+        merged.update(filters)
+        write_bloom_file(bloom_path, merged)
+        #Everything in the tail is in the new main file now, or it belonged to a removed one
+        try:
+            os.remove(bloom_path + "-tail")
+        except FileNotFoundError:
+            pass
+
+    def head_sha(self):
+        '''
+        Returns the sha HEAD points to, or None before the first commit
+        '''
+        #HEAD is either a branch ref or, when detached, the sha itself
+        return resolve_head(self.dir_path)[1]
+
+    def branch_tips(self) -> dict:
+        '''
+        Returns branch name -> commit sha for every branch under refs/heads
+        '''
+        heads = os.path.join(self.dir_path, ".minigit", "refs", "heads")
+        tips = {}
+        for root, _, files in os.walk(heads):
+            for name in files:
+                #A ref write interrupted before its rename
+                if name.startswith("tmp_ref_"):
+                    continue
+                with open(os.path.join(root, name), "r") as f:
+                    sha = f.read().strip()
+                if sha:
+                    tips[normalize_path(os.path.relpath(os.path.join(root, name), heads))] = sha
+        return tips
+
+
+    def commit_graph(self):
+        '''
+        Returns the repo's CommitGraph, or None if it hasn't been written
+        '''
+        graph_path = os.path.join(self.dir_path, ".minigit", "objects", "info", "commit-graph")
+        try:
+            st = os.stat(graph_path)
+        except FileNotFoundError:
+            self._close_commit_graph()
+            return None
+        try:
+            tail_st = os.stat(graph_path + "-tail")
+            tail_key = (tail_st.st_mtime_ns, tail_st.st_size, tail_st.st_ino)
+        except FileNotFoundError:
+            tail_key = None
+
+        #Reopen only when either file was rewritten since it was mapped
+        key = (st.st_mtime_ns, st.st_size, st.st_ino, tail_key)
+        if getattr(self, "_graph_key", None) != key:
+            self._close_commit_graph()
+            self._graph = CommitGraph(graph_path, graph_path + "-tail")
+            self._graph_key = key
+        return self._graph
+
+    def _close_commit_graph(self) -> None:
+        #Dropped, not closed, an iter_log may still be walking it. The mapping goes once
+        #nothing holds it
+        self._graph = None
+        self._graph_key = None
+
+    def write_commit_graph(self) -> int:
+        '''
+        Rebuild the commit-graph from every commit reachable from the branches
+
+        Returns:
+            The number of commits in the graph
+        '''
+        commits = {}
+        graph = self.commit_graph()
+        stack = list(self.branch_tips().values())
+        head = self.head_sha()
+        if head:
+            stack.append(head)
+
+        while stack:
+            sha = stack.pop()
+            if sha in commits:
+                continue
+            #Commits already in the old graph don't need their objects read
+            if graph is not None and sha in graph:
+                pos = graph.position(sha)
+                tree_sha, parents, _, date = graph.entry(pos)
+                parents = [graph.name(parent) for parent in parents]
+            else:
+                commit = Commit.load(sha, self.store)
+                tree_sha, date = commit.tree_sha, date_to_micros(commit.date_time)
+                parents = [commit.parent_sha] if commit.parent_sha else []
+            commits[sha] = (tree_sha, parents, date)
+            stack.extend(parents)
+
+        graph = None
+        self._save_commit_graph(commits)
+        return len(commits)
+
+    def _add_to_commit_graph(self, commit_sha: str, tree_sha: str, parents: list, date_time: str) -> None:
+        #Only the small tail is rewritten, the main file once every TAIL_LIMIT commits
+        graph = self.commit_graph()
+        if any(graph is None or parent not in graph for parent in parents):
+            #The graph is missing or behind, build it from scratch instead
+            self.write_commit_graph()
+            return
+        entry = (tree_sha, parents, date_to_micros(date_time))
+        if graph is None:
+            self._save_commit_graph({commit_sha: entry})
+            return
+        tail = graph.commits(graph.main_count)
+        tail[commit_sha] = entry
+        if len(tail) >= TAIL_LIMIT:
+            commits = graph.commits(0)
+            commits[commit_sha] = entry
+            graph = None
+            self._save_commit_graph(commits)
+            return
+        graph_path = os.path.join(self.dir_path, ".minigit", "objects", "info", "commit-graph")
+        data = encode_commit_graph_tail(tail, graph)
+        #Our references go before the old tail is replaced, readers keep their own
+        graph = None
+        self._close_commit_graph()
+        write_commit_graph_tail(graph_path + "-tail", data)
+
+    def _save_commit_graph(self, commits: dict) -> None:
+        graph_path = os.path.join(self.dir_path, ".minigit", "objects", "info", "commit-graph")
+        #Our reference goes before the old file is replaced, a mapped file can't be
+        #replaced on Windows. Graphs readers still hold keep the old files mapped
+        self._close_commit_graph()
+        write_commit_graph(graph_path, commits)
+        #Everything in the tail is in the new main file now
+        try:
+            os.remove(graph_path + "-tail")
+        except FileNotFoundError:
+            pass
+
+    def _graph_for(self, *shas):
+        #Returns a graph that holds every given commit, updating it once if needed
+        graph = self.commit_graph()
+        if graph is None or any(sha not in graph for sha in shas):
+            graph = None
+            self.write_commit_graph()
+            graph = self.commit_graph()
+        for sha in shas:
+            if sha not in graph:
+                raise ValueError(f"Not a commit reachable from any branch: {sha}")
+        return graph
+
+    def rev_list(self, n=None, start: str = None) -> list:
+        '''
+        Return the ids of upto n commits reachable from start (HEAD by default), newest first
+
+        Only the commit-graph is read, never the commit objects.
+        '''
+        start = start or self.head_sha()
+        if not start:
+            return []
+        shas = []
+        for sha in self._graph_for(start).walk(start):
+            if n is not None and len(shas) >= n:
+                break
+            shas.append(sha)
+        return shas
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        '''
+        True if ancestor is in the history of descendant, answered from the commit-graph
+        '''
+        return self._graph_for(ancestor, descendant).is_ancestor(ancestor, descendant)
+
+    def merge_base(self, first: str, second: str):
+        '''
+        Return the best common ancestor of two commits, or None, answered from the commit-graph
+        '''
+        return self._graph_for(first, second).merge_base(first, second)
+
+    def diff(self, a: str, b: str) -> list:
+        '''
+        Compare two commits, returning a DiffEntry for every added, removed or modified file
+
+        Subtrees with the same sha in both commits are skipped without being read, call
+        .hunks() on an entry for its line diff, worked out only when asked for.
+
+        Args:
+            a: the commit before, None for an empty tree
+            b: the commit after, None for an empty tree
+        '''
+        old_tree = self._tree_sha_of(a) if a else None
+        new_tree = self._tree_sha_of(b) if b else None
+        return list(diff_trees(old_tree, new_tree, self.store))
 
 
     
+    def resolve(self, prefix: str) -> str:
+        '''
+        Returns the full id of the one object whose sha starts with prefix
+
+        Loose objects are found through the name index and packed ones through the
+        pack indexes, each a binary search, so no object directory is listed.
+
+        Args:
+            prefix: a short sha of at least 4 hex digits, or a full one
+
+        Raises:
+            ValueError: if the prefix isn't hex or is too short
+            AmbiguousObjectName: if more than one object matches
+            KeyError: if no object matches
+        '''
+        low, high = prefix_bounds(prefix)
+        names = NameIndex(self.store.objects_path)
+        if not names.exists():
+            #A repo from before the index, its loose objects are listed once
+            names.rebuild(object_id for object_id, _ in self.store.iter_loose())
+
+        candidates = set(names.match(prefix))
+        for pack in self.store.packs.get(refresh=True):
+            candidates.update(raw.hex() for raw in pack.index.names_between(low, high, 16))
+
+        #The index can still name objects a gc removed since
+        found = sorted(object_id for object_id in candidates if object_id in self.store)
+        if not found:
+            raise KeyError(f"No object matches {prefix}")
+        if len(found) > 1:
+            raise AmbiguousObjectName(prefix, found)
+        return found[0]
+
+    def _tree_sha_of(self, commit_sha: str) -> str:
+        #The commit-graph knows every commit's tree, only fall back to the object
+        graph = self.commit_graph()
+        if graph is not None and commit_sha in graph:
+            return graph.tree_sha(commit_sha)
+        return Commit.load(commit_sha, self.store).tree_sha
+
+
+    def checkout(self, target: str, workers: int = 4, force: bool = False) -> str:
+        '''
+        Switch the working tree, index and HEAD to a branch or a commit
+
+        Only paths that differ between the current commit and the target are touched,
+        with blobs streamed from the object store and written across a thread pool.
+        A branch name moves HEAD onto that branch, a commit sha detaches HEAD.
+
+        Args:
+            target: branch name or commit sha
+            workers: threads writing files
+            force: overwrite local changes to the paths being switched
+
+        Raises:
+            RuntimeError: if local changes would be overwritten, unless force
+
+        Returns:
+            The sha of the commit checked out
+        '''
+        branches = self.branch_tips()
+        if target in branches:
+            commit_sha, head = branches[target], f"ref: refs/heads/{target}"
+        else:
+            commit_sha, head = target, target
+
+        self._switch_worktree(self.head_sha(), commit_sha, workers, force)
+
+        write_ref(os.path.join(self.dir_path, ".minigit", "HEAD"), head, self.store.durable)
+        return commit_sha
+
+    def _switch_worktree(self, current: str, commit_sha: str, workers: int = 4, force: bool = False) -> None:
+        #Moves the working tree and index from one commit to another, HEAD is left alone
+        target_tree = self._tree_sha_of(commit_sha)
+        current_tree = self._tree_sha_of(current) if current else None
+        changes = list(diff_trees(current_tree, target_tree, self.store))
+
+        index = Index(self.dir_path)
+        if not force:
+            conflicts = find_conflicts(index, self.dir_path, changes)
+            if conflicts:
+                raise RuntimeError(f"Local changes would be overwritten by checkout: {', '.join(conflicts)}")
+
+        written = materialize(self.store, self.dir_path, changes, workers)
+
+        #The index now matches the target for every path that changed
+        for change in changes:
+            if change.new_sha is None:
+                index.forget(change.path)
+        for relative_path, (st, sha) in written.items():
+            index.record(relative_path, st, sha)
+        index.save()
+
+
+    def push(self, remote_path: str, branch: str = None, workers: int = 4) -> dict:
+        '''
+        Send a branch to another repo on disk, fast-forwarding its copy of the branch
+
+        Only the commits the remote doesn't have, and the trees and blobs they add, are
+        sent, as one bundle. If the remote has the branch checked out its working tree
+        is moved along too, unless that would overwrite local changes there.
+
+        Args:
+            remote_path: directory of the other repo
+            branch: branch to push, the current branch by default
+            workers: threads writing files in the remote's working tree
+
+        Raises:
+            ValueError: if either side isn't a repo, the branch doesn't exist, or the
+                remote's branch has commits this repo doesn't
+            RuntimeError: if the remote's local changes would be overwritten
+
+        Returns:
+            dict with the branch, its old and new sha, and how many commits, objects
+            and bytes were sent
+        '''
+        branch = branch or self._current_branch()
+        return self._send_branch(self._open_remote(remote_path), branch, workers)
+
+    def pull(self, remote_path: str, branch: str = None, workers: int = 4) -> dict:
+        '''
+        Fetch a branch from another repo on disk and fast-forward to it
+
+        The mirror of push(), with this repo receiving. The working tree is updated
+        when the branch is the one checked out.
+
+        Raises:
+            ValueError: if either side isn't a repo, the branch doesn't exist, or this
+                repo's branch has commits the remote doesn't
+            RuntimeError: if local changes would be overwritten
+
+        Returns:
+            dict like push()
+        '''
+        branch = branch or self._current_branch()
+        return self._open_remote(remote_path)._send_branch(self, branch, workers)
+
+    def _open_remote(self, remote_path: str) -> "Repository":
+        #Opens an existing repo as is, Repository() would init a mistyped path
+        minigit_path = os.path.join(remote_path, ".minigit")
+        if not (os.path.isdir(os.path.join(minigit_path, "objects"))
+                and os.path.isfile(os.path.join(minigit_path, "HEAD"))):
+            raise ValueError(f"Not a mini-git repo: {remote_path}")
+        remote = Repository.__new__(Repository)
+        remote.dir_path = remote_path
+        remote.store = ObjectStore.open(remote_path)
+        remote.store.reload_config()
+        remote.cache = remote.store.cache
+        return remote
+
+    def _current_branch(self) -> str:
+        with open(os.path.join(self.dir_path, ".minigit", "HEAD"), "r") as f:
+            line = f.read().strip()
+        if not line.startswith("ref: refs/heads/"):
+            raise ValueError("HEAD is detached, name the branch to use")
+        return line[len("ref: refs/heads/"):]
+
+    def _send_branch(self, target: "Repository", branch: str, workers: int = 4) -> dict:
+        #Sends a branch from this repo to target, which may be either end of a push/pull
+        new = self.branch_tips().get(branch)
+        if new is None:
+            raise ValueError(f"No such branch: {branch}")
+        old = target.branch_tips().get(branch)
+        report = {"branch": branch, "old": old, "new": new, "commits": 0, "objects": 0, "bytes": 0}
+        if old == new:
+            return report
+        if old is not None and not is_fast_forward(self.store, old, new):
+            raise ValueError(f"Not a fast-forward, {branch} has commits that would be lost: {old}")
+
+        #Negotiate: walk back from the tip until reaching commits the target has
+        has = target.store.__contains__
+        commits = missing_commits(self.store, new, has)
+        object_ids = missing_objects(self.store, commits, has)
+        report["commits"], report["objects"] = len(commits), len(object_ids)
+        if object_ids:
+            report["bytes"] = send_objects(self.store, target.store, object_ids)
+
+        target._advance_branch(branch, old, new, workers)
+        return report
+
+    def _advance_branch(self, branch: str, old: str, new: str, workers: int = 4) -> None:
+        #Moves a branch from old to new, bringing the working tree along if it's checked out
+        ref_path = os.path.join(self.dir_path, ".minigit", "refs", "heads", *branch.split("/"))
+        if self.branch_tips().get(branch) != old:
+            raise RuntimeError(f"{branch} moved while it was being updated")
+        with open(os.path.join(self.dir_path, ".minigit", "HEAD"), "r") as f:
+            checked_out = f.read().strip() == f"ref: refs/heads/{branch}"
+        if checked_out:
+            self._switch_worktree(old, new, workers)
+
+        write_ref(ref_path, new, self.store.durable)
+
+
     def read_commit(self, obj_id):
         '''
         Load a commit by the obj_id/sha and return commit instance.
@@ -171,14 +787,11 @@ class Repository:
         if not obj_id:
             raise ValueError(f"No id/sha provided")
         
-        #Find path and validate existence
-        path = decode_sha_to_path(obj_id)
-        validate_file(path)
-        
-        #Load commit
-        new_commit = Commit.load(obj_id)
+        #Load commit, from a pack or loose file. The loaded one is shared through the
+        #object cache, so the tree goes on a copy and the cached commit stays as it is
+        new_commit = copy.copy(Commit.load(obj_id, self.store))
         #Also load the tree it exists within
-        new_commit.tree = Tree.load(new_commit.tree_sha)
+        new_commit.tree = Tree.load(new_commit.tree_sha, self.store)
         return new_commit
     
 
@@ -192,28 +805,245 @@ class Repository:
         '''
         if not obj_id or not isinstance(obj_id, str):
             raise ValueError(f'No id provided, or invalid type: {obj_id!r}')
-        
-        #validate path to ensure it exists
-        path = decode_sha_to_path(obj_id)
-        validate_file(path)
 
+        #A chunked file's manifest loads as a Blob, its content read on demand
+        loaders = {"blob": Blob, "manifest": Blob, "tree": Tree}
 
-        #read the raw bytes and decode the header, setting obj type
-        with open(path, "rb") as f:
-            raw = f.read()
+        cached = self.cache.get(obj_id)
+        if cached is not None:
+            if isinstance(cached, (Blob, Tree)):
+                return cached
+            raise ValueError(f"Unknown object type: {type(cached).__name__.lower()} in {obj_id!r}")
+        
+        #read the raw bytes once and decode the header, setting obj type
+        raw = self.store.read_raw(obj_id)
         index = raw.find(b'\0')
         if index < 0:
             raise ValueError(f"Corrupt object: {obj_id}")
         header_str = raw[:index].decode("ascii")
         object_type, _ = header_str.split(" ", 1)
 
-        if object_type == "blob":
-            return Blob.load(obj_id)
-        elif object_type == "tree":
-            return Tree.load(obj_id)
-        else:
+        if object_type not in loaders:
             raise ValueError(f"Unknown object type: {object_type} in {obj_id!r}")
 
+        #parse the bytes already read, rather than loading the object again
+        obj = loaders[object_type]._parse(obj_id, raw, self.store)
+        self.cache.put(obj_id, obj, len(raw))
+        return obj
+
+
+    def repack(self, window: int = 10, depth: int = 10) -> str:
+        '''
+        Bundle every object into a single packfile, with similar objects delta-compressed
+
+        Loose objects and older packs are removed once the new pack is in place.
+
+        Args:
+            window: how many neighbouring objects to try as a delta base
+            depth: longest allowed chain of deltas
+
+        Returns:
+            Path to the new pack, or None if there was nothing to pack
+        '''
+        objects_path = os.path.join(self.dir_path, ".minigit", "objects")
+        pack_dir = os.path.join(objects_path, "pack")
+
+        #Gather (id, type, size) for everything, reading only the headers
+        loose = dict(self.store.iter_loose())
+        old_packs = self.store.packs.get(refresh=True)
+        objects = {}
+        for pack in old_packs:
+            for object_id in pack.object_ids():
+                objects[object_id] = (object_id, *pack.read_header(object_id))
+        for object_id, path in loose.items():
+            objects[object_id] = (object_id, *read_object_header(path))
+
+        if not objects:
+            return None
+
+        def read_body(object_id):
+            content = self.store.read_raw(object_id)
+            return content[content.index(b"\0") + 1:]
+
+        pack_path, _ = write_pack(pack_dir, list(objects.values()), read_body, window, depth)
+
+        #The new pack holds everything, so the old copies can go. They're dropped, not
+        #closed, other threads may still be reading them through their mappings
+        old_paths = [pack.pack_path for pack in old_packs if pack.pack_path != pack_path]
+        old_packs = None
+        self.store.packs.reset()
+        for old_path in old_paths:
+            os.remove(old_path)
+            os.remove(old_path[:-len(".pack")] + ".idx")
+        for path in loose.values():
+            os.remove(path)
+        for folder in {os.path.dirname(path) for path in loose.values()}:
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+        return pack_path
+
+    def gc(self, grace_period: float = 14 * 24 * 3600, dry_run: bool = False) -> dict:
+        '''
+        Delete loose objects that nothing refers to any more
+
+        Everything reachable from the branches, HEAD and the index is marked in a
+        bitmap, then unmarked loose objects (and leftover temp files) older than the
+        grace period are removed. The grace period protects objects an add() in
+        progress has written but not yet staged. Packed objects are left alone, that
+        includes big write batches, which are installed as a pack.
+
+        Args:
+            grace_period: seconds an unreachable object is kept for
+            dry_run: only report what would be removed
+
+        Returns:
+            dict with object counts, pruned, reclaimed_bytes, missing and the
+            seconds each phase took
+        '''
+        timings = {}
+        started = time.perf_counter()
+        #Streamed straight into the bitmap, no list of every object id is ever built
+        packs = self.store.packs.get(refresh=True)
+        bitmap = ObjectBitmap(itertools.chain(
+            (object_id for object_id, _ in self.store.iter_loose()),
+            (object_id for pack in packs for object_id in pack.object_ids())))
+        timings["enumerate"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        roots = [(sha, "commit") for sha in self.branch_tips().values()]
+        head = self.head_sha()
+        if head:
+            roots.append((head, "commit"))
+        roots.extend((entry.object_id, "blob") for entry in Index(self.dir_path).entries.values())
+        missing = mark_reachable(self.store, roots, bitmap)
+        timings["mark"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cutoff = time.time() - grace_period
+        #Unreachable loose objects, plus temp files a crashed writer left behind. Loose
+        #objects written since the enumeration aren't covered by the bitmap, they're kept
+        candidates = [path for object_id, path in self.store.iter_loose()
+                      if bitmap.position(object_id) >= 0 and not bitmap.is_marked(object_id)]
+        objects_path = self.store.objects_path
+        candidates.extend(os.path.join(objects_path, name) for name in os.listdir(objects_path) if name.startswith("tmp_"))
+
+        pruned = reclaimed = 0
+        for path in candidates:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            pruned += 1
+            reclaimed += st.st_size
+
+        if pruned and not dry_run:
+            for folder in {os.path.dirname(path) for path in candidates}:
+                if folder != objects_path and os.path.isdir(folder) and not os.listdir(folder):
+                    os.rmdir(folder)
+            #Pruned objects mustn't keep loading from the cache, or resolving from the name index
+            self.cache.clear()
+            NameIndex(objects_path).rebuild(object_id for object_id, _ in self.store.iter_loose())
+        timings["prune"] = time.perf_counter() - started
+
+        return {
+            "objects": len(bitmap),
+            "reachable": bitmap.count(),
+            "pruned": pruned,
+            "reclaimed_bytes": reclaimed,
+            "missing": missing,
+            "seconds": timings,
+        }
+
+    def fsck(self, workers: int = None) -> dict:
+        '''
+        Check the integrity of every object in the repo, without changing anything
+
+        Every loose and packed object is streamed through sha256 and compared to its
+        name, its header length checked against its body, and every tree, commit and
+        manifest parsed for the objects it points to. The checking runs in a process
+        pool, jobs of many loose objects or a slice of a pack at a time.
+
+        Args:
+            workers: processes checking objects, one per core by default, 1 checks in
+                this process
+
+        Returns:
+            dict with:
+                objects: how many objects were checked
+                bytes: stored bytes of the loose objects and packs
+                corrupt: object id (or pack file name) -> what's wrong with it
+                missing: ids an object, a branch, HEAD or the index points to that aren't stored
+                dangling: intact objects nothing points to
+                temp_files: leftovers of interrupted writes
+                seconds: the time each phase took
+        '''
+        timings = {}
+        started = time.perf_counter()
+        objects_path = self.store.objects_path
+        loose = []
+        stored = 0
+        for object_id, path in self.store.iter_loose():
+            size = os.path.getsize(path)
+            loose.append((object_id, path, size))
+            stored += size
+        jobs = loose_jobs(loose)
+        present = set(object_id for object_id, _, _ in loose)
+        for pack in self.store.packs.get(refresh=True):
+            object_ids = list(pack.object_ids())
+            present.update(object_ids)
+            stored += os.path.getsize(pack.pack_path)
+            jobs.extend(pack_jobs(pack.pack_path, object_ids))
+
+        temp_files = []
+        for folder in (objects_path, os.path.join(objects_path, "pack"), os.path.join(objects_path, "info")):
+            if os.path.isdir(folder):
+                temp_files.extend(os.path.join(folder, name) for name in os.listdir(folder) if name.startswith("tmp_"))
+        timings["enumerate"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        workers = workers or os.cpu_count() or 1
+        corrupt = {}
+        intact = set()
+        referenced = set()
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                results = list(pool.map(run_job, jobs))
+        else:
+            results = map(run_job, jobs)
+        for findings in results:
+            for object_id, obj_type, problem, refs in findings:
+                if problem is not None:
+                    corrupt[object_id] = problem
+                elif obj_type is not None:
+                    intact.add(object_id)
+                    referenced.update(sha for sha, _ in refs)
+        timings["check"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        roots = set(self.branch_tips().values())
+        head = self.head_sha()
+        if head:
+            roots.add(head)
+        roots.update(entry.object_id for entry in Index(self.dir_path).entries.values() if entry.object_id)
+        missing = sorted((referenced | roots) - present)
+        dangling = sorted(intact - referenced - roots - set(corrupt))
+        timings["connectivity"] = time.perf_counter() - started
+
+        return {
+            "objects": len(present),
+            "bytes": stored,
+            "corrupt": corrupt,
+            "missing": missing,
+            "dangling": dangling,
+            "temp_files": sorted(temp_files),
+            "seconds": timings,
+        }
+
 
 if __name__ == "__main__":
     new_repo = Repository("test_repo")
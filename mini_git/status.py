@@ -0,0 +1,150 @@
+'''
+Working tree status for my mini-git
+
+The working tree is walked once with os.scandir, whose entries already know if they're
+a file or a directory, so nothing is stat'ed twice. Only tracked files are stat'ed at
+all, and only files whose stat data no longer matches the index are hashed.
+
+Contains:
+    - Status, walk_files(), scan_worktree(), file_object_id(), lookup_path()
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git.utils import hash_file
+from mini_git.index import REMOVED
+from mini_git.tree import Tree
+from mini_git.object_store import ObjectStore
+from mini_git.chunking import hash_chunked
+
+
+class Status:
+    '''
+    Paths (relative, "/"-separated, sorted) grouped by state
+
+    staged: differ between HEAD and the index, including staged removals
+    modified: tracked files whose working copy differs from the index
+    deleted: tracked files missing from the working tree
+    untracked: files the index doesn't know about
+    '''
+    __slots__ = ("staged", "modified", "deleted", "untracked")
+
+    def __init__(self, staged: list, modified: list, deleted: list, untracked: list):
+        self.staged = staged
+        self.modified = modified
+        self.deleted = deleted
+        self.untracked = untracked
+
+    @property
+    def clean(self) -> bool:
+        return not (self.staged or self.modified or self.deleted or self.untracked)
+
+    def __repr__(self):
+        return (f"Status(staged={len(self.staged)}, modified={len(self.modified)}, "
+                f"deleted={len(self.deleted)}, untracked={len(self.untracked)})")
+
+
+def walk_files(root: str):
+    '''
+    Yields (relative_path, full_path) for every file under root, skipping .minigit
+    '''
+    stack = [("", root)]
+    while stack:
+        prefix, path = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name == ".minigit":
+                    continue
+                relative_path = f"{prefix}/{entry.name}" if prefix else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((relative_path, entry.path))
+                elif entry.is_file():
+                    yield relative_path, entry.path
+
+
+def scan_worktree(index, workers: int = None) -> tuple[list, list, list, list]:
+    '''
+    Compares the working tree against an Index
+
+    Args:
+        index: the repo's Index
+        workers: stat and hash tracked files across this many threads
+
+    Returns:
+        (modified, deleted, untracked, refreshed), refreshed holds (path, stat, sha)
+        for files whose stat data changed but whose content didn't
+    '''
+    tracked = []
+    untracked = []
+    entries = index.entries
+    for relative_path, full_path in walk_files(index.root):
+        entry = entries.get(relative_path)
+        if entry is None or entry.flags & REMOVED:
+            untracked.append(relative_path)
+        else:
+            tracked.append((relative_path, full_path))
+
+    threshold = ObjectStore.open(index.root).chunk_threshold
+    if workers and workers > 1 and len(tracked) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(tracked) // (workers * 4))
+            results = list(pool.map(lambda item: _check(index, *item, threshold), tracked, chunksize=chunk))
+    else:
+        results = [_check(index, relative_path, full_path, threshold) for relative_path, full_path in tracked]
+
+    modified = []
+    refreshed = []
+    for (relative_path, _), (changed, st, sha) in zip(tracked, results):
+        if changed:
+            modified.append(relative_path)
+        elif sha is not None:
+            refreshed.append((relative_path, st, sha))
+
+    deleted = []
+    live = [entry.path for entry in entries.values() if not entry.flags & REMOVED]
+    #Every tracked file was found unless the counts differ
+    if len(live) != len(tracked):
+        seen = {relative_path for relative_path, _ in tracked}
+        deleted = [path for path in live if path not in seen]
+    return sorted(modified), sorted(deleted), sorted(untracked), refreshed
+
+
+def _check(index, relative_path: str, full_path: str, threshold: int = 0):
+    #Returns (changed, stat, sha), sha only when the file had to be hashed
+    try:
+        st = os.stat(full_path)
+    except FileNotFoundError:
+        return True, None, None
+    if index.is_fresh(relative_path, st) is not None:
+        return False, st, None
+    entry = index.get(relative_path)
+    #A different size can't be the same content, no need to read it
+    if entry.size and entry.size != st.st_size:
+        return True, st, None
+    sha = file_object_id(full_path, st.st_size, threshold)
+    return sha != entry.object_id, st, sha
+
+
+def file_object_id(full_path: str, size: int, threshold: int = 0) -> str:
+    '''
+    Returns the id a working file would be stored under, chunked at or over threshold
+    '''
+    if threshold and size >= threshold:
+        return hash_chunked(full_path)
+    return hash_file("blob", full_path)
+
+
+def lookup_path(tree_sha, path: str, store=None):
+    '''
+    Returns the sha a "/"-separated path has in a tree, or None if it isn't there
+
+    Only the trees along the path are loaded.
+    '''
+    entry_type, sha = "tree", tree_sha
+    for name in path.split("/"):
+        #A missing tree, or a file where a directory should be
+        if sha is None or entry_type != "tree":
+            return None
+        child = Tree.load(sha, store).find(name)
+        entry_type, sha = (child[0], child[2]) if child is not None else (None, None)
+    return sha
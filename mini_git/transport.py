@@ -0,0 +1,234 @@
+'''
+Moving history between repos for my mini-git
+
+The sending side walks back from the commit it's sending (the "want") and stops at the
+first commit the receiving side already has (a "have"). Each new commit's tree is only
+opened where it differs from its parent's, and anything the receiver has is skipped
+along with everything under it, so a repo one commit behind costs one commit's work.
+The missing objects go over as one bundle, streamed an object at a time and checked
+as they arrive.
+
+Bundle layout:
+    b"MBDL" | version (u32) | object count (u32)
+    entries: raw sha (32) | length (u64) | object bytes, header included
+    trailer: sha256 of everything above
+
+Contains:
+    - missing_commits(), missing_objects(), is_fast_forward()
+    - write_bundle(), read_bundle(), send_objects()
+'''
+import os
+import struct
+import hashlib
+import threading
+
+from mini_git.tree import Tree
+from mini_git.commit import Commit
+from mini_git.reachability import manifest_chunks
+
+
+BUNDLE_MAGIC = b"MBDL"
+VERSION = 1
+
+SHA_LEN = 32
+ENTRY_HEADER = struct.Struct(">32sQ")
+
+
+def missing_commits(store, want: str, has) -> list:
+    '''
+    Returns the commits from want back to the first one the receiver has, newest first
+
+    Args:
+        store: the sending repo's ObjectStore
+        want(str): the commit being sent
+        has: callable telling if the receiver has an object id
+    '''
+    commits = []
+    sha = want
+    while sha and not has(sha):
+        commit = Commit.load(sha, store)
+        commits.append(commit)
+        sha = commit.parent_sha
+    return commits
+
+
+def missing_objects(store, commits: list, has) -> list:
+    '''
+    Returns the ids of every commit, tree and blob the receiver needs for the commits
+
+    A parent is either sent too or already on the receiver, so only the parts of
+    each tree that changed since its parent's are walked.
+
+    Args:
+        store: the sending repo's ObjectStore
+        commits: Commits from missing_commits()
+        has: callable telling if the receiver has an object id
+    '''
+    wanted = []
+    seen = set()
+    for commit in commits:
+        wanted.append(commit.object_id)
+        parent_tree = Commit.load(commit.parent_sha, store).tree_sha if commit.parent_sha else None
+        _walk_tree(store, commit.tree_sha, parent_tree, has, seen, wanted)
+    return wanted
+
+
+def _walk_tree(store, tree_sha: str, old_sha: str, has, seen: set, wanted: list) -> None:
+    if tree_sha == old_sha or tree_sha in seen:
+        return
+    seen.add(tree_sha)
+    #Whoever has a tree has everything under it
+    if has(tree_sha):
+        return
+    wanted.append(tree_sha)
+
+    old_children = {}
+    if old_sha is not None:
+        old_children = {name: (entry_type, sha) for entry_type, name, sha in Tree.load(old_sha, store).children}
+    for entry_type, name, sha in Tree.load(tree_sha, store).children:
+        old_type, old_child = old_children.get(name, (None, None))
+        base = old_child if old_type == entry_type else None
+        if entry_type == "tree":
+            _walk_tree(store, sha, base, has, seen, wanted)
+        elif sha != base and sha not in seen:
+            seen.add(sha)
+            if not has(sha):
+                wanted.append(sha)
+                #A chunked file needs whichever of its chunks the receiver doesn't have
+                for chunk_id in manifest_chunks(store, sha):
+                    if chunk_id not in seen:
+                        seen.add(chunk_id)
+                        if not has(chunk_id):
+                            wanted.append(chunk_id)
+
+
+def is_fast_forward(store, old: str, new: str) -> bool:
+    '''
+    True if old is in the history of new, walking back from new only as far as old
+    '''
+    if old not in store:
+        return False
+    sha = new
+    while sha:
+        if sha == old:
+            return True
+        sha = Commit.load(sha, store).parent_sha
+    return False
+
+
+def write_bundle(store, object_ids: list, out) -> int:
+    '''
+    Streams objects out as a bundle
+
+    Args:
+        store: the ObjectStore to read from
+        object_ids: ids of the objects to send
+        out: binary file-like object, a pipe or a socket's makefile() will do
+
+    Returns:
+        The number of bytes written
+    '''
+    checksum = hashlib.sha256()
+    written = 0
+
+    def write(data: bytes) -> None:
+        nonlocal written
+        out.write(data)
+        checksum.update(data)
+        written += len(data)
+
+    write(BUNDLE_MAGIC + struct.pack(">II", VERSION, len(object_ids)))
+    for object_id in object_ids:
+        raw = store.read_raw(object_id)
+        write(ENTRY_HEADER.pack(bytes.fromhex(object_id), len(raw)))
+        write(raw)
+    out.write(checksum.digest())
+    out.flush()
+    return written + SHA_LEN
+
+
+def read_bundle(fp, store) -> list:
+    '''
+    Reads a bundle into a store, installing every object or none of them
+
+    Each object is re-hashed against its id as it arrives.
+
+    Args:
+        fp: binary file-like object the bundle is read from
+        store: the ObjectStore to write to
+
+    Raises:
+        ValueError: if the bundle is malformed or an object doesn't match its id
+
+    Returns:
+        The ids of the objects read
+    '''
+    checksum = hashlib.sha256()
+
+    def read(size: int) -> bytes:
+        data = _read_exact(fp, size)
+        checksum.update(data)
+        return data
+
+    header = read(len(BUNDLE_MAGIC) + 8)
+    magic, (version, count) = header[:len(BUNDLE_MAGIC)], struct.unpack(">II", header[len(BUNDLE_MAGIC):])
+    if magic != BUNDLE_MAGIC or version != VERSION:
+        raise ValueError("Not a bundle, or an unknown version")
+
+    object_ids = []
+    with store.batch() as batched:
+        for _ in range(count):
+            raw_sha, length = ENTRY_HEADER.unpack(read(ENTRY_HEADER.size))
+            raw = read(length)
+            object_id = raw_sha.hex()
+            if hashlib.sha256(raw).hexdigest() != object_id:
+                raise ValueError(f"Object doesn't match its id: {object_id}")
+            batched.write(object_id, raw)
+            object_ids.append(object_id)
+        #Nothing is installed unless the whole bundle arrived intact
+        if _read_exact(fp, SHA_LEN) != checksum.digest():
+            raise ValueError("Bundle checksum mismatch")
+    return object_ids
+
+
+def _read_exact(fp, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError("Bundle ended early")
+    return data
+
+
+def send_objects(source, target, object_ids: list) -> int:
+    '''
+    Streams objects from one store into another through a pipe
+
+    The bundle is written on a thread while it's read, so it's never held whole.
+
+    Returns:
+        The size of the bundle in bytes
+    '''
+    read_fd, write_fd = os.pipe()
+    result = {}
+
+    def produce():
+        try:
+            with open(write_fd, "wb") as out:
+                result["bytes"] = write_bundle(source, object_ids, out)
+        except BaseException as e:
+            result["error"] = e
+
+    writer = threading.Thread(target=produce)
+    writer.start()
+    try:
+        with open(read_fd, "rb") as fp:
+            read_bundle(fp, target)
+    except BaseException:
+        writer.join()
+        #A bundle cut short by the sender failing is reported as the sender's error
+        if isinstance(result.get("error"), Exception) and not isinstance(result["error"], BrokenPipeError):
+            raise result["error"]
+        raise
+    writer.join()
+    if "error" in result:
+        raise result["error"]
+    return result["bytes"]
@@ -1,7 +1,79 @@
 import os
+import re
+import struct
+from bisect import bisect_left
+from itertools import accumulate
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from mini_git.blob import Blob
 from mini_git.utils import *
+from mini_git.index import normalize_path
+from mini_git.object_store import ObjectStore, default_store
+
+'''
+Tree body, version 2 (binary), children sorted by name and stored column by column:
+    b"\\0" | version (u8) | count (u32)
+    modes: count x u32 | name lengths: count x u16 | shas: count x 32 raw bytes
+    names: the utf-8 names back to back
+
+Columns are read with one struct.unpack each and names are sliced out of one decoded
+string, so a wide directory parses without unpacking its children one at a time.
+
+Version 1 trees are ascii "type name sha" lines. Their body never starts with a null
+byte, so they still load.
+'''
+TREE_VERSION = 2
+_TREE_MARKER = b"\0" + bytes([TREE_VERSION])
+_COUNT = struct.Struct(">I")
+DIGEST_SIZE = 32
+#Cuts the hex of the sha column into shas, quicker than slicing it in a loop
+_HEX_SHA = re.compile(f".{{{2 * DIGEST_SIZE}}}", re.DOTALL)
+
+MODES = {"blob": 0o100644, "tree": 0o040000}
+TYPES = {mode: entry_type for entry_type, mode in MODES.items()}
+
+
+class TreeChildren(Sequence):
+    '''
+    The children of a loaded tree as parallel arrays, read like a list of
+    (type, name, sha) tuples
+
+    Init
+    ----
+    :modes(list[int]): 0o100644 for a blob, 0o040000 for a tree
+    :names(list[str]): sorted names
+    :digests(bytes): the raw 32-byte shas back to back
+    '''
+    __slots__ = ("modes", "names", "digests")
+
+    def __init__(self, modes: list, names: list, digests: bytes):
+        self.modes = modes
+        self.names = names
+        self.digests = digests
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        i = range(len(self.names))[i]
+        return (TYPES[self.modes[i]], self.names[i], self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE].hex())
+
+    def __iter__(self):
+        #Tuples and hex shas are only made as they're asked for
+        shas = _HEX_SHA.findall(self.digests.hex())
+        return zip(map(TYPES.__getitem__, self.modes), self.names, shas)
+
+    def __eq__(self, other):
+        if isinstance(other, (TreeChildren, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TreeChildren({list(self)!r})"
+
 
 class Tree:
     '''
@@ -20,20 +92,24 @@ class Tree:
     
 
     @classmethod
-    def from_index(cls, base_path: str, entries: list[tuple]) -> "Tree":
+    def from_index(cls, base_path: str, entries: list[tuple], store: ObjectStore = None) -> "Tree":
         '''
-        Build a tree from a list of entries
+        Build a tree from a list of entries, without touching the working files
+
+        Sub-trees are stored as they're built, call write() to store the returned tree
 
-        :entries: List of (type, relative_path, object_id)
+        :entries: List of (type, relative_path, object_id), paths use "/"
+        :store: the repo's ObjectStore the sub-trees are written to
         '''
         tree = cls.__new__(cls)
         tree.tree_path = base_path
+        tree.path_type = "tree"
         tree.children = []
 
         staged = {}
 
         for path_type, relative_path, sha in entries:
-            parts = relative_path.split(os.sep, 1)
+            parts = relative_path.split("/", 1)
             name = parts[0]
             rest = parts[1] if len(parts) > 1 else None
 
@@ -44,16 +120,83 @@ class Tree:
                 
         for name, sub_entries in staged.items():
             sub_base = os.path.join(base_path, name)
-            sub_tree = cls.from_index(sub_base, sub_entries)
-            tree.children.append(("tree", name, sub_tree.store()))
-        
+            sub_tree = cls.from_index(sub_base, sub_entries, store)
+            tree.children.append(("tree", name, sub_tree.write(store)))
+
+        tree.children.sort(key=lambda child: child[1])
         return tree
 
 
-    def store(self) -> str:
+    @classmethod
+    def update(cls, base_sha: str, changes: dict, store: ObjectStore = None) -> str:
+        '''
+        Applies changes to a stored tree, writing new trees only along the changed paths
+
+        Every subtree no change touches keeps its existing sha and is never loaded.
+
+        :base_sha: the tree to start from, None for an empty tree
+        :changes: relative path ("/"-separated) -> blob sha, or None to remove the path
+        :store: the repo's ObjectStore, default_store() when not given
+
+        **returns**(str): object id (sha256) of the new tree
+        '''
+        return cls._update(base_sha, changes, store or default_store(), is_root=True)
+
+    @classmethod
+    def _update(cls, base_sha, changes: dict, store: ObjectStore, is_root: bool = False):
+        #Returns the new sha, or None when a subtree ends up empty
+        children = {}
+        if base_sha is not None:
+            children = {name: (entry_type, sha) for entry_type, name, sha in cls.load(base_sha, store).children}
+
+        nested = {}
+        for path, sha in changes.items():
+            name, _, rest = path.partition("/")
+            if rest:
+                nested.setdefault(name, {})[rest] = sha
+            elif sha is None:
+                children.pop(name, None)
+            else:
+                children[name] = ("blob", sha)
+
+        for name, sub_changes in nested.items():
+            entry_type, sub_sha = children.get(name, (None, None))
+            #A file being replaced by a directory starts from an empty tree
+            new_sha = cls._update(sub_sha if entry_type == "tree" else None, sub_changes, store)
+            if new_sha is None:
+                children.pop(name, None)
+            else:
+                children[name] = ("tree", new_sha)
+
+        if not children and not is_root:
+            return None
+
+        tree = cls.__new__(cls)
+        tree.tree_path = None
+        tree.path_type = "tree"
+        tree.children = [(entry_type, name, sha) for name, (entry_type, sha) in sorted(children.items())]
+        return tree.write(store)
+
+
+    def store(self, index=None, workers: int = None, executor: str = "thread", store: ObjectStore = None) -> str:
         '''
         Used to store tree objects
+
+        :index: optional Index, files whose stat data matches it reuse the recorded sha
+            instead of being read and hashed again
+        :workers: hash blobs across this many threads/processes, the tree sha is the same
+            as a serial store
+        :executor: "thread" or "process"
+        :store: the repo's ObjectStore, found from the tree's location when not given
         '''
+        store = store or ObjectStore.for_path(self.tree_path)
+        #Every blob and subtree goes into one write batch, joining the caller's if it has one
+        with store.batch() as store:
+            if workers and workers > 1:
+                return self._store_parallel(index, workers, executor, store)
+            return self._store_serial(index, store)
+
+    def _store_serial(self, index, store: ObjectStore) -> str:
         self.children = []
         self.path_type = Tree.check_path_type(self.tree_path)
 
@@ -67,19 +210,128 @@ class Tree:
             file_path = os.path.join(self.tree_path, each_child)
             path_type = Tree.check_path_type(file_path)
             if path_type == "tree":
-                self.children.append((path_type, each_child, Tree.handle_tree(file_path)))
+                self.children.append((path_type, each_child, Tree.handle_tree(file_path, index, store)))
             elif path_type == "blob":
-                self.children.append((path_type, each_child, Tree.handle_file(file_path)))
+                self.children.append((path_type, each_child, Tree.handle_file(file_path, index, store)))
 
-        #Reads the data and sets it to the blob-object
+        return self.write(store)
+
+    def _store_parallel(self, index, workers: int, executor: str, store: ObjectStore) -> str:
+        #Walk everything first, hash all files in a pool, then write trees bottom-up
+        self.path_type = Tree.check_path_type(self.tree_path)
+        layout = Tree._scan(self.tree_path)
+
+        files = []
+        def collect(entries):
+            for path_type, _, path, sub_entries in entries:
+                if path_type == "tree":
+                    collect(sub_entries)
+                else:
+                    files.append(path)
+        collect(layout)
+
+        shas = Tree.hash_files(files, index, workers, executor, store)
+        self.children = Tree._build_children(layout, shas, store)
+        return self.write(store)
+
+    @staticmethod
+    def _scan(path: str) -> list:
+        #Returns sorted (type, name, path, sub_entries) for a directory, recursively
+        entries = []
+        with os.scandir(path) as it:
+            children = sorted(it, key=lambda child: child.name)
+        for child in children:
+            if child.name == ".minigit":
+                continue
+            if child.is_file():
+                entries.append(("blob", child.name, child.path, None))
+            elif child.is_dir():
+                entries.append(("tree", child.name, child.path, Tree._scan(child.path)))
+        return entries
+
+    @staticmethod
+    def _build_children(layout: list, shas: dict, store: ObjectStore) -> list:
+        #Stores sub-trees deepest first, so every tree is written after its children
+        children = []
+        for path_type, name, path, sub_entries in layout:
+            if path_type == "tree":
+                sub_tree = Tree(path)
+                sub_tree.path_type = "tree"
+                sub_tree.children = Tree._build_children(sub_entries, shas, store)
+                children.append(("tree", name, sub_tree.write(store)))
+            else:
+                children.append(("blob", name, shas[path]))
+        return children
+
+    @staticmethod
+    def hash_files(paths: list, index=None, workers: int = None, executor: str = "thread", store: ObjectStore = None) -> dict:
+        '''
+        Stores each file as a blob, skipping files the index says are unchanged
+
+        :workers: when above 1, blobs are hashed in a pool of this many threads/processes
+        :executor: "thread" or "process"
+        :store: the repo's ObjectStore, found from the files' location when not given
+
+        **returns**(dict): path -> object id (sha256)
+        '''
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor: {executor}, expected 'thread' or 'process'")
+
+        shas = {}
+        stats = {}
+        todo = []
+        for path in paths:
+            if index is not None:
+                relative_path = normalize_path(os.path.relpath(path, index.root))
+                st = os.stat(path)
+                entry = index.is_fresh(relative_path, st)
+                if entry is not None:
+                    shas[path] = entry.object_id
+                    continue
+                stats[path] = (relative_path, st)
+            todo.append(path)
+
+        if todo and store is None:
+            store = ObjectStore.for_path(todo[0])
+
+        if workers and workers > 1 and len(todo) > 1 and executor == "process":
+            #Workers can't join this process's batch, they hand their temp files back to it
+            with store.batch() as store, ProcessPoolExecutor(max_workers=workers) as pool:
+                chunk = max(1, len(todo) // (workers * 4))
+                for path, (sha, pending) in zip(todo, pool.map(_stage_blob, todo, [store] * len(todo), chunksize=chunk)):
+                    store.write_batch.adopt(pending)
+                    shas[path] = sha
+        elif workers and workers > 1 and len(todo) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                chunk = max(1, len(todo) // (workers * 4))
+                shas.update(zip(todo, pool.map(_store_blob, todo, [store] * len(todo), chunksize=chunk)))
+        else:
+            for path in todo:
+                shas[path] = _store_blob(path, store)
+
+        #The index is only touched here, never from the workers
+        for path, (relative_path, st) in stats.items():
+            index.update(relative_path, st, shas[path])
+        return shas
+
+    def write(self, store: ObjectStore = None) -> str:
+        '''
+        Stores the tree from its current children, returning the object id
+
+        :store: the repo's ObjectStore, found from the tree's location when not given
+        '''
+        #Stored sorted by name, which find() relies on (every builder sorts already)
+        if not isinstance(self.children, TreeChildren):
+            self.children.sort(key=lambda child: child[1])
         self.data = self.read_child_data()
         
         self.header = make_header("tree", self.data)
         self.object_id = create_obj_id(self.header, self.data)
 
-        BASE_DIR = os.getenv("BASE_DIR", os.getcwd())
+        if store is None:
+            store = ObjectStore.for_path(self.tree_path) if self.tree_path else default_store()
 
-        write_to_disk(BASE_DIR, self.object_id, self.header + self.data)
+        store.write(self.object_id, self.header + self.data)
 
 
         #Returnst the object id
@@ -105,50 +357,83 @@ class Tree:
     
     def read_child_data(self) -> bytes:
         '''
-        Reads the data and encodes it as bytes
+        Encodes self.children as a binary (version 2) tree body
+
+        Each obj in self.children is a (entry_type, file_name, obj_id) tuple
+
+        :Raises: ValueError if a child's type isn't "blob" or "tree"
         '''
+        children = self.children
+        if isinstance(children, TreeChildren):
+            modes, names, digests = children.modes, children.names, children.digests
+        else:
+            modes, names, digests = [], [], []
+            for entry_type, file_name, obj_id in children:
+                if entry_type not in MODES:
+                    raise ValueError(f"Unknown tree entry type: {entry_type}")
+                modes.append(MODES[entry_type])
+                names.append(file_name)
+                digests.append(bytes.fromhex(obj_id))
+            digests = b"".join(digests)
+
+        encoded = [name.encode("utf-8") for name in names]
+        count = len(encoded)
+        return b"".join((
+            _TREE_MARKER,
+            _COUNT.pack(count),
+            struct.pack(f">{count}I", *modes),
+            struct.pack(f">{count}H", *map(len, encoded)),
+            digests,
+            *encoded,
+        ))
+
+    def find(self, name: str):
         '''
-        Each obj in self.children is a tuple of (entry_type, file_name, obj_id)
-        It then gets added to lines and joined. to be returned as data
+        Returns the (type, name, sha) of the child called name, or None, by binary search
+        over the sorted children of a loaded tree
         '''
-        lines = []
-        for entry_type, file_name, obj_id in self.children:
-            lines.append(f"{entry_type} {file_name} {obj_id}")
-        return "\n".join(lines).encode("ascii")
-
-
+        children = self.children
+        if not isinstance(children, TreeChildren):
+            #Built in memory, only sorted once written
+            return next((child for child in children if child[1] == name), None)
+        i = bisect_left(children.names, name)
+        if i < len(children.names) and children.names[i] == name:
+            return children[i]
+        return None
 
     @staticmethod
-    def handle_file(path: str) -> str:
+    def handle_file(path: str, index=None, store: ObjectStore = None) -> str:
         '''
-        Takes in a path and creates a blob obj
+        Takes in a path and creates a blob obj, unless the index says it's unchanged
 
         **returns**(str): object id (sha256)
         '''
+        if index is not None:
+            return Tree.hash_files([path], index, store=store)[path]
+
         new_blob = Blob(path)
-        blob = new_blob.store()
+        blob = new_blob.store(store)
         return blob
     
     @staticmethod
-    def handle_tree(path: str) -> str:
+    def handle_tree(path: str, index=None, store: ObjectStore = None) -> str:
         '''
         Takes in a path and creates a tree obj
 
         **returns**(str): object id (sha256)
         '''
         new_tree = Tree(path)
-        tree = new_tree.store()
+        tree = new_tree.store(index, store=store)
         return tree
         
 
     @classmethod
-    def load(cls, object_id: str) -> "Tree":
-        #Loads the stored tree-path and reads raw bytes
-        path = decode_sha_to_path(object_id)
-        validate_file(path)
-        with open(path, "rb") as f:
-            content = f.read()
-        
+    def load(cls, object_id: str, store: ObjectStore = None) -> "Tree":
+        #Loads through the repo's object cache, reading raw bytes only on a miss
+        return (store or default_store()).load(object_id, cls, cls._parse)
+
+    @classmethod
+    def _parse(cls, object_id: str, content: bytes, store: ObjectStore = None) -> "Tree":
         #Extract the header and body
         index = content.find(b'\0')
         raw_header = content[:index + 1]
@@ -162,14 +447,11 @@ class Tree:
         assert int(length) == len(body), f"Body is not {length} long, failure"
 
 
-        lines = body.decode("ascii").splitlines()
-
+        if body[:1] == b"\0":
+            children = cls._parse_binary(object_id, body)
+        else:
+            children = cls._parse_text(body)
 
-        children = []
-        for line in lines:
-            entry_type, file_name, obj_id = line.strip().split()
-            children.append((entry_type, file_name, obj_id))
-        
         #make new tree:
         tree = cls.__new__(cls)
         tree.object_id = object_id
@@ -181,9 +463,59 @@ class Tree:
 
         return tree
     
+    @staticmethod
+    def _parse_binary(object_id: str, body: bytes) -> TreeChildren:
+        if body[1:2] != bytes([TREE_VERSION]):
+            raise ValueError(f"Unsupported tree version {body[1:2].hex()}: {object_id}")
+        try:
+            pos = len(_TREE_MARKER)
+            count, = _COUNT.unpack_from(body, pos)
+            pos += _COUNT.size
+            modes = list(struct.unpack_from(f">{count}I", body, pos))
+            pos += 4 * count
+            lengths = struct.unpack_from(f">{count}H", body, pos)
+            pos += 2 * count
+        except struct.error:
+            raise ValueError(f"Corrupt tree: {object_id}") from None
+        digests = body[pos:pos + DIGEST_SIZE * count]
+        pos += DIGEST_SIZE * count
+
+        raw_names = body[pos:]
+        if len(digests) != DIGEST_SIZE * count or sum(lengths) != len(raw_names) or not all(mode in TYPES for mode in modes):
+            raise ValueError(f"Corrupt tree: {object_id}")
+        #Byte lengths are character lengths when every name is ascii, the usual case
+        text = raw_names.decode("utf-8")
+        if len(text) != len(raw_names):
+            text = raw_names
+        ends = list(accumulate(lengths, initial=0))
+        names = [text[start:end] for start, end in zip(ends, ends[1:])]
+        if text is raw_names:
+            names = [name.decode("utf-8") for name in names]
+        return TreeChildren(modes, names, digests)
+
+    @staticmethod
+    def _parse_text(body: bytes) -> TreeChildren:
+        #Version 1, one "type name sha" line per child, in whatever order they were added
+        #(older writers put files before dirs), sorted here so find() can bisect
+        entries = sorted((line.strip().split() for line in body.decode("ascii").splitlines()), key=lambda entry: entry[1])
+        modes = [MODES[entry_type] for entry_type, _, _ in entries]
+        names = [file_name for _, file_name, _ in entries]
+        return TreeChildren(modes, names, bytes.fromhex("".join(obj_id for _, _, obj_id in entries)))
+
     def __str__(self):
         return self.tree_path if self.tree_path else f"Tree {self.object_id}"
 
+def _store_blob(path: str, store: ObjectStore = None) -> str:
+    return Blob(path).store(store)
+
+
+def _stage_blob(path: str, store: ObjectStore) -> tuple[str, dict]:
+    #Module level so process pools can pickle it, returns (sha, object_id -> temp path)
+    with store.staged() as staging:
+        sha = Blob(path).store(staging)
+    return sha, dict(staging.write_batch.pending)
+
+
 if __name__ == "__main__":
     
     tree_path = os.path.join(f"..\\test_repo")
@@ -2,25 +2,34 @@
 File and Directory validation for my mini-git
 
 Contains:
-    - make_header(), create_obj_id(), write_to_disk()
-    - validate_file(), validate_directory()
+    - decode_sha_to_path(), make_header(), create_obj_id(), write_to_disk()
+    - stream_file_to_disk(), hash_file(), read_object_file(), read_object_header()
+    - resolve_head(), write_ref(), fsync_dir(), validate_file(), validate_directory()
+    - build_fanout(), fanout_lower_bound(), fanout_search()
 '''
 import os
 import hashlib
+import tempfile
 
+from mini_git import instrument
+from mini_git.compression import decompress, decompressor, detect_codec
 
+#Size of each read when streaming files, keeps memory flat regardless of file size
+CHUNK_SIZE = 1 << 16
 
-def decode_sha_to_path(object_id: str) -> str:
+
+
+def decode_sha_to_path(object_id: str, store=None) -> str:
     '''
-    Takes in a sha and returns a filepath based on the base_dir
+    Takes in a sha and returns a filepath inside the store's objects dir
     
     :args: 
         object_id: a SHA256 in str
+        store: the repo's ObjectStore, default_store() when not given
     '''
-    folder, file_name = object_id[0:2], object_id[2:]
-    BASE_DIR = os.getenv("BASE_DIR", os.getcwd())
-    object_path = os.path.join(BASE_DIR, ".minigit","objects")
-    return os.path.join(object_path, folder, file_name)
+    #Imported here, the object store itself is built on these helpers
+    from mini_git.object_store import default_store
+    return (store or default_store()).path_for(object_id)
 
 
 def make_header(tag: str, body: bytes) -> bytes:
@@ -34,7 +43,20 @@ def make_header(tag: str, body: bytes) -> bytes:
     Returns:
         a header b"tag " + str(len(body)) + b"\\0"
     '''
-    return tag.encode("ascii") + b" " + str(len(body)).encode("ascii") + b"\0"
+    return make_header_from_size(tag, len(body))
+
+def make_header_from_size(tag: str, size: int) -> bytes:
+    '''
+    Creates the header from a known body length, for when the body is streamed
+
+    Args:
+        tag(str): Obj type (blob/tree)
+        size(int): the length of the body in bytes
+
+    Returns:
+        a header b"tag " + str(size) + b"\\0"
+    '''
+    return tag.encode("ascii") + b" " + str(size).encode("ascii") + b"\0"
 
 def create_obj_id(header: bytes, body: bytes) -> str:
     '''
@@ -47,32 +69,233 @@ def create_obj_id(header: bytes, body: bytes) -> str:
     Returns:
         Object ID (str)
     '''
+    #Called for every tree and commit, so it doesn't even pay for a wrapper when off
+    if instrument.enabled:
+        with instrument.timer("hash"):
+            instrument.count("bytes_hashed", len(header) + len(body))
+            return hashlib.sha256(header + body).hexdigest()
     return hashlib.sha256(header + body).hexdigest()
 
 def write_to_disk(BASE_DIR: str, obj_id: str, obj_bytes: bytes) -> None:
     '''
-    Writes the incoming data to a file
+    Writes the incoming data to a file, compressed with the repo's codec
 
     Args:
         BASE_DIR(str): the base directory
         obj_id(str): the sha256 as a string
         obj_bytes(bytes): combined header + content
     '''
-    folder, file_name = obj_id[:2], obj_id[2:]
-    folder_path = os.path.join(BASE_DIR, ".minigit","objects", folder)
-    os.makedirs(folder_path, exist_ok=True)
-    #full-link to directory
-    new_file = os.path.join(folder_path, file_name)
-    if not os.path.exists(new_file):
-        try:
-            #then creates the file and writes both the header and data
-            with open(new_file, "wb") as out:
-                #Writes with the header, to ensure it's being read as a "blob" 
-                out.write(obj_bytes)
-        except OSError as e:
-            raise IOError(f"Could not write ojbect to disk: {new_file}\n{e}") from e
+    from mini_git.object_store import ObjectStore
+    ObjectStore.open(BASE_DIR).write(obj_id, obj_bytes)
+
+
+def stream_file_to_disk(BASE_DIR: str, tag: str, file_path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    '''
+    Hashes and stores a file as an object in fixed-size chunks, reading it only once
+
+    Args:
+        BASE_DIR(str): the base directory
+        tag(str): Obj type (blob)
+        file_path(str): the file being stored
+        chunk_size(int): bytes read per chunk
+
+    Returns:
+        Object ID (str)
+    '''
+    from mini_git.object_store import ObjectStore
+    return ObjectStore.open(BASE_DIR).write_stream(tag, file_path, chunk_size)
+
+
+@instrument.instrumented("hash")
+def hash_file(tag: str, file_path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    '''
+    Returns the object id a file would be stored under, without storing anything
+
+    Args:
+        tag(str): Obj type (blob)
+        file_path(str): the file being hashed
+        chunk_size(int): bytes read per chunk
+
+    Raises:
+        FileNotFoundError: if the file does not exist
+    '''
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        hasher = hashlib.sha256(make_header_from_size(tag, size))
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    instrument.count("syscalls.open")
+    instrument.count("bytes_hashed", size)
+    return hasher.hexdigest()
+
+
+def read_object_file(path: str) -> bytes:
+    '''
+    Reads a stored object and returns the decoded header + body
+
+    Works for compressed objects and for raw ones written before compression existed.
+
+    Args:
+        path(str): path to the object file
+    '''
+    with open(path, "rb") as f:
+        stored = f.read()
+    instrument.count("syscalls.open")
+    instrument.count("bytes_read", len(stored))
+    return decompress(stored)
+
+
+def read_object_header(path: str) -> tuple[str, int]:
+    '''
+    Reads just enough of a stored object to return its (type, size)
+
+    Args:
+        path(str): path to the object file
+
+    Raises:
+        ValueError: if no header is found
+    '''
+    with open(path, "rb") as f:
+        first = f.read(64)
+        unpacker = decompressor(detect_codec(first))
+        content = unpacker.decompress(first)
+        while b"\0" not in content:
+            more = f.read(64)
+            if not more:
+                raise ValueError(f"Corrupt object, no header found: {path}")
+            content += unpacker.decompress(more)
+
+    header_type, length = content[:content.index(b"\0")].decode("ascii").split()
+    return header_type, int(length)
+
+
+def resolve_head(BASE_DIR: str) -> tuple[str, str]:
+    '''
+    Reads HEAD, which is "ref: refs/heads/<branch>" or a bare commit sha when detached
+
+    Args:
+        BASE_DIR(str): the base directory
+
+    Returns:
+        (path of the file the next commit's sha goes in, current sha or None)
+    '''
+    head_path = os.path.join(BASE_DIR, ".minigit", "HEAD")
+    with open(head_path, "r") as f:
+        line = f.read().strip()
+
+    if not line.startswith("ref:"):
+        return head_path, line or None
+
+    ref_path = os.path.join(BASE_DIR, ".minigit", line.split(None, 1)[1])
+    try:
+        with open(ref_path, "r") as f:
+            return ref_path, f.read().strip() or None
+    except FileNotFoundError:
+        #The branch is only made by its first commit
+        return ref_path, None
+
+
+def write_ref(ref_path: str, value: str, durable: bool = True) -> None:
+    '''
+    Points a ref or HEAD at a commit sha (or "ref: ..." for HEAD), atomically
+
+    The sha goes to a temp file next to the ref that's renamed over it, so a crash leaves
+    either the old or the new value, never a torn one.
+
+    Args:
+        ref_path(str): the ref file
+        value(str): what the ref holds
+        durable(bool): fsync the temp file and then the ref's directory
+    '''
+    parent_dir = os.path.dirname(ref_path)
+    os.makedirs(parent_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_ref_", dir=parent_dir)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(value)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+                instrument.count("syscalls.fsync")
+        os.replace(tmp_path, ref_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if durable:
+        fsync_dir(parent_dir)
+
+
+def fsync_dir(dir_path: str) -> None:
+    '''
+    Makes the entries of a directory durable, after files were created or renamed in it
+
+    A no-op where directories can't be opened (Windows).
+    '''
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except (PermissionError, IsADirectoryError):
+        return
+    try:
+        os.fsync(fd)
+        instrument.count("syscalls.fsync")
+    finally:
+        os.close(fd)
+
+
+def build_fanout(raw_names) -> list:
+    '''
+    Returns the 256 cumulative bucket counts of a sorted table of raw shas
+
+    Entry i is the number of names whose first byte is <= i, the table that starts every
+    sorted name file (pack .idx, commit-graph, changed-paths, name index).
+
+    Args:
+        raw_names: the raw shas, in sorted order
+    '''
+    fanout = [0] * 256
+    for raw in raw_names:
+        fanout[raw[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    return fanout
+
+
+def fanout_lower_bound(fanout, name_at, raw_sha: bytes) -> int:
+    '''
+    Returns the first position whose name is >= raw_sha, searching only its fanout bucket
+
+    Args:
+        fanout: the 256 cumulative bucket counts of the table
+        name_at: callable returning the raw name at a position
+        raw_sha(bytes): the name looked for, at least one byte long
+    '''
+    first = raw_sha[0]
+    lo = fanout[first - 1] if first else 0
+    hi = fanout[first]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if name_at(mid) < raw_sha:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def fanout_search(fanout, name_at, raw_sha: bytes) -> int:
+    '''
+    Returns the position of raw_sha in a fanout-indexed sorted table, or -1
+    '''
+    pos = fanout_lower_bound(fanout, name_at, raw_sha)
+    if pos < fanout[raw_sha[0]] and name_at(pos) == raw_sha:
+        return pos
+    return -1
 
 
+@instrument.instrumented("validate")
 def validate_file(file_path: str) -> None:
     '''
     Validates a file and raises appropriate exceptions
@@ -90,8 +313,10 @@ def validate_file(file_path: str) -> None:
             - if the file cannot be read
     '''
 
+    instrument.count("syscalls.stat")
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f"File does not exist: {file_path}")
+    instrument.count("syscalls.open")
     try:
         with open(file_path, "rb") as f:
             if not f.read(1):
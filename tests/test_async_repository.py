@@ -0,0 +1,114 @@
+import os
+import time
+import shutil
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from mini_git import AsyncRepository, Blob, Tree
+
+
+class TestAsyncRepository(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_async"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.arepo = AsyncRepository(self.repo_dir, max_workers=2, max_concurrency=2)
+
+        for i in range(3):
+            with open(os.path.join(self.repo_dir, f"file_{i}.txt"), "w") as f:
+                f.write(f"this is file {i}")
+
+    def tearDown(self):
+        self.arepo.close()
+        self.arepo.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    async def test_add_commit_log(self):
+        shas = []
+        for i in range(3):
+            await self.arepo.add(f"file_{i}.txt")
+            shas.append(await self.arepo.commit("test", f"commit {i}"))
+
+        records = [record async for record in self.arepo.log(page_size=2)]
+        self.assertEqual([record.object_id for record in records], shas[::-1])
+        self.assertEqual([record.object_id async for record in self.arepo.log(n=1)], shas[-1:])
+
+        with self.assertRaises(ValueError):
+            await self.arepo.commit("test", "")
+
+    async def test_commit_between_log_pages(self):
+        shas = []
+        for i in range(3):
+            await self.arepo.add(f"file_{i}.txt")
+            shas.append(await self.arepo.commit("test", f"commit {i}"))
+
+        pages = self.arepo.log(page_size=1)
+        self.assertEqual((await pages.__anext__()).object_id, shas[-1])
+        with open(os.path.join(self.repo_dir, "file_0.txt"), "w") as f:
+            f.write("changed while logging")
+        await self.arepo.add("file_0.txt")
+        await self.arepo.commit("test", "made between pages")
+        #the rest of the log is the history it started from
+        self.assertEqual([record.object_id async for record in pages], shas[-2::-1])
+
+    async def test_reads_are_batched(self):
+        tree_sha = await self.arepo.add(".")
+        tree = await self.arepo.read_object(tree_sha)
+        self.assertIsInstance(tree, Tree)
+        blob_shas = [sha for _, _, sha in tree.children]
+
+        with mock.patch.object(self.arepo, "_read_many", wraps=self.arepo._read_many) as read_many:
+            #the same object asked for twice is only read once
+            blobs = await self.arepo.read_objects(blob_shas + blob_shas[:1])
+
+        self.assertEqual(read_many.call_count, 1)
+        self.assertEqual(sorted(read_many.call_args[0][0]), sorted(blob_shas))
+        self.assertTrue(all(isinstance(blob, Blob) for blob in blobs))
+        self.assertEqual(blobs[0].data, b"this is file 0")
+        self.assertIs(blobs[0], blobs[-1])
+
+        #a missing object fails only its own read
+        results = await asyncio.gather(self.arepo.read_object("ff" * 32), self.arepo.read_object(blob_shas[1]),
+                                       return_exceptions=True)
+        self.assertIsInstance(results[0], FileNotFoundError)
+        self.assertEqual(results[1].data, b"this is file 1")
+
+    async def test_batch_reads_held_until_done(self):
+        tree_sha = await self.arepo.add(".")
+        read = asyncio.ensure_future(self.arepo.read_object(tree_sha))
+        #once flushed, the batch's task is only referenced by the facade
+        while not self.arepo._tasks:
+            await asyncio.sleep(0)
+        self.assertIsInstance(await read, Tree)
+        await asyncio.sleep(0)
+        self.assertEqual(self.arepo._tasks, set())
+
+    async def test_concurrency_limit(self):
+        tree_sha = await self.arepo.add(".")
+        commit_sha = await self.arepo.commit("test", "first")
+        running = []
+        peak = []
+        lock = threading.Lock()
+        read_commit = self.arepo.repo.read_commit
+
+        def slow_read(obj_id):
+            with lock:
+                running.append(obj_id)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+            return read_commit(obj_id)
+
+        with mock.patch.object(self.arepo.repo, "read_commit", slow_read):
+            commits = await asyncio.gather(*(self.arepo.read_commit(commit_sha) for _ in range(10)))
+
+        self.assertLessEqual(max(peak), 2)
+        self.assertTrue(all(commit.tree_sha == tree_sha for commit in commits))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import random
+import shutil
+import unittest
+
+from benchmarks.synthetic import generate_repo, size_sampler
+from benchmarks.suite import run, PHASES
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.dirs = ["test_bench_a", "test_bench_b"]
+        for path in self.dirs:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def tearDown(self):
+        for path in self.dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def test_generator_is_reproducible(self):
+        trees = []
+        for path in self.dirs:
+            repo, shas = generate_repo(path, files=30, depth=2, fanout=3, commits=3, seed=7)
+            self.assertEqual(len(shas), 3)
+            trees.append([repo.read_commit(sha).tree_sha for sha in shas])
+            repo._close_commit_graph()
+        self.assertEqual(trees[0], trees[1])
+        #every commit changed something
+        self.assertEqual(len(set(trees[0])), 3)
+
+    def test_size_specs(self):
+        rng = random.Random(0)
+        self.assertEqual(size_sampler("fixed:10", rng)(), 10)
+        self.assertTrue(all(5 <= size_sampler("uniform:5-9", rng)() <= 9 for _ in range(20)))
+        for spec in ("normal:10", "fixed:", "uniform:9"):
+            with self.assertRaises(ValueError):
+                size_sampler(spec, rng)
+
+    def test_report(self):
+        params = {"files": 20, "depth": 2, "fanout": 3, "sizes": "fixed:256", "commits": 2, "changes": 2, "seed": 0}
+        report = run(params)
+        self.assertEqual(tuple(report["results"]), PHASES)
+        for entry in report["results"].values():
+            self.assertGreaterEqual(entry["seconds"], 0)
+            self.assertGreater(entry["peak_bytes"], 0)
+        self.assertEqual(report["results"]["log"]["commits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
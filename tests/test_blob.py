@@ -3,7 +3,8 @@ import os
 import shutil
 from random import randrange
 
-from mini_git import Blob
+from mini_git import Blob, create_obj_id, make_header
+from mini_git.utils import stream_file_to_disk
 
 #Unittesting for my blob-class
 class TestBlob(unittest.TestCase):
@@ -37,6 +38,20 @@ class TestBlob(unittest.TestCase):
         #assertion for unnittest, reads the SHA
         self.assertEqual(load_blob.data.decode(),("This is just a test document" + self.random_num))
 
+    #streaming in small chunks must give the same sha as hashing it all at once
+    def test_blob_streamed_in_chunks(self):
+        data = os.urandom(200_000)
+        with open(self.test_file, "wb") as f:
+            f.write(data)
+
+        object_id = stream_file_to_disk(self.repo_dir, "blob", self.test_file, chunk_size=4096)
+
+        self.assertEqual(object_id, create_obj_id(make_header("blob", data), data))
+        self.assertEqual(Blob.load(object_id).data, data)
+        #no temp files should be left in the objects dir
+        objects = os.path.join(self.repo_dir, ".minigit", "objects")
+        self.assertFalse([name for name in os.listdir(objects) if name.startswith("tmp_obj_")])
+
 #Run baby run
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Tree, instrument
+from mini_git.bloom import make_filter, might_contain, MAX_PATHS
+from mini_git.config import write_config
+
+
+class TestChangedPaths(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_bloom"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        #commits alternate between src/api and docs, the last one touches both
+        self.commits = []
+        for i, paths in enumerate([["src/api/views.py", "docs/index.md"], ["docs/index.md"],
+                                   ["src/api/views.py"], ["docs/guide.md"], ["src/api/urls.py", "docs/index.md"]]):
+            for path in paths:
+                self.write(path, f"{path} version {i}")
+                self.repo.add(path)
+            self.commits.append(self.repo.commit("test", f"commit {i}"))
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        instrument.disable()
+        instrument.reset()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.repo_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(text)
+
+    def shas(self, records):
+        return [record.object_id for record in records]
+
+    def test_filter(self):
+        bloom = make_filter(["src/api/views.py"])
+        for path in ("src", "src/api", "src/api/views.py"):
+            self.assertTrue(might_contain(bloom, path))
+        misses = sum(might_contain(bloom, f"other/{i}") for i in range(1000))
+        self.assertLess(misses, 50)
+        #too many paths always says maybe
+        self.assertTrue(might_contain(make_filter(f"f{i}" for i in range(MAX_PATHS + 1)), "anything"))
+
+    def test_log_by_path(self):
+        c = self.commits
+        self.assertEqual(self.shas(self.repo.log(path="src/api/")), [c[4], c[2], c[0]])
+        self.assertEqual(self.shas(self.repo.log(path="docs/index.md")), [c[4], c[1], c[0]])
+        self.assertEqual(self.shas(self.repo.log(1, path="docs")), [c[4]])
+        self.assertEqual(self.repo.log(path="missing"), [])
+
+    def test_negatives_skip_tree_loads(self):
+        with instrument.recording(), mock.patch.object(Tree, "load", wraps=Tree.load) as load:
+            self.repo.cache.clear()
+            self.assertEqual(len(self.repo.log(path="src/api/urls.py")), 1)
+            counters = instrument.snapshot()["counters"]
+        #only filter positives are compared, 2 trees along the path each side
+        checked = counters.get("changed_paths.checked", 0)
+        self.assertEqual(checked + counters.get("changed_paths.skipped", 0), 5)
+        self.assertLess(checked, 5)
+        self.assertLessEqual(load.call_count, checked * 6)
+
+    def test_backfill_for_commits_without_filters(self):
+        os.remove(os.path.join(self.repo_dir, ".minigit", "objects", "info", "changed-paths"))
+        self.assertIsNone(self.repo.changed_path_filters())
+        #still right without filters, every commit is compared
+        self.assertEqual(len(self.repo.log(path="src")), 3)
+
+        self.assertEqual(self.repo.write_changed_paths(), 5)
+        self.assertEqual(self.repo.write_changed_paths(), 0)
+        self.assertEqual(len(self.repo.changed_path_filters()), 5)
+        self.assertEqual(len(self.repo.log(path="src")), 3)
+
+    def test_commits_only_rewrite_the_tail(self):
+        main = os.path.join(self.repo_dir, ".minigit", "objects", "info", "changed-paths")
+        blooms = self.repo.changed_path_filters()
+        #the first commit wrote the main file, the rest went to the tail
+        self.assertEqual((blooms.count, len(blooms.tail), len(blooms)), (1, 4, 5))
+        with open(main, "rb") as f:
+            main_data = f.read()
+
+        with mock.patch("mini_git.repository.TAIL_FILTERS", 6):
+            for i, path in enumerate(["docs/index.md", "src/api/views.py"], 5):
+                self.write(path, f"{path} version {i}")
+                self.repo.add(path)
+                self.commits.append(self.repo.commit("test", f"commit {i}"))
+                if i == 5:
+                    with open(main, "rb") as f:
+                        self.assertEqual(f.read(), main_data)
+        #the sixth tail filter merged everything into the main file
+        self.assertFalse(os.path.exists(main + "-tail"))
+        blooms = self.repo.changed_path_filters()
+        self.assertEqual((blooms.count, len(blooms)), (7, 7))
+        c = self.commits
+        self.assertEqual(self.shas(self.repo.log(path="src")), [c[6], c[4], c[2], c[0]])
+        self.assertEqual(self.shas(self.repo.log(path="docs/index.md")), [c[5], c[4], c[1], c[0]])
+
+    def test_turned_off(self):
+        write_config(self.repo_dir, changed_paths="false")
+        self.write("new.txt", "new")
+        self.repo.add("new.txt")
+        sha = self.repo.commit("test", "unfiltered")
+        self.assertNotIn(sha, self.repo.changed_path_filters())
+        self.assertEqual(self.shas(self.repo.log(path="new.txt")), [sha])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import random
+import shutil
+import unittest
+import tracemalloc
+
+from mini_git import Repository, Blob
+from mini_git.body import BufferBody, InflatingBody, ChunkedBody
+
+
+class TestObjectBody(unittest.TestCase):
+
+    def setUp(self):
+        self.dirs = ["test_repo_body_raw", "test_repo_body_zlib"]
+        for path in self.dirs:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        self.data = random.Random(3).randbytes(4_000_000)
+
+    def tearDown(self):
+        for path in self.dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def store(self, repo, data):
+        path = os.path.join(repo.dir_path, "big.bin")
+        with open(path, "wb") as f:
+            f.write(data)
+        return Blob(path).store(repo.store)
+
+    def test_uncompressed_blob_is_mapped_without_copying(self):
+        repo = Repository(self.dirs[0], compression="none")
+        sha = self.store(repo, self.data)
+
+        tracemalloc.start()
+        with Blob.open(sha, repo.store) as body:
+            view = body.getbuffer()
+            self.assertEqual(body.size, len(self.data))
+            self.assertEqual(view[-10:], self.data[-10:])
+            peak = tracemalloc.get_traced_memory()[1]
+            view.release()
+        tracemalloc.stop()
+        self.assertIsInstance(body, BufferBody)
+        self.assertLess(peak, 64 * 1024)
+
+        #reads like a file too
+        with Blob.open(sha, repo.store) as body:
+            body.seek(1000)
+            self.assertEqual(body.read(16), self.data[1000:1016])
+            self.assertEqual(body.read(), self.data[1016:])
+
+    def test_compressed_blob_is_streamed(self):
+        repo = Repository(self.dirs[1])
+        data = bytes(3_000_000) + self.data[:100_000]
+        sha = self.store(repo, data)
+
+        with Blob.open(sha, repo.store) as body:
+            self.assertIsInstance(body, InflatingBody)
+            self.assertEqual(body.size, len(data))
+            tracemalloc.start()
+            pieces = []
+            while True:
+                piece = body.read(1 << 16)
+                if not piece:
+                    break
+                pieces.append(len(piece))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.assertEqual(sum(pieces), len(data))
+        #a run of zeros is never inflated in one go
+        self.assertLess(peak, 1_000_000)
+        with Blob.open(sha, repo.store) as body:
+            self.assertEqual(body.read(), data)
+
+    def test_chunked_and_packed_blobs(self):
+        repo = Repository(self.dirs[1], chunk_threshold=100_000)
+        data = self.data[:600_000]
+        sha = self.store(repo, data)
+        with Blob.open(sha, repo.store) as body:
+            self.assertIsInstance(body, ChunkedBody)
+            self.assertEqual(body.size, len(data))
+            self.assertEqual(body.read(), data)
+
+        repo.add("big.bin")
+        tree_sha = repo.read_commit(repo.commit("test", "first")).tree_sha
+        repo.repack()
+        with repo.store.open_body(tree_sha) as body:
+            self.assertEqual(body.type, "tree")
+            self.assertTrue(body.read())
+        with self.assertRaises(ValueError):
+            Blob.open(tree_sha, repo.store)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Blob, Tree, Commit
+from mini_git.cache import ObjectCache
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_cache"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir, cache_bytes=1 << 20)
+        self.repo.cache.clear()
+
+        with open(os.path.join(self.repo_dir, "file1.txt"), "w") as f:
+            f.write("this is file 1")
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def test_lru_eviction(self):
+        cache = ObjectCache(max_bytes=10)
+        cache.put("a", "A", 4)
+        cache.put("b", "B", 4)
+        #touching "a" makes "b" the least recently used
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("c", "C", 4)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        #anything bigger than the whole budget is never cached
+        cache.put("big", "BIG", 11)
+        self.assertNotIn("big", cache)
+
+    def test_objects_read_at_most_once(self):
+        tree_sha = self.repo.add(".")
+        blob_sha = Tree.load(tree_sha, self.repo.store).children[0][2]
+        self.repo.cache.clear()
+        #a repo made again at the same path can reuse the store, and its stats
+        hits = self.repo.cache.stats()["hits"]
+
+        with mock.patch.object(self.repo.store, "read_raw", wraps=self.repo.store.read_raw) as read_raw:
+            first = self.repo.read_object(blob_sha)
+            again = Blob.load(blob_sha, self.repo.store)
+            self.repo.read_object(blob_sha)
+
+        self.assertEqual(read_raw.call_count, 1)
+        self.assertIs(first, again)
+        self.assertEqual(self.repo.cache.stats()["hits"] - hits, 2)
+
+    def test_wrong_type_from_cache(self):
+        tree_sha = self.repo.add(".")
+        Tree.load(tree_sha, self.repo.store)
+        with self.assertRaises(AssertionError):
+            Blob.load(tree_sha, self.repo.store)
+
+    def test_cached_commit_left_untouched(self):
+        self.repo.add(".")
+        commit_sha = self.repo.commit("test", "first")
+
+        commit = self.repo.read_commit(commit_sha)
+        self.assertEqual(commit.tree.object_id, commit.tree_sha)
+        #the tree goes on a copy, not on the commit the cache hands out
+        cached = Commit.load(commit_sha, self.repo.store)
+        self.assertIsNot(commit, cached)
+        self.assertFalse(hasattr(cached, "tree"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import time
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository
+from mini_git.checkout import write_blob
+
+
+class TestCheckout(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_checkout"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        for i in range(10):
+            self.write(f"same/file_{i}.txt", f"never changes {i}")
+        self.write("edit.txt", "first version\n")
+        self.write("old/gone.txt", "only in the first commit")
+        self.repo.add(".")
+        self.first = self.repo.commit("test", "first")
+
+        self.write("edit.txt", "second version\n")
+        os.remove(self.path("old/gone.txt"))
+        self.write("new/added.txt", "only in the second commit")
+        self.repo.add(".")
+        self.second = self.repo.commit("test", "second")
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def path(self, name):
+        return os.path.join(self.repo_dir, *name.split("/"))
+
+    def write(self, name, text):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "w") as f:
+            f.write(text)
+        #back-date the file so it's never racy against the index write
+        past = time.time() - 10
+        os.utime(self.path(name), (past, past))
+
+    def read(self, name):
+        with open(self.path(name), "r") as f:
+            return f.read()
+
+    def test_checkout_touches_only_changed_paths(self):
+        untouched = os.stat(self.path("same/file_0.txt")).st_mtime_ns
+
+        with mock.patch("mini_git.checkout.write_blob", wraps=write_blob) as written:
+            self.assertEqual(self.repo.checkout(self.first), self.first)
+        self.assertEqual(sorted(call.args[2] for call in written.call_args_list),
+                         sorted([self.path("edit.txt"), self.path("old/gone.txt")]))
+
+        self.assertEqual(self.read("edit.txt"), "first version\n")
+        self.assertEqual(self.read("old/gone.txt"), "only in the first commit")
+        #the emptied dir is pruned too
+        self.assertFalse(os.path.exists(self.path("new")))
+        self.assertEqual(os.stat(self.path("same/file_0.txt")).st_mtime_ns, untouched)
+
+        #HEAD is detached at the commit, and the index matches it
+        self.assertEqual(self.repo.head_sha(), self.first)
+        self.assertTrue(self.repo.status().clean)
+
+        self.repo.checkout("master")
+        self.assertEqual(self.repo.head_sha(), self.second)
+        self.assertEqual(self.read("new/added.txt"), "only in the second commit")
+        self.assertFalse(os.path.exists(self.path("old")))
+        self.assertTrue(self.repo.status().clean)
+
+    @unittest.skipIf(os.name == "nt", "no POSIX file modes")
+    def test_checked_out_files_follow_umask(self):
+        os.chmod(self.path("edit.txt"), 0o640)
+        old_umask = os.umask(0o022)
+        try:
+            #the process umask is never touched, other threads may be creating files
+            with mock.patch("os.umask") as umask:
+                self.repo.checkout(self.first)
+            umask.assert_not_called()
+        finally:
+            os.umask(old_umask)
+        #a new file gets what open() would give it, not the temp file's 0600
+        self.assertEqual(os.stat(self.path("old/gone.txt")).st_mode & 0o777, 0o644)
+        #a replaced file keeps its own mode
+        self.assertEqual(os.stat(self.path("edit.txt")).st_mode & 0o777, 0o640)
+
+    def test_commit_on_detached_head(self):
+        self.repo.checkout(self.first)
+        self.write("edit.txt", "a third version\n")
+        self.repo.add("edit.txt")
+        third = self.repo.commit("test", "third")
+
+        self.assertEqual(self.repo.head_sha(), third)
+        self.assertEqual(self.repo.rev_list(), [third, self.first])
+        #the branch didn't move
+        self.assertEqual(self.repo.branch_tips()["master"], self.second)
+        #reopening the repo keeps HEAD where it is
+        self.assertEqual(Repository(self.repo_dir).head_sha(), third)
+
+    def test_local_changes_block_checkout(self):
+        self.write("edit.txt", "not committed\n")
+        with self.assertRaises(RuntimeError):
+            self.repo.checkout(self.first)
+        self.assertEqual(self.read("edit.txt"), "not committed\n")
+
+        self.repo.checkout(self.first, force=True)
+        self.assertEqual(self.read("edit.txt"), "first version\n")
+
+    def test_large_blob_is_streamed(self):
+        data = os.urandom(300_000)
+        with open(self.path("big.bin"), "wb") as f:
+            f.write(data)
+        self.repo.add("big.bin")
+        big = self.repo.commit("test", "big")
+
+        self.repo.checkout(self.second)
+        self.assertFalse(os.path.exists(self.path("big.bin")))
+        blob_sha = self.repo.diff(self.second, big)[0].new_sha
+        with mock.patch.object(self.repo.store, "read_raw", wraps=self.repo.store.read_raw) as read_raw:
+            self.repo.checkout(big)
+        #the blob was never read whole
+        self.assertNotIn(blob_sha, [call.args[0] for call in read_raw.call_args_list])
+        with open(self.path("big.bin"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
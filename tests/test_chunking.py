@@ -0,0 +1,96 @@
+import io
+import os
+import time
+import random
+import shutil
+import unittest
+
+from mini_git import Repository, Blob
+from mini_git.chunking import iter_chunks, MIN_SIZE, MAX_SIZE
+
+
+class TestChunking(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_chunking"
+        self.remote_dir = "test_repo_chunking_remote"
+        for path in (self.repo_dir, self.remote_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        self.repo = Repository(self.repo_dir, chunk_threshold=100_000)
+        self.data = random.Random(5).randbytes(1_500_000)
+        self.path = os.path.join(self.repo_dir, "big.bin")
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        for path in (self.repo_dir, self.remote_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+        #back-date the file so it's never racy against the index write
+        past = time.time() - 10
+        os.utime(self.path, (past, past))
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def loose_objects(self):
+        return set(object_id for object_id, _ in self.repo.store.iter_loose())
+
+    def test_cut_points_follow_content(self):
+        chunks = list(iter_chunks(io.BytesIO(self.data)))
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertTrue(all(MIN_SIZE <= len(chunk) <= MAX_SIZE for chunk in chunks[:-1]))
+        #how the file is read doesn't matter
+        self.assertEqual(list(iter_chunks(io.BytesIO(self.data), read_size=100_003)), chunks)
+
+        #an insertion only changes the chunk it lands in
+        edited = self.data[:700_000] + b"inserted" + self.data[700_000:]
+        changed = set(iter_chunks(io.BytesIO(edited))) - set(chunks)
+        self.assertLessEqual(len(changed), 2)
+
+    def test_new_version_stores_only_changed_chunks(self):
+        self.write(self.data)
+        self.repo.add("big.bin")
+        first = self.repo.commit("test", "first")
+        blob_sha = self.repo.diff(None, first)[0].new_sha
+        blob = self.repo.read_object(blob_sha)
+        self.assertIsInstance(blob, Blob)
+        self.assertGreater(len(blob.chunks), 5)
+
+        before = self.loose_objects()
+        edited = bytearray(self.data)
+        edited[800_000] ^= 0xFF
+        self.write(bytes(edited))
+        self.repo.add("big.bin")
+        second = self.repo.commit("test", "second")
+        #one chunk, the manifest, the root tree and the commit
+        self.assertEqual(len(self.loose_objects() - before), 4)
+
+        #content comes back whole, and streamed into checkout
+        self.assertEqual(Blob.load(blob_sha, self.repo.store).data, self.data)
+        self.assertTrue(self.repo.status().clean)
+        self.repo.checkout(first)
+        self.assertEqual(self.read(), self.data)
+        self.repo.checkout("master")
+        self.assertEqual(self.read(), bytes(edited))
+
+        #touched but unchanged, hashed as chunks it still matches
+        os.utime(self.path, (time.time() - 5, time.time() - 5))
+        self.assertTrue(self.repo.status().clean)
+
+        #chunks are reachable through the manifests
+        self.assertEqual(self.repo.gc(grace_period=-1)["pruned"], 0)
+        Repository(self.remote_dir)
+        self.repo.push(self.remote_dir)
+        with open(os.path.join(self.remote_dir, "big.bin"), "rb") as f:
+            self.assertEqual(f.read(), bytes(edited))
+        self.assertEqual(self.repo.pull(self.remote_dir)["objects"], 0)
+        self.assertEqual(second, Repository(self.remote_dir).head_sha())
+
+
+if __name__ == "__main__":
+    unittest.main()
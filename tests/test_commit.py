@@ -15,7 +15,7 @@ class TestCommit(unittest.TestCase):
             shutil.rmtree(self.repo_dir)
         
         os.makedirs(self.repo_dir)
-        Repository(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
 
         with open(os.path.join(self.repo_dir, "file1.txt"), "w") as f:
             f.write("this is file 1")
@@ -37,14 +37,14 @@ class TestCommit(unittest.TestCase):
     def test_commit_store_and_load(self):
         #Create a commit, store and load it, with assertion tests
         commit = Commit(self.repo_dir, "test", commit_message = "this is a test")
-        object_id = commit.store(commit)
+        object_id = commit.store(commit, self.repo.store)
         
         #Assert that it exists
         self.assertIsNotNone(object_id)
-        self.assertTrue(os.path.exists(decode_sha_to_path(object_id)))
+        self.assertTrue(os.path.exists(decode_sha_to_path(object_id, self.repo.store)))
 
     
-        loaded_commit = Commit.load(object_id)
+        loaded_commit = Commit.load(object_id, self.repo.store)
 
         self.assertIsNotNone(loaded_commit.date_time)
         self.assertEqual(loaded_commit.commit_message, "this is a test")
@@ -0,0 +1,128 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Commit
+from mini_git.commit_graph import CommitGraph, write_commit_graph
+
+
+class TestCommitGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_graph"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        self.commits = []
+        for i in range(4):
+            with open(os.path.join(self.repo_dir, "file.txt"), "w") as f:
+                f.write(f"version {i}")
+            self.repo.add("file.txt")
+            self.commits.append(self.repo.commit("test", f"commit {i}"))
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def test_graph_written_on_commit(self):
+        graph = self.repo.commit_graph()
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.parents(self.commits[2]), [self.commits[1]])
+        self.assertEqual(graph.parents(self.commits[0]), [])
+        self.assertEqual(graph.generation(self.commits[3]), 4)
+        self.assertEqual(graph.tree_sha(self.commits[3]), Commit.load(self.commits[3], self.repo.store).tree_sha)
+
+    def test_held_graph_outlives_commits(self):
+        graph = self.repo.commit_graph()
+        with mock.patch("mini_git.repository.TAIL_LIMIT", 5):
+            #one commit rewrites the tail, the next the main file
+            self.commit(4)
+            self.commit(5)
+        #a reader holding the old graph still reads the history it mapped
+        self.assertEqual(list(graph.walk(self.commits[3])), self.commits[3::-1])
+        self.assertEqual(len(self.repo.commit_graph()), 6)
+
+    def commit(self, i):
+        with open(os.path.join(self.repo_dir, "file.txt"), "w") as f:
+            f.write(f"version {i}")
+        self.repo.add("file.txt")
+        self.commits.append(self.repo.commit("test", f"commit {i}"))
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_commits_only_rewrite_the_tail(self):
+        main = os.path.join(self.repo_dir, ".minigit", "objects", "info", "commit-graph")
+        tail = main + "-tail"
+        #the first commit wrote the main file, the rest went to the tail
+        graph = self.repo.commit_graph()
+        self.assertEqual((graph.main_count, len(graph)), (1, 4))
+        self.assertEqual(graph.parents(self.commits[1]), [self.commits[0]])
+        main_data = self.read(main)
+
+        with mock.patch("mini_git.repository.TAIL_LIMIT", 5):
+            self.commit(4)
+            self.assertEqual(self.read(main), main_data)
+            old_tail = self.read(tail)
+            #the fifth tail commit merges everything into the main file
+            self.commit(5)
+        self.assertFalse(os.path.exists(tail))
+        graph = self.repo.commit_graph()
+        self.assertEqual((graph.main_count, len(graph)), (6, 6))
+        self.assertEqual(self.repo.rev_list(), self.commits[::-1])
+        self.assertEqual(graph.generation(self.commits[5]), 6)
+
+        #a tail written on the old main file is ignored
+        with open(tail, "wb") as f:
+            f.write(old_tail)
+        self.assertEqual(len(self.repo.commit_graph()), 6)
+        self.commit(6)
+        self.assertEqual(self.repo.rev_list(2), self.commits[:4:-1])
+
+    def test_traversal_never_reads_commits(self):
+        with mock.patch.object(Commit, "load") as load:
+            self.assertEqual(self.repo.rev_list(), self.commits[::-1])
+            self.assertEqual(self.repo.rev_list(2), self.commits[:1:-1])
+            self.assertTrue(self.repo.is_ancestor(self.commits[0], self.commits[3]))
+            self.assertFalse(self.repo.is_ancestor(self.commits[3], self.commits[0]))
+            self.assertEqual(self.repo.merge_base(self.commits[1], self.commits[3]), self.commits[1])
+        load.assert_not_called()
+
+        #log still reads exactly the commits it returns
+        self.assertEqual([c.commit_message for c in self.repo.log(2)], ["commit 3", "commit 2"])
+
+    def test_rebuild_on_demand(self):
+        os.remove(os.path.join(self.repo_dir, ".minigit", "objects", "info", "commit-graph"))
+        self.assertIsNone(self.repo.commit_graph())
+        self.assertEqual(self.repo.write_commit_graph(), 4)
+        self.assertEqual(self.repo.rev_list(), self.commits[::-1])
+
+    def test_merge_base_of_branches(self):
+        #  a - b - c
+        #       \\
+        #        d - e(merge of c and d)
+        a, b, c, d, e, lone = (f"{i:02x}" * 32 for i in range(1, 7))
+        tree = "00" * 32
+        path = os.path.join(self.repo_dir, "graph")
+        write_commit_graph(path, {
+            a: (tree, [], 1), b: (tree, [a], 2), c: (tree, [b], 3),
+            d: (tree, [b], 4), e: (tree, [c, d], 5), lone: (tree, [], 6),
+        })
+        graph = CommitGraph(path)
+        try:
+            self.assertEqual(graph.generation(e), 4)
+            self.assertEqual(graph.merge_base(c, d), b)
+            self.assertEqual(graph.merge_base(e, d), d)
+            self.assertIsNone(graph.merge_base(c, lone))
+            self.assertTrue(graph.is_ancestor(a, e))
+            self.assertFalse(graph.is_ancestor(c, d))
+            self.assertEqual(list(graph.walk(e)), [e, d, c, b, a])
+        finally:
+            graph.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
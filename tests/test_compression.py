@@ -0,0 +1,58 @@
+import os
+import shutil
+import unittest
+
+from mini_git import Repository, Blob, Tree, decode_sha_to_path
+from mini_git.compression import compress, decompress, detect_codec
+from mini_git.config import get_setting
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_compression"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        os.makedirs(self.repo_dir)
+
+        self.test_file = os.path.join(self.repo_dir, "file1.txt")
+        with open(self.test_file, "w") as f:
+            f.write("compress me " * 200)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def test_codecs_round_trip(self):
+        data = b"blob 5\0hello"
+        for codec in ("none", "zlib"):
+            stored = compress(data, codec, 6)
+            self.assertEqual(detect_codec(stored), codec)
+            self.assertEqual(decompress(stored), data)
+
+    def test_objects_are_compressed_on_disk(self):
+        repo = Repository(self.repo_dir, compression="zlib", compression_level=9)
+        self.assertEqual(get_setting(self.repo_dir, "compression_level"), "9")
+
+        object_id = Blob(self.test_file).store(repo.store)
+        path = decode_sha_to_path(object_id, repo.store)
+        self.assertLess(os.path.getsize(path), os.path.getsize(self.test_file))
+        self.assertEqual(Blob.load(object_id, repo.store).data, b"compress me " * 200)
+
+    def test_raw_objects_still_load(self):
+        #objects written before compression existed are plain header + body
+        repo = Repository(self.repo_dir, compression="none")
+        tree_sha = Tree(self.repo_dir).store(store=repo.store)
+
+        with open(decode_sha_to_path(tree_sha, repo.store), "rb") as f:
+            self.assertTrue(f.read().startswith(b"tree "))
+
+        repo = Repository(self.repo_dir, compression="zlib")
+        self.assertEqual(len(Tree.load(tree_sha, repo.store).children), 1)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            Repository(self.repo_dir, compression="bogus")
+
+
+if __name__ == "__main__":
+    unittest.main()
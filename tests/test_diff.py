@@ -0,0 +1,93 @@
+import os
+import random
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Tree
+from mini_git.diff import DiffEntry, myers_diff, iter_hunks, ADDED, REMOVED, MODIFIED
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_diff"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def test_myers_is_a_shortest_edit(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            a = [rng.choice("abc") for _ in range(rng.randrange(12))]
+            b = [rng.choice("abc") for _ in range(rng.randrange(12))]
+            ops = myers_diff(a, b)
+            #replaying the script turns a into b
+            self.assertEqual([a[x] for tag, x, _ in ops if tag != "+"], a)
+            self.assertEqual([b[y] for tag, _, y in ops if tag != "-"], b)
+            #and keeps a longest common subsequence
+            self.assertEqual(sum(tag == "=" for tag, _, _ in ops), lcs_length(a, b))
+
+    def test_hunks(self):
+        old = [f"line {i}\n".encode() for i in range(20)]
+        new = list(old)
+        new[2] = b"changed\n"
+        new.insert(15, b"added\n")
+
+        hunks = list(iter_hunks(old, new, context=2))
+        self.assertEqual(len(hunks), 2)
+        self.assertEqual((hunks[0].old_start, hunks[0].old_count, hunks[0].new_start, hunks[0].new_count), (1, 5, 1, 5))
+        self.assertEqual(str(hunks[1]).splitlines()[0], "@@ -14,4 +14,5 @@")
+        self.assertIn("+added", str(hunks[1]))
+        self.assertEqual(list(iter_hunks(old, old)), [])
+
+    def test_commit_diff_skips_unchanged_subtrees(self):
+        self.write("keep/a.txt", "untouched")
+        self.write("src/main.txt", "one\ntwo\nthree\n")
+        self.write("src/gone.txt", "bye")
+        self.repo.add(".")
+        first = self.repo.commit("test", "first")
+        keep_sha = {name: sha for _, name, sha in self.repo.read_commit(first).tree.children}["keep"]
+
+        self.write("src/main.txt", "one\n2\nthree\n")
+        os.remove(os.path.join(self.repo_dir, "src", "gone.txt"))
+        self.write("new.txt", "hello")
+        self.repo.add(".")
+        second = self.repo.commit("test", "second")
+
+        with mock.patch.object(Tree, "load", wraps=Tree.load) as load:
+            changes = self.repo.diff(first, second)
+        loaded = [call.args[0] for call in load.call_args_list]
+        self.assertNotIn(keep_sha, loaded)
+
+        self.assertEqual([(entry.status, entry.path) for entry in changes],
+                         [(ADDED, "new.txt"), (REMOVED, "src/gone.txt"), (MODIFIED, "src/main.txt")])
+        hunk, = changes[2].hunks()
+        self.assertEqual([line for tag, line in hunk.lines if tag != " "], [b"two\n", b"2\n"])
+
+        self.assertEqual(self.repo.diff(second, second), [])
+        everything = self.repo.diff(None, first)
+        self.assertTrue(all(isinstance(entry, DiffEntry) and entry.status == ADDED for entry in everything))
+        self.assertEqual(len(everything), 3)
+
+
+def lcs_length(a, b):
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a)):
+        for j in range(len(b)):
+            table[i + 1][j + 1] = table[i][j] + 1 if a[i] == b[j] else max(table[i][j + 1], table[i + 1][j])
+    return table[len(a)][len(b)]
+
+
+if __name__ == "__main__":
+    unittest.main()
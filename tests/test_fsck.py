@@ -0,0 +1,94 @@
+import os
+import zlib
+import shutil
+import hashlib
+import unittest
+
+from mini_git import Repository, make_header
+
+
+class TestFsck(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_fsck"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+        for i in range(3):
+            self.write(f"dir/file_{i}.txt", f"file {i}\n" * 100)
+        self.write("top.txt", "top")
+        self.repo.add(".")
+        self.first = self.repo.commit("test", "first")
+        self.write("top.txt", "top again")
+        self.repo.add("top.txt")
+        self.second = self.repo.commit("test", "second")
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.repo_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(text)
+
+    def blob_sha(self, path):
+        return {change.path: change.new_sha for change in self.repo.diff(None, self.second)}[path]
+
+    def test_clean_repo(self):
+        report = self.repo.fsck(workers=1)
+        self.assertEqual(report["corrupt"], {})
+        self.assertEqual(report["missing"], [])
+        #the first version of top.txt is still pointed to by the first commit's tree
+        self.assertEqual(report["dangling"], [])
+        self.assertEqual(report["objects"], len(list(self.repo.store.iter_loose())))
+        self.assertGreater(report["bytes"], 0)
+
+    def test_corrupt_missing_and_dangling(self):
+        #flipped content, a body shorter than its header and a truncated stream
+        flipped = self.blob_sha("dir/file_0.txt")
+        short = self.blob_sha("dir/file_1.txt")
+        cut = self.blob_sha("dir/file_2.txt")
+        with open(self.repo.store.path_for(flipped), "wb") as f:
+            f.write(zlib.compress(make_header("blob", b"file 0\n" * 100) + b"file X\n" * 100))
+        with open(self.repo.store.path_for(short), "wb") as f:
+            f.write(zlib.compress(make_header("blob", b"file 1\n" * 100) + b"file 1\n"))
+        with open(self.repo.store.path_for(cut), "rb") as f:
+            data = f.read()
+        with open(self.repo.store.path_for(cut), "wb") as f:
+            f.write(data[:len(data) // 2])
+
+        missing = self.blob_sha("top.txt")
+        os.remove(self.repo.store.path_for(missing))
+
+        body = b"nobody points here"
+        dangling = hashlib.sha256(make_header("blob", body) + body).hexdigest()
+        self.repo.store.write(dangling, make_header("blob", body) + body)
+        leftover = os.path.join(self.repo.store.objects_path, "tmp_obj_crashed")
+        open(leftover, "wb").close()
+
+        report = self.repo.fsck(workers=2)
+        self.assertEqual(set(report["corrupt"]), {flipped, short, cut})
+        self.assertIn("hashes to", report["corrupt"][flipped])
+        self.assertIn("header says", report["corrupt"][short])
+        self.assertEqual(report["missing"], [missing])
+        self.assertEqual(report["dangling"], [dangling])
+        self.assertEqual(report["temp_files"], [leftover])
+
+    def test_packed_objects(self):
+        self.repo.repack()
+        report = self.repo.fsck()
+        self.assertEqual((report["corrupt"], report["missing"], report["dangling"]), ({}, [], []))
+
+        pack = self.repo.store.packs.get(refresh=True)[0]
+        with open(pack.pack_path, "r+b") as f:
+            f.seek(-40, os.SEEK_END)
+            f.write(b"\xff" * 4)
+        self.repo.store.packs.close()
+        report = self.repo.fsck(workers=1)
+        self.assertIn(os.path.basename(pack.pack_path), report["corrupt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
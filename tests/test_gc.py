@@ -0,0 +1,83 @@
+import os
+import shutil
+import unittest
+
+from mini_git import Repository, decode_sha_to_path
+from mini_git.index import Index
+from mini_git.reachability import ObjectBitmap
+
+
+class TestGc(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_gc"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def test_bitmap(self):
+        ids = [f"{i:02x}" * 32 for i in range(20)]
+        bitmap = ObjectBitmap(ids)
+        self.assertTrue(bitmap.mark(ids[3]))
+        self.assertFalse(bitmap.mark(ids[3]))
+        self.assertTrue(bitmap.is_marked(ids[3]))
+        self.assertFalse(bitmap.is_marked(ids[4]))
+        #objects it doesn't cover can still be marked
+        self.assertTrue(bitmap.mark("ff" * 32))
+        self.assertTrue(bitmap.is_marked("ff" * 32))
+        self.assertEqual((len(bitmap), bitmap.count()), (20, 1))
+
+        #ids can be streamed in any order, with repeats
+        streamed = ObjectBitmap(object_id for object_id in reversed(ids + ids[:5]))
+        self.assertEqual(len(streamed), 20)
+        self.assertEqual([streamed.position(object_id) for object_id in ids], list(range(20)))
+        self.assertEqual(streamed.position("ee" * 32), -1)
+
+    def test_prunes_only_unreachable(self):
+        self.write("kept.txt", "committed")
+        self.write("dir/draft.txt", "draft one")
+        self.repo.add(".")
+        first = self.repo.commit("test", "first")
+        committed = [entry.new_sha for entry in self.repo.diff(None, first)]
+
+        #staged, then replaced before it was ever committed
+        self.write("dir/draft.txt", "draft two")
+        self.repo.add("dir/draft.txt")
+        dropped = Index(self.repo_dir).get("dir/draft.txt").object_id
+        self.write("dir/draft.txt", "draft three")
+        self.repo.add("dir/draft.txt")
+        staged = Index(self.repo_dir).get("dir/draft.txt").object_id
+        dropped_path = decode_sha_to_path(dropped, self.repo.store)
+
+        #nothing is old enough yet
+        self.assertEqual(self.repo.gc()["pruned"], 0)
+
+        report = self.repo.gc(grace_period=-1, dry_run=True)
+        self.assertGreater(report["pruned"], 0)
+        self.assertTrue(os.path.exists(dropped_path))
+
+        report = self.repo.gc(grace_period=-1)
+        self.assertEqual(report["missing"], [])
+        self.assertGreater(report["reclaimed_bytes"], 0)
+        self.assertEqual(set(report["seconds"]), {"enumerate", "mark", "prune"})
+        self.assertFalse(os.path.exists(dropped_path))
+
+        #history and the staged content still load
+        for sha in committed + [staged]:
+            self.assertTrue(os.path.exists(decode_sha_to_path(sha, self.repo.store)))
+        self.repo.commit("test", "second")
+        self.assertEqual(len(self.repo.log()), 2)
+        self.assertEqual(self.repo.gc(grace_period=-1)["pruned"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
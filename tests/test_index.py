@@ -0,0 +1,87 @@
+import os
+import time
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Blob, Tree
+from mini_git.index import Index, STAGED
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_index"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        os.makedirs(os.path.join(self.repo_dir, "nested"))
+        for name, text in (("file1.txt", "this is file 1"), ("nested/nested_file.txt", "nested file")):
+            self.write(name, text)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        #back-date the file so it's never racy against the index write
+        past = time.time() - 10
+        os.utime(path, (past, past))
+
+    def test_index_round_trip(self):
+        self.repo.add(".")
+        index = Index(self.repo_dir)
+
+        self.assertEqual(sorted(index.entries), ["file1.txt", "nested/nested_file.txt"])
+        entry = index.get("nested/nested_file.txt")
+        self.assertEqual(entry.flags, STAGED)
+        self.assertEqual(entry.size, len("nested file"))
+        self.assertEqual(Blob.load(entry.object_id, self.repo.store).data, b"nested file")
+
+    def test_unchanged_files_are_not_rehashed(self):
+        first = self.repo.add(".")
+        self.repo.commit("test", "first")
+
+        with mock.patch.object(Blob, "store") as store:
+            second = self.repo.add(".")
+        store.assert_not_called()
+        self.assertEqual(first, second)
+
+        #nothing changed, so there is nothing to commit
+        with self.assertRaises(RuntimeError):
+            self.repo.commit("test", "empty")
+
+    def test_changed_and_removed_files_are_staged(self):
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+
+        self.write("file1.txt", "file 1 has changed")
+        os.remove(os.path.join(self.repo_dir, "nested", "nested_file.txt"))
+        self.repo.add(".")
+
+        index = Index(self.repo_dir)
+        self.assertEqual(sorted(entry.path for entry in index.staged()), ["file1.txt", "nested/nested_file.txt"])
+        self.assertTrue(index.get("nested/nested_file.txt").removed)
+
+        commit = self.repo.read_commit(self.repo.commit("test", "second"))
+        self.assertEqual([name for _, name, _ in commit.tree.children], ["file1.txt"])
+        self.assertEqual(list(Index(self.repo_dir).entries), ["file1.txt"])
+
+    def test_commit_keeps_unstaged_tracked_files(self):
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+
+        self.write("file2.txt", "this is file 2")
+        self.repo.add("file2.txt")
+        commit = self.repo.read_commit(self.repo.commit("test", "second"))
+
+        names = [name for _, name, _ in commit.tree.children]
+        self.assertEqual(names, ["file1.txt", "file2.txt", "nested"])
+        self.assertEqual(commit.tree_sha, Tree(self.repo_dir).store(store=self.repo.store))
+
+
+if __name__ == "__main__":
+    unittest.main()
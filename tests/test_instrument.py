@@ -0,0 +1,57 @@
+import os
+import shutil
+import unittest
+
+from mini_git import Repository, Tree, instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_instrument"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+        for i in range(3):
+            with open(os.path.join(self.repo_dir, f"file_{i}.txt"), "w") as f:
+                f.write(f"file {i}")
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def test_records_a_commit(self):
+        events = []
+        with instrument.recording(hook=lambda *event: events.append(event)):
+            self.repo.add(".")
+            commit_sha = self.repo.commit("test", "first")
+        self.assertFalse(instrument.enabled)
+
+        report = instrument.snapshot()
+        counters, timings = report["counters"], report["timings"]
+        #3 blobs, the root tree and the commit
+        self.assertEqual(counters["objects_written"], 5)
+        self.assertGreater(counters["bytes_hashed"], counters["bytes_written"] // 4)
+        self.assertGreater(counters["syscalls.rename"], 0)
+        for phase in ("add", "commit", "write", "hash", "install"):
+            self.assertIn(phase, timings)
+        self.assertEqual(timings["commit"]["calls"], 1)
+        #the hook saw every event as it happened
+        self.assertEqual(sum(value for kind, name, value in events if name == "objects_written"), 5)
+
+        with instrument.recording():
+            tree_sha = self.repo.read_commit(commit_sha).tree_sha
+            Tree.load(tree_sha, self.repo.store)
+        counters = instrument.snapshot()["counters"]
+        self.assertGreaterEqual(counters["cache_hits"], 1)
+
+    def test_disabled_records_nothing(self):
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+        self.assertEqual(instrument.snapshot(), {"counters": {}, "timings": {}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import hashlib
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git import Repository, AmbiguousObjectName, make_header
+from mini_git import name_index
+from mini_git.name_index import NameIndex
+from mini_git.utils import build_fanout, fanout_search
+
+
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_names"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+        self.names = NameIndex(self.repo.store.objects_path)
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def store_blob(self, text):
+        body = text.encode("ascii")
+        obj = make_header("blob", body) + body
+        object_id = hashlib.sha256(obj).hexdigest()
+        self.repo.store.write(object_id, obj)
+        return object_id
+
+    def colliding_texts(self):
+        #two contents whose shas share their first 4 hex digits
+        seen = {}
+        for i in range(5000):
+            text = f"object {i}"
+            body = text.encode("ascii")
+            prefix = hashlib.sha256(make_header("blob", body) + body).hexdigest()[:4]
+            if prefix in seen:
+                return seen[prefix], text
+            seen[prefix] = text
+        self.fail("no collision found")
+
+    def test_fanout_search(self):
+        #the first and last buckets, a crowded bucket and empty ones in between
+        names = sorted(bytes([first]) + bytes([i]) * 31 for first in (0x00, 0x7f, 0xff) for i in range(3))
+        fanout = build_fanout(names)
+        self.assertEqual((fanout[0], fanout[0x7e], fanout[0x7f], fanout[255]), (3, 3, 6, 9))
+        for pos, raw in enumerate(names):
+            self.assertEqual(fanout_search(fanout, names.__getitem__, raw), pos)
+        for missing in (b"\x00" + b"\x09" * 31, b"\x80" * 32, b"\xff" * 32):
+            self.assertEqual(fanout_search(fanout, names.__getitem__, missing), -1)
+
+    def test_resolve(self):
+        object_id = self.store_blob("hello")
+        self.assertEqual(self.repo.resolve(object_id[:6]), object_id)
+        self.assertEqual(self.repo.resolve(object_id[:4].upper()), object_id)
+        self.assertEqual(self.repo.resolve(object_id), object_id)
+
+        with self.assertRaises(ValueError):
+            self.repo.resolve(object_id[:3])
+        with self.assertRaises(ValueError):
+            self.repo.resolve("zzzzzz")
+        missing = "0000" if not object_id.startswith("0000") else "ffff"
+        with self.assertRaises(KeyError):
+            self.repo.resolve(missing)
+
+    def test_ambiguous(self):
+        first, second = (self.store_blob(text) for text in self.colliding_texts())
+        with self.assertRaises(AmbiguousObjectName) as raised:
+            self.repo.resolve(first[:4])
+        self.assertEqual(raised.exception.candidates, sorted([first, second]))
+        self.assertIsInstance(raised.exception, ValueError)
+        #a longer prefix tells them apart
+        common = len(os.path.commonprefix([first, second]))
+        self.assertEqual(self.repo.resolve(first[:common + 1]), first)
+
+    def test_packed_and_gone(self):
+        with open(os.path.join(self.repo_dir, "file.txt"), "w") as f:
+            f.write("packed")
+        self.repo.add("file.txt")
+        commit_sha = self.repo.commit("test", "first")
+        self.repo.repack()
+        self.assertEqual(self.repo.resolve(commit_sha[:8]), commit_sha)
+
+        #a name whose object is gone doesn't resolve, or make others ambiguous
+        object_id = self.store_blob("short lived")
+        os.remove(self.repo.store.path_for(object_id))
+        with self.assertRaises(KeyError):
+            self.repo.resolve(object_id[:8])
+
+    def test_journal_merged_into_main(self):
+        with mock.patch.object(name_index, "JOURNAL_LIMIT", 3):
+            ids = [self.store_blob(f"blob {i}") for i in range(5)]
+            self.assertEqual(self.repo.resolve(ids[0][:10]), ids[0])
+        self.assertFalse(os.path.exists(self.names.journal_path))
+        self.assertEqual(sorted(self.names._main_names()), sorted(bytes.fromhex(object_id) for object_id in ids))
+        for object_id in ids:
+            self.assertEqual(self.repo.resolve(object_id[:10]), object_id)
+
+    def test_merge_skipped_while_locked(self):
+        with mock.patch.object(name_index, "JOURNAL_LIMIT", 3):
+            ids = [self.store_blob(f"blob {i}") for i in range(5)]
+            open(self.names.lock_path, "w").close()
+            #another merge is running, the journal is still scanned
+            self.assertEqual(self.names.match(ids[0][:10]), [ids[0]])
+            self.assertTrue(os.path.exists(self.names.journal_path))
+
+            #a lock left by a crash is broken
+            stale = os.stat(self.names.lock_path).st_mtime - name_index.LOCK_STALE - 1
+            os.utime(self.names.lock_path, (stale, stale))
+            self.assertEqual(self.names.match(ids[1][:10]), [ids[1]])
+        self.assertFalse(os.path.exists(self.names.journal_path))
+        self.assertFalse(os.path.exists(self.names.lock_path))
+
+    def test_concurrent_merges_keep_every_name(self):
+        with mock.patch.object(name_index, "JOURNAL_LIMIT", 2):
+            def store_and_match(i):
+                ids = [self.store_blob(f"thread {i} blob {j}") for j in range(4)]
+                NameIndex(self.repo.store.objects_path).match(ids[0][:10])
+                return ids
+
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                ids = [object_id for batch in pool.map(store_and_match, range(8)) for object_id in batch]
+            self.names.match(ids[0][:10])
+        for object_id in ids:
+            self.assertEqual(self.names.match(object_id[:10]), [object_id])
+
+    def test_repo_from_before_the_index(self):
+        object_id = self.store_blob("old")
+        os.remove(self.names.main_path)
+        os.remove(self.names.journal_path)
+        self.assertEqual(self.repo.resolve(object_id[:6]), object_id)
+        self.assertTrue(self.names.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
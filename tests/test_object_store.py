@@ -0,0 +1,72 @@
+import gc
+import os
+import shutil
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git import Repository, Blob, decode_sha_to_path
+from mini_git.object_store import ObjectStore
+
+
+class TestObjectStore(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dirs = ["test_repo_store_a", "test_repo_store_b"]
+        for repo_dir in self.repo_dirs:
+            if os.path.exists(repo_dir):
+                shutil.rmtree(repo_dir)
+        self.env_before = os.environ.get("BASE_DIR")
+        self.repos = [Repository(repo_dir) for repo_dir in self.repo_dirs]
+
+    def tearDown(self):
+        for repo in self.repos:
+            repo._close_commit_graph()
+            shutil.rmtree(repo.dir_path)
+
+    def test_one_store_per_repo(self):
+        #opening a repo no longer changes process-wide state
+        self.assertEqual(os.environ.get("BASE_DIR"), self.env_before)
+        self.assertIs(Repository(self.repo_dirs[0]).store, self.repos[0].store)
+        self.assertIsNot(self.repos[0].store, self.repos[1].store)
+
+        #a file inside a repo is stored in that repo
+        path = os.path.join(self.repo_dirs[1], "found.txt")
+        with open(path, "w") as f:
+            f.write("which repo am I in")
+        self.assertIs(ObjectStore.for_path(path), self.repos[1].store)
+        object_id = Blob(path).store()
+        self.assertTrue(os.path.exists(decode_sha_to_path(object_id, self.repos[1].store)))
+        self.assertFalse(os.path.exists(decode_sha_to_path(object_id, self.repos[0].store)))
+
+    def test_unused_stores_are_freed(self):
+        path = os.path.abspath(self.repo_dirs[0])
+        self.assertIn(path, ObjectStore._open)
+        self.repos[0] = self.repos[0].dir_path
+        gc.collect()
+        #nothing holds the repo any more, so nothing keeps its cache and packs
+        self.assertNotIn(path, ObjectStore._open)
+        self.repos[0] = Repository(self.repos[0])
+
+    def test_two_repos_from_threads(self):
+        def work(repo, i):
+            name = f"file_{i}.txt"
+            with open(os.path.join(repo.dir_path, name), "w") as f:
+                f.write(f"{repo.dir_path} {i}")
+            repo.add(name)
+            return repo.commit("test", f"commit {i}")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            #each repo's commits run in order, but the two repos interleave
+            futures = [pool.submit(lambda repo=repo: [work(repo, i) for i in range(5)]) for repo in self.repos]
+            shas = [future.result() for future in futures]
+
+        for repo, repo_shas in zip(self.repos, shas):
+            self.assertEqual([record.object_id for record in repo.log()], repo_shas[::-1])
+            names = [name for _, name, _ in repo.read_commit(repo.head_sha()).tree.children]
+            self.assertEqual(names, [f"file_{i}.txt" for i in range(5)])
+            blob = repo.read_object(repo.read_commit(repo.head_sha()).tree.children[0][2])
+            self.assertEqual(blob.data.decode(), f"{repo.dir_path} 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import random
+import shutil
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from mini_git import Repository, Blob, Tree, Commit
+from mini_git.pack import create_delta, apply_delta, load_packs, DELTA_FLAG
+
+
+class TestPack(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_pack"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        rng = random.Random(1)
+        self.base = bytes(rng.randrange(256) for _ in range(8000))
+        #a near copy of base, to be stored as a delta
+        self.similar = self.base[:4000] + b"an edit in the middle" + self.base[4000:]
+
+        with open(os.path.join(self.repo_dir, "base.bin"), "wb") as f:
+            f.write(self.base)
+        with open(os.path.join(self.repo_dir, "similar.bin"), "wb") as f:
+            f.write(self.similar)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def test_delta_round_trip(self):
+        delta = create_delta(self.base, self.similar)
+        self.assertLess(len(delta), 200)
+        self.assertEqual(apply_delta(self.base, delta), self.similar)
+        self.assertEqual(apply_delta(b"", create_delta(b"", b"new")), b"new")
+
+    def test_repack_and_load(self):
+        self.repo.add("base.bin")
+        self.repo.add("similar.bin")
+        commit_sha = self.repo.commit("test", "first")
+
+        pack_path = self.repo.repack()
+
+        #every loose object moved into the single pack
+        self.assertTrue(os.path.exists(pack_path))
+        self.assertEqual(list(self.repo.store.iter_loose()), [])
+        packs = self.repo.store.packs.get()
+        self.assertEqual(len(packs), 1)
+
+        commit = self.repo.read_commit(commit_sha)
+        self.assertIsInstance(commit, Commit)
+        blobs = {name: sha for _, name, sha in commit.tree.children}
+        self.assertEqual(Blob.load(blobs["base.bin"], self.repo.store).data, self.base)
+        self.assertEqual(Blob.load(blobs["similar.bin"], self.repo.store).data, self.similar)
+        self.assertIsInstance(self.repo.read_object(commit.tree_sha), Tree)
+
+        #the smaller blob is a delta against the bigger one
+        pack = packs[0]
+        offset = pack.index.find(blobs["base.bin"])
+        self.assertTrue(pack._map[offset] & DELTA_FLAG)
+
+        self.assertIsNone(pack.index.find("00" * 32))
+        with self.assertRaises(FileNotFoundError):
+            Blob.load("ff" * 32, self.repo.store)
+
+    def test_repack_twice_keeps_one_pack(self):
+        self.repo.add("base.bin")
+        self.repo.repack()
+        self.repo.add("similar.bin")
+        self.repo.repack()
+
+        self.assertEqual(len(os.listdir(os.path.join(self.repo_dir, ".minigit", "objects", "pack"))), 2)
+        self.assertEqual(sum(len(pack) for pack in self.repo.store.packs.get()), 2)
+
+    def test_repack_leaves_readers_working(self):
+        base_sha = self.repo.add("base.bin")
+        self.repo.repack()
+        held = self.repo.store.packs.get()
+        self.repo.add("similar.bin")
+        self.repo.repack()
+
+        #a reader still holding the removed pack keeps reading it
+        self.assertFalse(os.path.exists(held[0].pack_path))
+        self.assertEqual(held[0].read(base_sha)[1], self.base)
+        self.assertEqual(Blob.load(base_sha, self.repo.store).data, self.base)
+
+        #a pack removed between listing the dir and opening it is skipped
+        pack_dir = os.path.dirname(held[0].pack_path)
+        listed = os.listdir(pack_dir) + [os.path.basename(held[0].pack_path)]
+        with mock.patch("os.listdir", return_value=listed):
+            self.assertEqual(len(load_packs(pack_dir)), 1)
+
+    def test_packed_objects_not_written_again(self):
+        tree_sha = self.repo.add(".")
+        self.repo.repack()
+
+        #the same blobs and tree, stored again
+        self.assertEqual(Tree(self.repo_dir).store(store=self.repo.store), tree_sha)
+        Tree.load(tree_sha, self.repo.store).write(self.repo.store)
+        self.assertEqual(list(self.repo.store.iter_loose()), [])
+
+    def test_big_objects_stored_whole(self):
+        self.repo.add("base.bin")
+        similar_sha = self.repo.add("similar.bin")
+        with mock.patch("mini_git.pack.DELTA_MAX_SIZE", 4000), \
+                mock.patch("mini_git.pack.create_delta", wraps=create_delta) as delta:
+            self.repo.repack()
+        delta.assert_not_called()
+        self.assertEqual(Blob.load(similar_sha, self.repo.store).data, self.similar)
+
+    def test_threads_share_base_cache(self):
+        rng = random.Random(2)
+        expected = {}
+        for i in range(4):
+            base = bytes(rng.randrange(256) for _ in range(4000))
+            for name, data in ((f"base_{i}.bin", base), (f"edit_{i}.bin", base + b"an edit")):
+                with open(os.path.join(self.repo_dir, name), "wb") as f:
+                    f.write(data)
+                expected[Blob(os.path.join(self.repo_dir, name)).store(self.repo.store)] = data
+        self.repo.repack()
+        pack = self.repo.store.packs.get(refresh=True)[0]
+        #every read of a delta evicts another thread's base
+        pack.BASE_CACHE_SIZE = 1
+
+        def read_all(_):
+            return all(pack.read(object_id)[1] == data for object_id, data in expected.items())
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertTrue(all(pool.map(read_all, range(200))))
+
+
+if __name__ == "__main__":
+    unittest.main()
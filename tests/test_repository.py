@@ -0,0 +1,124 @@
+import os
+import shutil
+import datetime
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Tree, Commit
+from mini_git.commit import CommitRecord
+
+
+class TestRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_repository"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def make_history(self, count):
+        shas = []
+        for i in range(count):
+            self.write("file.txt", f"version {i}")
+            self.repo.add("file.txt")
+            shas.append(self.repo.commit("test", f"commit {i}"))
+        return shas
+
+    def test_iter_log_is_lazy_and_paged(self):
+        shas = self.make_history(6)
+
+        with mock.patch.object(Tree, "load") as tree_load, \
+             mock.patch.object(Commit, "load", wraps=Commit.load) as commit_load:
+            page = list(self.repo.iter_log(skip=2, limit=3))
+            #only the commits on the page are read, and no trees at all
+            self.assertEqual(commit_load.call_count, 3)
+            tree_load.assert_not_called()
+
+        self.assertEqual([record.object_id for record in page], shas[3:0:-1])
+        self.assertIsInstance(page[0], CommitRecord)
+        self.assertFalse(hasattr(page[0], "__dict__"))
+        self.assertEqual(page[0].commit_message, "commit 3")
+        self.assertEqual(page[0].tree.object_id, page[0].tree_sha)
+
+    def test_commit_during_iter_log(self):
+        shas = self.make_history(4)
+        #a commit that only appends to the tail, and one that rewrites the main file
+        for tail_limit in (256, 1):
+            with mock.patch("mini_git.repository.TAIL_LIMIT", tail_limit):
+                records = self.repo.iter_log()
+                self.assertEqual(next(records).object_id, shas[-1])
+                self.write("file.txt", f"during the log, limit {tail_limit}")
+                self.repo.add("file.txt")
+                shas.append(self.repo.commit("test", "made while logging"))
+                #the walk carries on over the history it started from
+                self.assertEqual([record.object_id for record in records], shas[-3::-1])
+        self.assertEqual([record.object_id for record in self.repo.iter_log()], shas[::-1])
+
+    def test_iter_log_date_range(self):
+        shas = self.make_history(3)
+        dates = [datetime.datetime.fromisoformat(Commit.load(sha, self.repo.store).date_time) for sha in shas]
+
+        middle = [record.object_id for record in self.repo.iter_log(since=dates[1], until=dates[1])]
+        self.assertEqual(middle, [shas[1]])
+        self.assertEqual(len(list(self.repo.iter_log(since=dates[2] + datetime.timedelta(days=1)))), 0)
+        self.assertEqual([record.commit_message for record in self.repo.log()], ["commit 2", "commit 1", "commit 0"])
+
+    def test_iter_log_since_with_clock_skew(self):
+        #the third commit was made on a clock running a year fast
+        dates = ["2024-01-01T00:00:00", "2024-02-01T00:00:00", "2025-06-01T00:00:00", "2024-03-01T00:00:00"]
+        shas = []
+        for date in dates:
+            self.write("file.txt", f"made {date}")
+            self.repo.add("file.txt")
+            with mock.patch("mini_git.commit.datetime") as fake:
+                fake.datetime.now.return_value = datetime.datetime.fromisoformat(date)
+                shas.append(self.repo.commit("test", date))
+
+        #the newest commit is older than since, the skewed one behind it still shows up
+        self.assertEqual([record.object_id for record in self.repo.iter_log(since=datetime.datetime(2024, 6, 1))],
+                         [shas[2]])
+        self.assertEqual([record.object_id for record in self.repo.iter_log(since=dates[1])], shas[:0:-1])
+
+    def test_commit_rewrites_only_dirty_trees(self):
+        for top in ("a", "b"):
+            for sub in ("x", "y"):
+                self.write(f"{top}/{sub}/deep.txt", f"{top}{sub}")
+        self.write("root.txt", "root")
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+
+        self.write("a/x/deep.txt", "changed")
+        self.repo.add("a/x/deep.txt")
+        with mock.patch.object(Tree, "write", autospec=True, side_effect=Tree.write) as write:
+            commit = self.repo.read_commit(self.repo.commit("test", "second"))
+
+        #a/x, a and the root, untouched siblings keep their shas
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual(commit.tree_sha, Tree(self.repo_dir).store(store=self.repo.store))
+
+    def test_commit_applies_removals(self):
+        self.write("keep.txt", "keep")
+        self.write("gone/only.txt", "gone")
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+
+        shutil.rmtree(os.path.join(self.repo_dir, "gone"))
+        self.repo.add(".")
+        commit = self.repo.read_commit(self.repo.commit("test", "second"))
+
+        #the emptied directory is dropped, not kept as an empty tree
+        self.assertEqual([name for _, name, _ in commit.tree.children], ["keep.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
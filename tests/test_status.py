@@ -0,0 +1,76 @@
+import os
+import time
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository
+
+
+class TestStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_status"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        for name in ("a.txt", "nested/b.txt", "nested/c.txt"):
+            self.write(name, f"this is {name}")
+        self.repo.add(".")
+        self.repo.commit("test", "first")
+
+    def tearDown(self):
+        self.repo._close_commit_graph()
+        shutil.rmtree(self.repo_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.repo_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        #back-date the file so it's never racy against the index write
+        past = time.time() - 10
+        os.utime(path, (past, past))
+
+    def test_clean_tree_hashes_nothing(self):
+        with mock.patch("mini_git.status.hash_file") as hashed:
+            status = self.repo.status()
+        self.assertTrue(status.clean)
+        hashed.assert_not_called()
+
+    def test_reports_each_state(self):
+        self.write("nested/b.txt", "changed")
+        self.write("new.txt", "brand new")
+        os.remove(os.path.join(self.repo_dir, "nested", "c.txt"))
+        self.write("staged.txt", "staged")
+        self.repo.add("staged.txt")
+
+        for workers in (None, 4):
+            status = self.repo.status(workers=workers)
+            self.assertEqual(status.staged, ["staged.txt"])
+            self.assertEqual(status.modified, ["nested/b.txt"])
+            self.assertEqual(status.deleted, ["nested/c.txt"])
+            self.assertEqual(status.untracked, ["new.txt"])
+
+    def test_touched_files_are_refreshed(self):
+        #same content, new stat data: hashed once, then trusted again
+        self.write("a.txt", "this is a.txt")
+        os.utime(os.path.join(self.repo_dir, "a.txt"), (time.time() - 5, time.time() - 5))
+        self.assertTrue(self.repo.status().clean)
+
+        with mock.patch("mini_git.status.hash_file") as hashed:
+            self.assertTrue(self.repo.status().clean)
+        hashed.assert_not_called()
+
+    def test_restaged_original_is_not_staged(self):
+        self.write("a.txt", "edited")
+        self.repo.add("a.txt")
+        self.assertEqual(self.repo.status().staged, ["a.txt"])
+        self.write("a.txt", "this is a.txt")
+        self.repo.add("a.txt")
+        self.assertEqual(self.repo.status().staged, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Tree
+from mini_git.transport import write_bundle, read_bundle
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.local_dir = "test_repo_transport_local"
+        self.remote_dir = "test_repo_transport_remote"
+        for path in (self.local_dir, self.remote_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        self.local = Repository(self.local_dir)
+        self.remote = Repository(self.remote_dir)
+
+        for i in range(5):
+            self.write(self.local_dir, f"dir_{i}/file.txt", f"file {i}")
+        self.local.add(".")
+        self.first = self.local.commit("test", "first")
+
+    def tearDown(self):
+        for repo in (self.local, self.remote):
+            repo._close_commit_graph()
+        shutil.rmtree(self.local_dir)
+        shutil.rmtree(self.remote_dir)
+
+    def write(self, root, name, text):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def read(self, root, name):
+        with open(os.path.join(root, name), "r") as f:
+            return f.read()
+
+    def test_push_then_pull_back(self):
+        report = self.local.push(self.remote_dir)
+        self.assertEqual((report["old"], report["new"], report["commits"]), (None, self.first, 1))
+        #a commit, the root tree, 5 subtrees and 5 blobs
+        self.assertEqual(report["objects"], 12)
+        self.assertEqual(self.remote.head_sha(), self.first)
+        #the remote had master checked out, so its working tree followed
+        self.assertEqual(self.read(self.remote_dir, "dir_3/file.txt"), "file 3")
+        self.assertTrue(self.remote.status().clean)
+
+        self.write(self.remote_dir, "dir_0/file.txt", "changed on the remote")
+        self.remote.add(".")
+        second = self.remote.commit("test", "second")
+
+        #one commit behind: only the commit, the two trees on the path and the blob
+        with mock.patch.object(Tree, "load", wraps=Tree.load) as load:
+            report = self.local.pull(self.remote_dir)
+        self.assertEqual((report["commits"], report["objects"]), (1, 4))
+        untouched = {sha for _, name, sha in self.local.read_commit(self.first).tree.children if name != "dir_0"}
+        self.assertFalse(untouched & {call.args[0] for call in load.call_args_list})
+        self.assertEqual(self.local.head_sha(), second)
+        self.assertEqual(self.read(self.local_dir, "dir_0/file.txt"), "changed on the remote")
+        self.assertTrue(self.local.status().clean)
+
+        #nothing left to send
+        self.assertEqual(self.local.push(self.remote_dir)["objects"], 0)
+
+    def test_only_fast_forwards(self):
+        self.local.push(self.remote_dir)
+        self.write(self.remote_dir, "remote.txt", "remote")
+        self.remote.add(".")
+        self.remote.commit("test", "remote side")
+        self.write(self.local_dir, "local.txt", "local")
+        self.local.add(".")
+        self.local.commit("test", "local side")
+
+        before = self.remote.head_sha()
+        with self.assertRaises(ValueError):
+            self.local.push(self.remote_dir)
+        self.assertEqual(self.remote.head_sha(), before)
+        with self.assertRaises(ValueError):
+            self.local.pull(self.remote_dir)
+        with self.assertRaises(ValueError):
+            self.local.push("test_repo_transport_missing")
+
+    def test_push_to_a_mistyped_path_creates_nothing(self):
+        missing = "test_repo_transport_typo"
+        with self.assertRaises(ValueError):
+            self.local.push(missing)
+        self.assertFalse(os.path.exists(missing))
+
+        #a bare .minigit folder isn't a repo either, and isn't filled in
+        os.makedirs(os.path.join(missing, ".minigit"))
+        try:
+            with self.assertRaises(ValueError):
+                self.local.pull(missing)
+            self.assertEqual(os.listdir(os.path.join(missing, ".minigit")), [])
+        finally:
+            shutil.rmtree(missing)
+
+    def test_corrupt_bundle_installs_nothing(self):
+        blob_sha = self.local.diff(None, self.first)[0].new_sha
+        out = io.BytesIO()
+        write_bundle(self.local.store, [self.first, blob_sha], out)
+        data = bytearray(out.getvalue())
+        data[-40] ^= 1
+
+        with self.assertRaises(ValueError):
+            read_bundle(io.BytesIO(bytes(data)), self.remote.store)
+        self.assertNotIn(self.first, self.remote.store)
+
+        self.assertEqual(read_bundle(io.BytesIO(out.getvalue()), self.remote.store), [self.first, blob_sha])
+        self.assertIn(blob_sha, self.remote.store)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import os
 import shutil
 import unittest
 
-from mini_git import Tree
+from mini_git import Tree, TreeChildren, make_header, create_obj_id
 from mini_git import decode_sha_to_path
 from mini_git import Repository
 
@@ -15,7 +15,7 @@ class TestTree(unittest.TestCase):
             shutil.rmtree(self.repo_dir)
         
         os.makedirs(self.repo_dir)
-        Repository(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
 
         with open(os.path.join(self.repo_dir, "file1.txt"), "w") as f:
             f.write("this is file 1")
@@ -36,14 +36,14 @@ class TestTree(unittest.TestCase):
     def test_tree_store_and_load(self):
         #Create tree and store + save obj id
         tree = Tree(self.repo_dir)
-        object_id = tree.store()
+        object_id = tree.store(store=self.repo.store)
 
         #Assert that it exists
         self.assertIsNotNone(object_id)
-        self.assertTrue(os.path.exists(decode_sha_to_path(object_id)))
+        self.assertTrue(os.path.exists(decode_sha_to_path(object_id, self.repo.store)))
         
         #returns tree obj
-        loaded_tree = Tree.load(object_id)
+        loaded_tree = Tree.load(object_id, self.repo.store)
 
         #assert that the obj_id is the same, and that it's a tree
         self.assertEqual(loaded_tree.object_id, object_id)
@@ -62,5 +62,59 @@ class TestTree(unittest.TestCase):
             self.assertIsInstance(entry[1], str)
             self.assertIsInstance(entry[2], str)
 
+    def test_parallel_store_matches_serial(self):
+        #a few more files and a deeper directory, so the pool has work to spread
+        deep_dir = os.path.join(self.repo_dir, "nested", "deeper")
+        os.makedirs(deep_dir)
+        for i in range(20):
+            with open(os.path.join(deep_dir, f"deep_{i}.txt"), "w") as f:
+                f.write(f"deep file {i}")
+
+        serial = Tree(self.repo_dir).store()
+        self.assertEqual(Tree(self.repo_dir).store(workers=4), serial)
+        self.assertEqual(Tree(self.repo_dir).store(workers=2, executor="process"), serial)
+
+        with self.assertRaises(ValueError):
+            Tree(self.repo_dir).store(workers=2, executor="fibers")
+
+    def test_binary_format_names_and_lookup(self):
+        #spaces and non-ascii names survive the round trip
+        for name in ("with space.txt", "ünïcode.txt"):
+            with open(os.path.join(self.repo_dir, name), "w") as f:
+                f.write(name)
+        object_id = Tree(self.repo_dir).store(store=self.repo.store)
+        loaded = Tree.load(object_id, self.repo.store)
+        names = [name for _, name, _ in loaded.children]
+        self.assertEqual(names, sorted(names))
+        self.assertIn("with space.txt", names)
+        self.assertIn("ünïcode.txt", names)
+
+        #raw shas: 38 bytes a child plus the name, against 70 plus the name as text
+        self.assertIsInstance(loaded.children, TreeChildren)
+        self.assertEqual(len(loaded.data), 6 + sum(38 + len(name.encode("utf-8")) for name in names))
+
+        entry = loaded.find("nested")
+        self.assertEqual(entry, ("tree", "nested", loaded.children[names.index("nested")][2]))
+        self.assertEqual(loaded.find("ünïcode.txt")[1], "ünïcode.txt")
+        self.assertIsNone(loaded.find("missing"))
+        #a loaded tree writes back to the same object
+        self.assertEqual(loaded.write(self.repo.store), object_id)
+
+    def test_text_trees_still_load(self):
+        blob_sha, sub_sha, late_sha = "ab" * 32, "cd" * 32, "ef" * 32
+        #old trees listed files first, then dirs, so names weren't in order
+        body = f"blob file1.txt {blob_sha}\nblob zebra.txt {late_sha}\ntree nested {sub_sha}".encode("ascii")
+        obj = make_header("tree", body) + body
+        object_id = create_obj_id(make_header("tree", body), body)
+        self.repo.store.write(object_id, obj)
+
+        loaded = Tree.load(object_id, self.repo.store)
+        self.assertEqual(list(loaded.children), [("blob", "file1.txt", blob_sha), ("tree", "nested", sub_sha),
+                                                 ("blob", "zebra.txt", late_sha)])
+        self.assertEqual(loaded.find("nested")[2], sub_sha)
+        self.assertEqual(loaded.find("zebra.txt")[2], late_sha)
+        #rewriting it gives the binary form
+        self.assertNotEqual(loaded.write(self.repo.store), object_id)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
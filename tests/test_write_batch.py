@@ -0,0 +1,120 @@
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from mini_git import Repository, Blob, Tree, decode_sha_to_path
+from mini_git import batch, utils, instrument
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = "test_repo_batch"
+        if os.path.exists(self.repo_dir):
+            shutil.rmtree(self.repo_dir)
+        self.repo = Repository(self.repo_dir)
+
+        for i in range(20):
+            with open(os.path.join(self.repo_dir, f"file_{i}.txt"), "w") as f:
+                f.write(f"this is file {i}")
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def temp_files(self):
+        objects = os.path.join(self.repo_dir, ".minigit", "objects")
+        return [name for name in os.listdir(objects) if name.startswith("tmp_")]
+
+    def test_objects_installed_when_batch_ends(self):
+        path = os.path.join(self.repo_dir, "file_0.txt")
+        with self.repo.store.batch() as store:
+            object_id = Blob(path).store(store)
+            #pending objects are readable, but not in place yet
+            self.assertIn(object_id, store.write_batch)
+            self.assertFalse(os.path.exists(decode_sha_to_path(object_id, store)))
+            self.assertEqual(Blob.load(object_id, store).data, b"this is file 0")
+            #only writers handed the batched store join the batch
+            self.assertIsNone(self.repo.store.write_batch)
+
+            #nested batches join the outer one
+            with store.batch() as inner:
+                self.assertIs(inner, store)
+
+        self.assertTrue(os.path.exists(decode_sha_to_path(object_id, self.repo.store)))
+        self.assertEqual(self.temp_files(), [])
+
+    def test_one_barrier_per_commit(self):
+        with mock.patch("mini_git.batch._barrier", wraps=batch._barrier) as barrier, \
+                mock.patch("mini_git.batch._sync_dirs", wraps=batch._sync_dirs) as sync_dirs, \
+                mock.patch("os.sync") as sync:
+            self.repo.add(".")
+            self.repo.commit("test", "twenty files")
+        #one for the add, one for the commit, never per object
+        self.assertEqual(barrier.call_count, 2)
+        self.assertEqual(sync_dirs.call_count, 2)
+        #only this batch's files and dirs are flushed, never the whole host
+        sync.assert_not_called()
+        objects = os.path.join(self.repo_dir, ".minigit", "objects")
+        self.assertIn(objects, sync_dirs.call_args.args[0])
+
+    def test_fsyncs_do_not_grow_with_objects(self):
+        def fsyncs_to_store(count):
+            for kind in ("added", "stored"):
+                folder = os.path.join(self.repo_dir, f"{kind}_{count}")
+                os.makedirs(folder)
+                for i in range(count):
+                    with open(os.path.join(folder, f"file_{i}.txt"), "w") as f:
+                        f.write(f"{kind}, {count} files, this is file {i}")
+            with instrument.recording():
+                self.repo.add(f"added_{count}")
+                #writers outside a batch open one of their own
+                Tree(os.path.join(self.repo_dir, f"stored_{count}")).store(store=self.repo.store)
+            instrument.disable()
+            return instrument.snapshot()["counters"]["syscalls.fsync"]
+
+        self.assertEqual(fsyncs_to_store(40), fsyncs_to_store(400))
+        #a big batch is installed as one pack, and still reads back
+        self.assertEqual(self.temp_files(), [])
+        self.assertGreater(len(self.repo.store.packs.get()), 0)
+        tree_sha = Tree(os.path.join(self.repo_dir, "stored_400")).store(store=self.repo.store)
+        _, _, blob_sha = Tree.load(tree_sha, self.repo.store).find("file_7.txt")
+        self.assertEqual(Blob.load(blob_sha, self.repo.store).data, b"stored, 400 files, this is file 7")
+
+    def test_pool_workers_join_the_batch(self):
+        for executor in ("thread", "process"):
+            folder = os.path.join(self.repo_dir, executor)
+            os.makedirs(folder)
+            for i in range(40):
+                with open(os.path.join(folder, f"file_{i}.txt"), "w") as f:
+                    f.write(f"{executor} file {i}")
+            tree_sha = Tree(folder).store(workers=2, executor=executor, store=self.repo.store)
+
+            #workers' blobs went into the one batch, installed together as a pack
+            self.assertEqual(list(self.repo.store.iter_loose()), [])
+            self.assertEqual(self.temp_files(), [])
+            _, _, blob_sha = Tree.load(tree_sha, self.repo.store).find("file_3.txt")
+            self.assertEqual(Blob.load(blob_sha, self.repo.store).data, f"{executor} file 3".encode())
+
+    def test_ref_written_with_rename(self):
+        self.repo.add(".")
+        with mock.patch("mini_git.utils.fsync_dir", wraps=utils.fsync_dir) as fsync_dir:
+            commit_sha = self.repo.commit("test", "twenty files")
+        heads = os.path.join(self.repo_dir, ".minigit", "refs", "heads")
+        fsync_dir.assert_called_once_with(heads)
+        self.assertEqual(os.listdir(heads), ["master"])
+        self.assertEqual(self.repo.branch_tips(), {"master": commit_sha})
+
+    def test_failed_batch_installs_nothing(self):
+        path = os.path.join(self.repo_dir, "file_1.txt")
+        with self.assertRaises(RuntimeError):
+            with self.repo.store.batch() as store:
+                object_id = Blob(path).store(store)
+                raise RuntimeError("worker crashed")
+
+        self.assertFalse(os.path.exists(decode_sha_to_path(object_id, self.repo.store)))
+        self.assertEqual(self.temp_files(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()